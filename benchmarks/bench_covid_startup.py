@@ -0,0 +1,50 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Startup benchmark of CovidData: a cold start that reads and cleans the CSV files against a
+warm start from the cached tables. Run it from the directory holding data/.
+
+    python benchmarks/bench_covid_startup.py
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from covid_data import CACHE_DIR, CovidData  # noqa: E402
+
+
+def time_startup(use_cache: bool) -> float:
+    """Returns the seconds taken to build a CovidData and fetch one date from it"""
+    start = time.perf_counter()
+    covid_data = CovidData(use_cache=use_cache)
+    covid_data.get_data(datetime.datetime(2020, 8, 1))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Times cold CSV startups, the startup that builds the cache and warm cached startups"""
+    parser = argparse.ArgumentParser(description="CovidData startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="timed startups per case")
+    args = parser.parse_args()
+
+    cold = min(time_startup(False) for _ in range(args.repeat))
+
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    build = time_startup(True)
+    warm = min(time_startup(True) for _ in range(args.repeat))
+
+    print(f" cold (CSV): {cold * 1000:9.1f} ms")
+    print(f"cache build: {build * 1000:9.1f} ms")
+    print(f" warm cache: {warm * 1000:9.1f} ms ({cold / warm:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Micro-benchmark of location resolution: the original word-by-word list search against the
+compiled gazetteer, with and without the location cache, over the user.location strings of
+real hydrated tweet files.
+
+    python benchmarks/bench_location.py data/2020-08-01/hydrated_tweets.json [...]
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from country_provinces import country_provinces  # noqa: E402
+from gazetteer import NO_REGION, LocationCache, default_gazetteer  # noqa: E402
+from tweet import iter_lines  # noqa: E402
+
+
+def linear_resolve(location: str) -> bool:
+    """Returns whether a location matches, using the original search over country_provinces"""
+    for word in location.split(' '):
+        if word.lower() in country_provinces['Canada'] or \
+                word.lower() in country_provinces['United States']:
+            return True
+    return False
+
+
+def load_locations(filenames: list[str]) -> list[str]:
+    """Returns every non-empty user.location in the given hydrated tweet files"""
+    locations = []
+    for filename in filenames:
+        for line in iter_lines(filename):
+            location = json.loads(line)['user']['location']
+            if location:
+                locations.append(location)
+    return locations
+
+
+def main() -> None:
+    """Times the matchers over the locations of the files named on the command line"""
+    parser = argparse.ArgumentParser(description="Location resolution micro-benchmark")
+    parser.add_argument("files", nargs='+', help="hydrated tweet files to read locations from")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes per matcher")
+    args = parser.parse_args()
+
+    locations = load_locations(args.files)
+    print(f"{len(locations)} locations, {len(set(locations))} distinct")
+
+    start = time.perf_counter()
+    gazetteer = default_gazetteer()
+    print(f"gazetteer: {gazetteer.size} aliases compiled in "
+          f"{(time.perf_counter() - start) * 1000:.2f} ms")
+
+    for name, resolve in (('linear', linear_resolve),
+                          ('gazetteer', lambda loc: gazetteer.resolve(loc) != NO_REGION),
+                          ('cached', lambda loc: cache.resolve(loc, gazetteer) != NO_REGION)):
+        best = float('inf')
+        matched = 0
+        for _ in range(args.repeat):
+            # Every pass of the cached matcher starts cold
+            cache = LocationCache()
+            start = time.perf_counter()
+            matched = sum(1 for location in locations if resolve(location))
+            best = min(best, time.perf_counter() - start)
+        rate = len(locations) / best if best > 0 else float('inf')
+        print(f"{name:>10}: {rate:12,.0f} locations/s, {matched} matched "
+              f"({matched / max(len(locations), 1):.1%})")
+    print(f"cache hit rate: {cache.hit_rate():.1%} with {len(cache)} entries")
+
+
+if __name__ == '__main__':
+    main()
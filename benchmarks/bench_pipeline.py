@@ -0,0 +1,249 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Benchmark of every stage of the pipeline, over a synthetic hydrated tweet file from
+synthetic_tweets.py and the covid data and map geometry in data/. Run it from the directory
+holding data/; stages whose input files are missing are skipped.
+
+    python benchmarks/bench_pipeline.py --lines 100000 --out results.json
+    python benchmarks/bench_pipeline.py --lines 100000 --compare results.json
+
+Results are written as JSON, with the best time of every stage. With --compare, stages that
+got slower than a previous result by more than the tolerance are reported, and the exit
+status is 1.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import map_page  # noqa: E402
+from covid_data import CovidData  # noqa: E402
+from geometry import prepared_topology, topology_features  # noqa: E402
+from ingest import ingest_day  # noqa: E402
+from score_store import STORE_FILENAME  # noqa: E402
+from shard import TweetShard  # noqa: E402
+from text_cache import default_text_cache, set_text_cache_path  # noqa: E402
+from synthetic_tweets import generate_tweets  # noqa: E402
+from tweet import (SCORING_BATCH_SIZE, Tweet, create_dataframe, load_region_totals,  # noqa: E402
+                   load_tweets, score_texts, score_tweet_texts)
+from tweet_json import fields_of, may_have_location, parse_fields, search_fields  # noqa: E402
+
+
+def time_stage(run: Callable[[], object], repeat: int,
+               setup: Optional[Callable[[], None]] = None) -> tuple[float, object]:
+    """Returns the best of repeat timed calls of run, and what the last call returned
+
+    setup is called before every call, outside of the timing.
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_tweets(path: str, repeat: int, results: dict) -> tuple:
+    """Times the tweet stages over a hydrated tweet file, and returns its Canadian and American
+    sentiment data"""
+    size = os.path.getsize(path)
+
+    # Parsing alone, over lines already in memory: decoding every line whole with the json
+    # module, as the loader used to, against parse_fields with the installed backend and with
+    # the json module only
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    seconds, parsed = time_stage(lambda: [fields_of(json.loads(line)) for line in lines], repeat)
+    results['parse_json'] = stage_result(seconds, len(lines), size)
+    for stage, parse in [('parse_fields', parse_fields),
+                         ('parse_fields_stdlib', lambda line: search_fields(line)
+                          if may_have_location(line) else None)]:
+        seconds, fields = time_stage(lambda: [parse(line) for line in lines], repeat)
+        if fields != parsed:
+            raise AssertionError(stage + " read different fields than decoding whole lines")
+        results[stage] = stage_result(seconds, len(lines), size)
+
+    # Every pass scores with an empty text score cache, as a first load of the day would
+    seconds, tweets = time_stage(lambda: load_tweets(path), repeat, default_text_cache.cache_clear)
+    results['load_tweets'] = stage_result(seconds, len(tweets), size)
+
+    # Tweet.process_location changes the tweet, so every pass gets new ones. Only their
+    # locations matter, which spares tokenizing the texts again.
+    locations = [tweet.get_location() for tweet in tweets]
+    fresh = []
+    seconds, _ = time_stage(lambda: [tweet.process_location() for tweet in fresh[-1]], repeat,
+                            lambda: fresh.append([Tweet('', location) for location in locations]))
+    results['process_location'] = stage_result(seconds, len(tweets))
+    located = [tweet for tweet in tweets if tweet.process_location()]
+
+    texts = [tweet.get_tokenized_text() for tweet in located]
+    seconds, _ = time_stage(lambda: [score_texts(texts[i:i + SCORING_BATCH_SIZE])
+                                     for i in range(0, len(texts), SCORING_BATCH_SIZE)], repeat)
+    results['scoring'] = stage_result(seconds, len(texts))
+
+    raw_texts = [tweet.get_text() for tweet in located]
+    seconds, _ = time_stage(lambda: [score_tweet_texts(raw_texts[i:i + SCORING_BATCH_SIZE])
+                                     for i in range(0, len(raw_texts), SCORING_BATCH_SIZE)],
+                            repeat, default_text_cache.cache_clear)
+    results['scoring_deduplicated'] = stage_result(seconds, len(raw_texts))
+
+    seconds, (ca_data, us_data) = time_stage(lambda: create_dataframe(located), repeat)
+    results['create_dataframe'] = stage_result(seconds, len(located))
+
+    seconds, _ = time_stage(lambda: load_region_totals(path), repeat,
+                            default_text_cache.cache_clear)
+    results['load_region_totals'] = stage_result(seconds, len(tweets), size)
+
+    # Every pass ingests from scratch, without the shard or any scores of the last one
+    seconds, report = time_stage(lambda: ingest_day(path), repeat,
+                                 lambda: remove_outputs(path))
+    results['ingest_day'] = stage_result(seconds, len(tweets), size)
+
+    seconds, _ = time_stage(lambda: TweetShard.load(path).region_totals(), repeat)
+    results['shard_region_totals'] = stage_result(seconds, report.tweets)
+
+    return ca_data, us_data
+
+
+def remove_outputs(path: str) -> None:
+    """Removes the tweet shard and score store of a hydrated tweet file, if it has them, and
+    empties the text score cache"""
+    default_text_cache.cache_clear()
+    shutil.rmtree(TweetShard.path_of(path), ignore_errors=True)
+    store_path = os.path.join(os.path.dirname(path), STORE_FILENAME)
+    if os.path.exists(store_path):
+        os.remove(store_path)
+
+
+def bench_covid(repeat: int, results: dict) -> None:
+    """Times building a CovidData from its cache and fetching every date from it"""
+    seconds, covid_data = time_stage(CovidData, repeat)
+    results['covid_init'] = stage_result(seconds, 1)
+
+    dates = [datetime.datetime(date.year, date.month, date.day)
+             for date in covid_data.get_dates()]
+    seconds, _ = time_stage(lambda: [covid_data.get_data(date) for date in dates], repeat)
+    results['covid_get_data'] = stage_result(seconds, len(dates))
+
+
+def bench_render(ca_data: object, us_data: object, repeat: int, results: dict) -> None:
+    """Times preparing the map boundaries and generating the html of a sentiment map page:
+    with the full boundaries read by folium, with the simplified boundaries inline as in
+    exports, and without the boundaries, which the application serves to the page separately
+    """
+    sources = {'ca': map_page.CANADA_GEOJSON, 'us': map_page.US_GEOJSON}
+    seconds, topology = time_stage(lambda: prepared_topology(sources, cache_path=None), repeat)
+    results['prepare_geometry'] = stage_result(seconds, 1)
+    results['prepare_geometry']['topology_bytes'] = len(topology)
+    features = topology_features(json.loads(topology))
+    geometry = (features['ca'], features['us'])
+
+    bins = [-1, -0.5, 0, 0.5, 1]
+    for stage, arguments in [('render_map', (None, None)),
+                             ('render_map_simplified', (geometry, None)),
+                             ('render_map_served', (geometry, 'coveet://map/boundaries'))]:
+        seconds, html = time_stage(lambda: map_page.map_html(map_page.build_map(
+            'sentiment', ca_data, us_data, bins, 'sentiment score', *arguments)), repeat)
+        results[stage] = stage_result(seconds, 1)
+        results[stage]['html_bytes'] = len(html.encode())
+
+
+def stage_result(seconds: float, items: int, size: Optional[int] = None) -> dict:
+    """Returns the result of a stage that handled items items, or size bytes, in seconds"""
+    result = {'seconds': seconds, 'items': items,
+              'items_per_second': items / seconds if seconds > 0 else None}
+    if size is not None:
+        result['mb_per_second'] = size / 1e6 / seconds if seconds > 0 else None
+    return result
+
+
+def git_commit() -> Optional[str]:
+    """Returns the commit the repository is at, if it can be told"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns the stages of results slower than in baseline by more than tolerance"""
+    slower = []
+    for stage, result in results['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is not None and result['seconds'] > before['seconds'] * (1 + tolerance):
+            slower.append(stage)
+    return slower
+
+
+def main() -> None:
+    """Runs the benchmark described on the command line"""
+    parser = argparse.ArgumentParser(description="Pipeline stage benchmark")
+    parser.add_argument("--lines", type=int, default=10000, help="synthetic tweets to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic tweets")
+    parser.add_argument("--distribution", choices=['uniform', 'zipf'], default='zipf',
+                        help="how located users are spread over the regions")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes per stage")
+    parser.add_argument("--out", default=None, help="file to write the results to")
+    parser.add_argument("--compare", default=None, help="results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown allowed by --compare, as a fraction")
+    args = parser.parse_args()
+
+    config = {'lines': args.lines, 'seed': args.seed, 'distribution': args.distribution,
+              'repeat': args.repeat}
+    stages = {}
+    # Scores cached by an earlier run would make the scoring stages meaningless
+    set_text_cache_path(None)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'hydrated_tweets.json')
+        start = time.perf_counter()
+        generate_tweets(path, args.lines, args.seed, distribution=args.distribution)
+        print(f"generated {args.lines} tweets in {time.perf_counter() - start:.1f} s")
+        ca_data, us_data = bench_tweets(path, args.repeat, stages)
+
+    if os.path.exists('data/Provincial_Daily_Totals.csv') and \
+            os.path.exists('data/State_Daily_Totals.csv'):
+        bench_covid(args.repeat, stages)
+    if os.path.exists(map_page.CANADA_GEOJSON) and os.path.exists(map_page.US_GEOJSON):
+        bench_render(ca_data, us_data, args.repeat, stages)
+
+    results = {'commit': git_commit(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'config': config, 'stages': stages}
+    for stage, result in stages.items():
+        print(f"{stage:>21}: {result['seconds'] * 1000:10.1f} ms  {result['items']:>9} items"
+              + (f"  {result['mb_per_second']:9.1f} MB/s" if result.get('mb_per_second') else '')
+              + ''.join(f"  {result[key]:>9} {key}" for key in ('html_bytes', 'topology_bytes')
+                        if key in result))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for stage in slower:
+            print(f"regression: {stage} is more than {args.tolerance:.0%} slower")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Startup benchmark of every way main.py runs: the time from starting Python to the first window
+of each map mode, and to a finished --help or import of the headless export path. Each case
+runs in a fresh interpreter under python -X importtime, and the modules it imported are
+summed up, so a heavy dependency loaded by a mode that does not need it shows up here. Run it
+from the directory holding data/.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --modes covid sentiment --repeat 5
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every case the benchmark can run, in the order they are reported
+CASES = ['help', 'export', 'covid', 'sentiment', 'correlation', 'comparison']
+
+# Heavy packages whose import is reported for every case
+WATCHED_PACKAGES = ['nltk', 'folium', 'PyQt5', 'pandas']
+
+# Printed by a child process once it reaches the point its case is timed to
+_READY = 'ready'
+
+
+def run_child(case: str) -> None:
+    """Runs one case in this process, printing _READY once its first window is shown or the
+    headless path is imported
+
+    This runs in the child process started by time_case.
+    """
+    sys.path.insert(0, ROOT)
+    if case == 'export':
+        import export  # noqa: F401  pylint: disable=unused-import,import-outside-toplevel
+    else:
+        # pylint: disable=import-outside-toplevel
+        from PyQt5 import QtWidgets
+        from data_service import DataService
+        from gui import SENTIMENT_WORKERS, ChoroplethMap, register_url_scheme
+
+        register_url_scheme()
+        app = QtWidgets.QApplication(sys.argv[:1])
+        modes = [case] if case != 'comparison' else ['sentiment', 'covid']
+        service = DataService(sentiment_workers=SENTIMENT_WORKERS)
+        service.preload(modes)
+        window = ChoroplethMap(modes, service)
+        window.show()
+        app.processEvents()
+    print(_READY, flush=True)
+    sys.stderr.flush()
+    # Skip waiting for the data that is still loading in the background
+    os._exit(0)
+
+
+def time_case(case: str) -> tuple[float, dict[str, int]]:
+    """Returns the seconds a case takes to start in a fresh interpreter, and the microseconds
+    spent importing each top-level package"""
+    if case == 'help':
+        command = [sys.executable, '-X', 'importtime', os.path.join(ROOT, 'main.py'), '--help']
+    else:
+        command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__),
+                   '--child', case]
+
+    # The import times go to a file, since a full pipe would stall the child before it is ready
+    with tempfile.TemporaryFile('w+') as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        elapsed = None
+        for line in process.stdout:
+            if line.strip() == _READY:
+                elapsed = time.perf_counter() - start
+        process.wait()
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+        stderr.seek(0)
+        errors = stderr.read()
+    if process.returncode != 0:
+        raise RuntimeError(f"{case} exited with status {process.returncode}:\n{errors}")
+    return elapsed, parse_importtime(errors)
+
+
+def parse_importtime(output: str) -> dict[str, int]:
+    """Returns the microseconds spent importing each top-level package, from the output of
+    python -X importtime
+
+    >>> parse_importtime('import time: self [us] | cumulative | imported package\\n'
+    ...                  'import time:       120 |        120 |   nltk.data\\n'
+    ...                  'import time:        30 |        150 | nltk\\n')
+    {'nltk': 150}
+    """
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+    return packages
+
+
+def main() -> None:
+    """Times the startup of the cases asked for, and reports what each of them imported"""
+    parser = argparse.ArgumentParser(description="Startup and import time benchmark")
+    parser.add_argument("--modes", nargs='+', choices=CASES, default=CASES,
+                        help="the cases to time")
+    parser.add_argument("--repeat", type=int, default=3, help="timed startups per case")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child)
+        return
+
+    print(f"{'case':>11} {'startup':>10} {'imports':>10}  "
+          + ' '.join(f'{package:>8}' for package in WATCHED_PACKAGES))
+    for case in args.modes:
+        runs = [time_case(case) for _ in range(args.repeat)]
+        elapsed, packages = min(runs, key=lambda run: run[0])
+        imports = sum(packages.values()) / 1000
+        print(f"{case:>11} {elapsed * 1000:7.0f} ms {imports:7.0f} ms  "
+              + ' '.join(f"{packages[package] / 1000:5.0f} ms" if package in packages
+                         else f"{'-':>8}" for package in WATCHED_PACKAGES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+A seeded generator of synthetic hydrated tweet files for benchmarks. Lines have the shape of
+the hydrated tweets in data/<date>/hydrated_tweets.json, including the nested user objects and
+retweets that the pipeline decodes and throws away, so that parsing costs are realistic.
+
+    python benchmarks/synthetic_tweets.py out.json --lines 1000000 --seed 1
+
+The same arguments always produce the same file.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from country_provinces import regions  # noqa: E402
+from gazetteer import ABBREVIATIONS, CITY_ALIASES  # noqa: E402
+
+# Locations that name no state or province
+UNMATCHED_LOCATIONS = ['Earth', 'somewhere', 'London, England', 'Mumbai, India', 'Sydney',
+                       'the internet', 'Paris, France', 'worldwide', 'your mom\'s house',
+                       'Lagos, Nigeria', 'Dublin', 'Manila', 'wherever the wifi is', '🌎']
+
+_OPENINGS = ['Just heard that', 'Honestly', 'Today', 'Breaking:', 'Reminder:', 'So',
+             'Can\'t believe', 'Update:', 'Apparently', 'Thread:']
+_SUBJECTS = ['the covid numbers', 'the new vaccine rollout', 'my local hospital',
+             'the lockdown', 'everyone wearing masks', 'the case count', 'the testing site',
+             'the reopening plan', 'my family', 'the government response']
+_JUDGEMENTS = ['are really good news', 'is terrible', 'makes me so happy', 'is awful',
+               'looks hopeful', 'is a disaster', 'is fine I guess', 'is great', 'is scary',
+               'could be better', 'is amazing', 'is the worst', 'is getting better', 'sucks']
+_ENDINGS = ['', ' Stay safe!', ' Wear a mask.', ' #COVID19', ' Ugh.', ' Thank you nurses!',
+            ' 😷', ' Wash your hands.', ' Not great.', ' Love this.']
+
+
+def region_locations() -> list[list[str]]:
+    """Returns the location strings users in every region might write, indexed by region code
+
+    The strings use the names, abbreviations and cities the gazetteer knows, written the ways
+    people write them.
+    """
+    locations = []
+    for country, name in regions:
+        title = name.title()
+        abbreviations = [a for a in ABBREVIATIONS.get(name, []) if a.isupper()]
+        options = [title, name, title + (', Canada' if country == 'Canada' else ', USA')]
+        for city in CITY_ALIASES.get(name, []):
+            options.append(city.title())
+            for abbreviation in abbreviations[:1]:
+                options.append(city.title() + ', ' + abbreviation)
+        options.extend(abbreviations[:1])
+        locations.append(options)
+    return locations
+
+
+def region_weights(distribution: str, exponent: float, rng: random.Random) -> list[float]:
+    """Returns how likely a located tweet is to come from each region, indexed by region code
+
+    'uniform' weighs every region the same. 'zipf' gives the regions, in a seeded random
+    order, weights proportional to 1 / rank ** exponent, like the few populous regions that
+    dominate real data.
+
+    Preconditions:
+      - distribution in {'uniform', 'zipf'}
+    """
+    if distribution == 'uniform':
+        return [1.0] * len(regions)
+    ranks = list(range(1, len(regions) + 1))
+    rng.shuffle(ranks)
+    return [1 / rank ** exponent for rank in ranks]
+
+
+def make_text(rng: random.Random) -> str:
+    """Returns the text of a random tweet of one or two sentences"""
+    text = ' '.join((rng.choice(_OPENINGS), rng.choice(_SUBJECTS), rng.choice(_JUDGEMENTS)))
+    return text + '.' + rng.choice(_ENDINGS)
+
+
+def make_tweet(rng: random.Random, tweet_id: int, created_at: datetime.datetime,
+               location: str, retweet_share: float) -> dict:
+    """Returns a random hydrated tweet with the given id, time and user location
+
+    A retweet_share of the tweets are retweets, which carry the original tweet along.
+    """
+    user_id = rng.randrange(10 ** 9)
+    tweet = {
+        'created_at': created_at.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+        'id': tweet_id,
+        'id_str': str(tweet_id),
+        'text': make_text(rng),
+        'truncated': False,
+        'entities': {'hashtags': [{'text': 'COVID19', 'indices': [0, 8]}], 'symbols': [],
+                     'user_mentions': [], 'urls': []},
+        'source': '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>',
+        'in_reply_to_status_id': None,
+        'user': {
+            'id': user_id,
+            'id_str': str(user_id),
+            'name': 'User ' + str(user_id),
+            'screen_name': 'user' + str(user_id),
+            'location': location,
+            'description': 'Just a person on the internet.',
+            'followers_count': rng.randrange(5000),
+            'friends_count': rng.randrange(2000),
+            'created_at': 'Mon Jan 01 00:00:00 +0000 2018',
+            'verified': False,
+            'lang': None
+        },
+        'geo': None,
+        'coordinates': None,
+        'place': None,
+        'retweet_count': rng.randrange(100),
+        'favorite_count': rng.randrange(100),
+        'lang': 'en'
+    }
+    if rng.random() < retweet_share:
+        original = make_tweet(rng, rng.randrange(10 ** 18), created_at,
+                              rng.choice(UNMATCHED_LOCATIONS), 0.0)
+        tweet['retweeted_status'] = original
+        tweet['text'] = 'RT @' + original['user']['screen_name'] + ': ' + original['text']
+    return tweet
+
+
+def generate_tweets(path: str, lines: int, seed: int = 0,
+                    date: Optional[datetime.datetime] = None, located_share: float = 0.5,
+                    empty_share: float = 0.3, retweet_share: float = 0.4,
+                    distribution: str = 'zipf', exponent: float = 1.0) -> None:
+    """Writes a hydrated tweets file of the given number of lines, all tweeted on date
+
+    A located_share of the users give a location in some state or province, and an
+    empty_share give none at all; the rest give a location that matches no region. Located
+    users are spread over the regions by the given distribution (see region_weights).
+
+    Preconditions:
+      - lines >= 0
+      - 0 <= located_share and 0 <= empty_share and located_share + empty_share <= 1
+      - distribution in {'uniform', 'zipf'}
+    """
+    rng = random.Random(seed)
+    date = date or datetime.datetime(2020, 8, 1)
+    locations = region_locations()
+    cum_weights = list(itertools.accumulate(region_weights(distribution, exponent, rng)))
+    codes = list(range(len(regions)))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            roll = rng.random()
+            if roll < located_share:
+                location = rng.choice(locations[rng.choices(codes, cum_weights=cum_weights)[0]])
+            elif roll < located_share + empty_share:
+                location = ''
+            else:
+                location = rng.choice(UNMATCHED_LOCATIONS)
+            created_at = date + datetime.timedelta(seconds=rng.randrange(86400))
+            tweet = make_tweet(rng, 1289000000000000000 + i, created_at, location,
+                               retweet_share)
+            f.write(json.dumps(tweet) + '\n')
+
+
+def main() -> None:
+    """Writes the synthetic file described on the command line"""
+    parser = argparse.ArgumentParser(description="Synthetic hydrated tweet generator")
+    parser.add_argument("path", help="the file to write")
+    parser.add_argument("--lines", type=int, default=10000, help="number of tweets")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--located-share", type=float, default=0.5,
+                        help="share of users located in a state or province")
+    parser.add_argument("--empty-share", type=float, default=0.3,
+                        help="share of users with no location")
+    parser.add_argument("--retweet-share", type=float, default=0.4, help="share of retweets")
+    parser.add_argument("--distribution", choices=['uniform', 'zipf'], default='zipf',
+                        help="how located users are spread over the regions")
+    parser.add_argument("--exponent", type=float, default=1.0,
+                        help="skew of the zipf distribution")
+    args = parser.parse_args()
+
+    generate_tweets(args.path, args.lines, args.seed, None, args.located_share,
+                    args.empty_share, args.retweet_share, args.distribution, args.exponent)
+
+
+if __name__ == '__main__':
+    main()
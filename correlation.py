@@ -0,0 +1,343 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Correlation between daily covid cases and tweet sentiment. Both are laid out on one grid
+with a row per day and a column per region code, so every correlation is computed for all
+regions at once with array operations. Days without covid data or without tweets are left
+out pairwise.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from country_provinces import all_provinces, regions
+from covid_data import CovidData
+from region_totals import CANADA_REGIONS
+from sentiment_range import load_daily_totals, rolling_sums
+from tweet import tweet_dates
+
+# Number of days ending on a date that the correlation map of the date covers
+CORRELATION_WINDOW = 28
+
+# Largest shift of the cases, in days either way, lagged_correlations tries by default
+DEFAULT_MAX_LAG = 14
+
+# Fewest days with both cases and sentiment that a correlation is computed from
+MIN_PAIRS = 3
+
+# Variances this small relative to the mean square are taken to be zero, since the
+# correlation of a constant is undefined
+_RELATIVE_VARIANCE_TOLERANCE = 1e-12
+
+
+class CaseSentimentGrid:
+    """The daily covid cases and mean tweet sentiment of every region on every day of a range
+
+    Instance Attributes:
+        - dates: The day of each row, one for every day of the range
+        - cases: The daily cases of each region, indexed by row and region code, or NaN where
+          there is no covid data
+        - sentiment: The mean sentiment score of each region, indexed like cases, or NaN
+          where there are no tweets
+        - counts: The number of tweets each mean is of, indexed like cases
+
+    Representation Invariants:
+      - self.cases.shape == self.sentiment.shape == self.counts.shape
+      - self.cases.shape == (len(self.dates), len(regions))
+    """
+    dates: list[datetime.datetime]
+    cases: np.ndarray
+    sentiment: np.ndarray
+    counts: np.ndarray
+
+    def __init__(self, dates: list[datetime.datetime], cases: np.ndarray,
+                 sentiment: np.ndarray, counts: np.ndarray) -> None:
+        self.dates = dates
+        self.cases = cases
+        self.sentiment = sentiment
+        self.counts = counts
+
+
+def build_grid(covid_data: CovidData, start: datetime.datetime, end: datetime.datetime,
+               workers: Optional[int] = None) -> CaseSentimentGrid:
+    """Returns the grid of the daily cases and sentiment of every day from start to end
+    inclusive
+
+    The cases are sliced from the covid data's date x region matrices, and the sentiment
+    comes from the stored day states, with days whose states are out of date loaded in the
+    given number of worker processes.
+
+    Preconditions:
+      - start <= end
+      - workers is None or workers >= 1
+    """
+    days = (end - start).days + 1
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    sentiment, counts = sentiment_matrix(start, end, workers)
+    return CaseSentimentGrid(dates, case_matrix(covid_data, start, end), sentiment, counts)
+
+
+def case_matrix(covid_data: CovidData, start: datetime.datetime,
+                end: datetime.datetime) -> np.ndarray:
+    """Returns the daily cases of every region on every day from start to end inclusive, with a
+    row per day and a column per region code, or NaN where there is no covid data
+
+    The cases are sliced from the covid data's date x region matrices.
+
+    Preconditions:
+      - start <= end
+    """
+    cases = np.full(((end - start).days + 1, len(regions)), np.nan)
+    codes = {name: code for code, name in enumerate(all_provinces)}
+    index = pd.date_range(start.date(), end.date())
+    for matrix in (covid_data.ca_matrix, covid_data.us_matrix):
+        known = [name for name in matrix.columns if name in codes]
+        cases[:, [codes[name] for name in known]] = \
+            matrix[known].reindex(index).to_numpy(dtype=np.float64)
+    return cases
+
+
+def sentiment_matrix(start: datetime.datetime, end: datetime.datetime,
+                     workers: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the mean sentiment score and the number of tweets of every region on every day
+    from start to end inclusive, with a row per day and a column per region code
+
+    A mean is NaN where there are no tweets. The totals come from the stored day states, with
+    days whose states are out of date loaded in the given number of worker processes.
+
+    Preconditions:
+      - start <= end
+      - workers is None or workers >= 1
+    """
+    days = (end - start).days + 1
+    sentiment = np.full((days, len(regions)), np.nan)
+    counts = np.zeros((days, len(regions)), dtype=np.int64)
+    tweet_days = tweet_dates(start, end)
+    rows = [(date - start).days for date in tweet_days]
+    day_counts, day_sums = load_daily_totals(tweet_days, workers)
+    counts[rows] = day_counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sentiment[rows] = np.where(day_counts > 0, day_sums / day_counts, np.nan)
+    return sentiment, counts
+
+
+def pearson(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the correlation of every column of x with the same column of y, over the rows
+    where both are known, along with the number of those rows
+
+    A correlation is NaN where there are fewer than MIN_PAIRS rows, or where either column is
+    constant over them.
+
+    >>> x = np.array([[1.0, 1.0], [2.0, np.nan], [3.0, 2.0], [4.0, 3.0]])
+    >>> y = np.array([[2.0, 1.0], [4.0, 5.0], [6.0, 1.0], [9.0, 1.0]])
+    >>> r, n = pearson(x, y)
+    >>> [round(float(value), 4) for value in r], n.tolist()
+    ([0.9944, nan], [4, 3])
+
+    Preconditions:
+      - x.shape == y.shape
+    """
+    valid = ~(np.isnan(x) | np.isnan(y))
+    n = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(valid, x - np.where(valid, x, 0.0).sum(axis=0) / n, 0.0)
+        dy = np.where(valid, y - np.where(valid, y, 0.0).sum(axis=0) / n, 0.0)
+        return _correlation(n, (dx * dx).sum(axis=0), (dy * dy).sum(axis=0),
+                            (dx * dy).sum(axis=0), (x * x).sum(axis=0, where=valid),
+                            (y * y).sum(axis=0, where=valid)), n
+
+
+def _correlation(n: np.ndarray, var_x: np.ndarray, var_y: np.ndarray, cov: np.ndarray,
+                 square_x: np.ndarray, square_y: np.ndarray) -> np.ndarray:
+    """Returns the correlations with the given pair counts, sums of squared deviations and sums
+    of products of deviations, or NaN where they are undefined
+
+    The sums of squares of the values tell rounding left in a variance from a real one.
+    """
+    defined = (n >= MIN_PAIRS) & (var_x > _RELATIVE_VARIANCE_TOLERANCE * square_x) \
+        & (var_y > _RELATIVE_VARIANCE_TOLERANCE * square_y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = cov / np.sqrt(var_x * var_y)
+    return np.where(defined, np.clip(r, -1.0, 1.0), np.nan)
+
+
+def region_correlations(grid: CaseSentimentGrid) -> pd.DataFrame:
+    """Returns the correlation of the daily cases and sentiment of every region over the whole
+    grid, with columns: location, correlation and days (the number of days it is over)
+
+    Only regions with a defined correlation are included, in order of region code.
+
+    >>> dates = [datetime.datetime(2020, 8, day) for day in range(1, 7)]
+    >>> cases, sentiment = np.full((2, 6, len(regions)), np.nan)
+    >>> cases[:, 0], sentiment[1:, 0] = [1, 3, 2, 5, 4, 6], [0.1, 0.3, 0.2, 0.5, 0.4]
+    >>> cases[:, 1], sentiment[:, 1] = [1, 2, 3, 4, 5, 6], [0.1, 0.2, 0.3, 0.2, 0.1, 0.0]
+    >>> grid = CaseSentimentGrid(dates, cases, sentiment, np.ones(cases.shape, dtype=int))
+    >>> region_correlations(grid).round(4).values.tolist()
+    [['Alberta', 0.3, 5], ['British Columbia', -0.4587, 6]]
+    """
+    r, n = pearson(grid.cases, grid.sentiment)
+    present = np.flatnonzero(~np.isnan(r))
+    return pd.DataFrame({'location': np.array(all_provinces, dtype=object)[present],
+                         'correlation': r[present], 'days': n[present]})
+
+
+def pooled_correlation(grid: CaseSentimentGrid) -> tuple[float, int]:
+    """Returns the correlation of the daily cases and sentiment over every day and region of
+    the grid together, and the number of (day, region) pairs it is over
+
+    Each region's own means are taken out first, so that regions with more cases or happier
+    users do not make up a correlation between regions; what is left is how sentiment moves
+    with cases within a region.
+
+    Here the second region has far more cases and lower sentiment than the first, but within
+    each region sentiment rises with cases:
+
+    >>> dates = [datetime.datetime(2020, 8, day) for day in range(1, 4)]
+    >>> cases, sentiment = np.full((2, 3, len(regions)), np.nan)
+    >>> cases[:, 0], sentiment[:, 0] = [1, 2, 3], [0.1, 0.2, 0.3]
+    >>> cases[:, 1], sentiment[:, 1] = [101, 102, 103], [-0.5, -0.4, -0.3]
+    >>> grid = CaseSentimentGrid(dates, cases, sentiment, np.ones(cases.shape, dtype=int))
+    >>> r, pairs = pooled_correlation(grid)
+    >>> round(r, 4), pairs
+    (1.0, 6)
+    """
+    valid = ~(np.isnan(grid.cases) | np.isnan(grid.sentiment))
+    n = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = grid.cases - np.where(valid, grid.cases, 0.0).sum(axis=0) / n
+        y = grid.sentiment - np.where(valid, grid.sentiment, 0.0).sum(axis=0) / n
+    x, y = np.where(valid, x, np.nan).reshape(-1, 1), np.where(valid, y, np.nan).reshape(-1, 1)
+    r, pairs = pearson(x, y)
+    return float(r[0]), int(pairs[0])
+
+
+def lagged_correlations(grid: CaseSentimentGrid, max_lag: int = DEFAULT_MAX_LAG) \
+        -> pd.DataFrame:
+    """Returns the correlation of every region's sentiment with its daily cases shifted by
+    each lag from -max_lag to max_lag days, indexed by lag with a column per region
+
+    At a lag of k days, the sentiment of each day is paired with the cases of k days before,
+    so positive lags ask whether sentiment follows cases. Only regions with a defined
+    correlation at some lag are included.
+
+    The first region's sentiment is its cases of the day before, so it is exactly correlated
+    at a lag of 1:
+
+    >>> dates = [datetime.datetime(2020, 8, day) for day in range(1, 7)]
+    >>> cases, sentiment = np.full((2, 6, len(regions)), np.nan)
+    >>> cases[:, 0], sentiment[1:, 0] = [1, 3, 2, 5, 4, 6], [0.1, 0.3, 0.2, 0.5, 0.4]
+    >>> cases[:, 1], sentiment[:, 1] = [1, 2, 3, 4, 5, 6], [0.1, 0.2, 0.3, 0.2, 0.1, 0.0]
+    >>> grid = CaseSentimentGrid(dates, cases, sentiment, np.ones(cases.shape, dtype=int))
+    >>> lagged = lagged_correlations(grid, 2).round(4)
+    >>> lagged.index.tolist()
+    [-2, -1, 0, 1, 2]
+    >>> lagged.to_dict('list')
+    {'Alberta': [-0.5, 0.9429, 0.3, 1.0, 0.0756], \
+'British Columbia': [0.6325, 0.0, -0.4587, -0.8321, -1.0]}
+
+    Preconditions:
+      - 0 <= max_lag < len(grid.dates)
+    """
+    lags = range(-max_lag, max_lag + 1)
+    days = len(grid.dates)
+    correlations = np.array([pearson(grid.cases[max(-lag, 0):days - max(lag, 0)],
+                                     grid.sentiment[max(lag, 0):days - max(-lag, 0)])[0]
+                             for lag in lags])
+    return _region_frame(correlations, pd.Index(lags, name='lag'))
+
+
+def rolling_correlations(grid: CaseSentimentGrid, window: int = CORRELATION_WINDOW) \
+        -> pd.DataFrame:
+    """Returns the correlation of every region's daily cases and sentiment over the window
+    days ending on each day of the grid, indexed by date with a column per region
+
+    The windows are computed at once from cumulative sums. Only regions with a defined
+    correlation on some day are included.
+
+    A window only has a correlation from the MIN_PAIRS-th day with both values in it, and the
+    second region's sentiment rises with its cases over the first three days and falls over
+    the three ending on the fifth:
+
+    >>> dates = [datetime.datetime(2020, 8, day) for day in range(1, 7)]
+    >>> cases, sentiment = np.full((2, 6, len(regions)), np.nan)
+    >>> cases[:, 0], sentiment[1:, 0] = [1, 3, 2, 5, 4, 6], [0.1, 0.3, 0.2, 0.5, 0.4]
+    >>> cases[:, 1], sentiment[:, 1] = [1, 2, 3, 4, 5, 6], [0.1, 0.2, 0.3, 0.2, 0.1, 0.0]
+    >>> grid = CaseSentimentGrid(dates, cases, sentiment, np.ones(cases.shape, dtype=int))
+    >>> rolling = rolling_correlations(grid, 3).round(4)
+    >>> [date.day for date in rolling.index]
+    [1, 2, 3, 4, 5, 6]
+    >>> rolling.to_dict('list')
+    {'Alberta': [nan, nan, nan, -0.3273, -0.1429, -0.3273], \
+'British Columbia': [nan, nan, 1.0, 0.0, -1.0, -1.0]}
+
+    Preconditions:
+      - window >= 1
+    """
+    valid = ~(np.isnan(grid.cases) | np.isnan(grid.sentiment))
+    x = np.where(valid, grid.cases, 0.0)
+    y = np.where(valid, grid.sentiment, 0.0)
+    ordinals = np.array([date.toordinal() for date in grid.dates], dtype=np.int64)
+    n, sx, sy, sxx, syy, sxy = np.moveaxis(rolling_sums(
+        ordinals, np.stack([valid, x, y, x * x, y * y, x * y], axis=1), window), 1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlations = _correlation(n, sxx - sx * sx / n, syy - sy * sy / n, sxy - sx * sy / n,
+                                    sxx, syy)
+    return _region_frame(correlations, pd.DatetimeIndex(grid.dates, name='date'))
+
+
+def _region_frame(values: np.ndarray, index: pd.Index) -> pd.DataFrame:
+    """Returns a dataframe of values with a column per region code, keeping only the regions
+    with some value that is not NaN"""
+    present = np.flatnonzero(~np.isnan(values).all(axis=0))
+    return pd.DataFrame(values[:, present], index=index,
+                        columns=[all_provinces[code] for code in present])
+
+
+def correlation_map_data(covid_data: CovidData, date: datetime.datetime,
+                         window: int = CORRELATION_WINDOW, workers: Optional[int] = None) \
+        -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the Canadian and American data of the correlation map of a date, with columns:
+    location, value (the correlation of the region's daily cases and sentiment over the window
+    days ending on the date) and days (the number of days it is over)
+
+    Days whose sentiment is not stored yet are loaded as build_grid does.
+
+    Preconditions:
+      - window >= 1
+      - workers is None or workers >= 1
+    """
+    grid = build_grid(covid_data, date - datetime.timedelta(days=window - 1), date, workers)
+    r, n = pearson(grid.cases, grid.sentiment)
+    present = np.flatnonzero(~np.isnan(r))
+    dataframe = pd.DataFrame({'location': np.array(all_provinces, dtype=object)[present],
+                              'value': r[present], 'days': n[present]})
+    in_canada = present < CANADA_REGIONS
+    return (dataframe[in_canada].reset_index(drop=True),
+            dataframe[~in_canada].reset_index(drop=True))
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'typing', 'numpy', 'pandas', 'country_provinces',
+                          'covid_data', 'region_totals', 'sentiment_range', 'tweet'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
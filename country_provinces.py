@@ -34,6 +34,12 @@ all_provinces = ['Alberta', 'British Columbia', 'Manitoba', 'New Brunswick',
                  'Tennessee', 'Texas', 'Utah', 'Vermont', 'Virginia', 'Washington', 'West Virginia',
                  'Wisconsin', 'Wyoming']
 
+# Every (country, state/province) pair. A region's index in this list is its region code.
+regions = [(country, name) for country in country_provinces
+           for name in country_provinces[country]]
+
+region_codes = {region: code for code, region in enumerate(regions)}
+
 if __name__ == '__main__':
     import python_ta.contracts
 
@@ -5,60 +5,79 @@ Copyright and Usage Information
 This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
 """
 import datetime
+import json
+import os
+from typing import Callable, Optional
+
+import numpy as np
 import pandas as pd
 
+import tracing
+
+# Where the cleaned covid tables are cached between runs
+CACHE_DIR = os.path.join('data', 'covid_cache')
+
+# Bumped whenever the cleaning or the cache layout changes, so old caches are rebuilt
+CACHE_VERSION = 1
+
+
 class CovidData:
     """
     Class to process covid data
 
+    The cleaned tables are cached under CACHE_DIR as NumPy arrays, so they are only read from
+    the CSV files again when one of those changes.
+
     Instance Attributes:
         - ca_data: a DataFrame containing the covid data for Canada
         - us_data: a DataFrame containing the covid data for the US
+        - ca_matrix: the daily cases of every province in Canada, with a row per date and a
+          column per province
+        - us_matrix: the daily cases of every state in the US, with a row per date and a
+          column per state
     """
     ca_data: pd.DataFrame
     us_data: pd.DataFrame
+    ca_matrix: pd.DataFrame
+    us_matrix: pd.DataFrame
+    _ca_cases: pd.DataFrame
+    _us_cases: pd.DataFrame
+    _ca_by_date: dict[datetime.date, np.ndarray]
+    _us_by_date: dict[datetime.date, np.ndarray]
 
-    def __init__(self) -> None:
-        """Initializes a new CovidData object"""
-
-        # Load Canada covid data
-        self.ca_data = pd.read_csv("data/Provincial_Daily_Totals.csv")
+    def __init__(self, use_cache: bool = True) -> None:
+        """Initializes a new CovidData object, from the cache of the cleaned tables if use_cache
+        and it is up to date"""
+        with tracing.span('covid.load'):
+            self.ca_data = _load_table("data/Provincial_Daily_Totals.csv", 'canada',
+                                       ['Province', 'SummaryDate', 'DailyTotals'], np.int32,
+                                       _clean_canada, use_cache)
+            self.us_data = _load_table("data/State_Daily_Totals.csv", 'us',
+                                       ['State Name', 'Submission Date', '7-day Avg Cases'],
+                                       np.float32, _clean_us, use_cache)
+        with tracing.span('covid.index'):
+            self._build_index()
 
-        # Dataframe representing daily cases for provinces in Canada
-        self.ca_data = self.ca_data[['Province', 'SummaryDate', 'DailyTotals']]
+    def _build_index(self) -> None:
+        """Indexes the daily cases by date
 
-        # Reformat names in the 'Province' column
-        self.ca_data["Province"].replace({'ALBERTA': 'Alberta', 'NWT': 'Northwest Territories',
-                                          'YUKON': 'Yukon', 'SASKATCHEWAN': 'Saskatchewan',
-                                          'PEI': 'Prince Edward Island', 'ONTARIO': 'Ontario',
-                                          'NEW BRUNSWICK': 'New Brunswick',
-                                          'NOVA SCOTIA': 'Nova Scotia',
-                                          'NL': 'Newfoundland and Labrador',
-                                          'MANITOBA': 'Manitoba', 'BC': 'British Columbia',
-                                          'NUNAVUT': 'Nunavut', 'QUEBEC': 'Quebec',
-                                          'PRINCE EDWARD ISLAND': 'Prince Edward Island',
-                                          'NEWFOUNDLAND AND LABRADOR': 'Newfoundland and Labrador',
-                                          'BRITISH COLUMBIA': 'British Columbia',
-                                          'NORTHWEST TERRITORIES': 'Northwest Territories'},
-                                         inplace=True)
-
-        # Remove any rows with 'REPATRIATED' in the Province column
-        indices = self.ca_data[self.ca_data['Province'] == 'REPATRIATED'].index
-        self.ca_data.drop(indices, inplace=True)
-
-        # Replace any DailyTotals that is less than 0 with 0
-        indices = self.ca_data[self.ca_data['DailyTotals'] < 0].index
-        self.ca_data.loc[indices, 'DailyTotals'] = 0
-
-        # Load US covid data
-        self.us_data = pd.read_csv("data/State_Daily_Totals.csv")
+        Each date maps to the positions of its rows, and the date x region matrices hold every
+        date at once for get_range.
+        """
+        ca_dates = self.ca_data['SummaryDate']
+        us_dates = self.us_data['Submission Date']
 
-        # Dataframe representing daily cases for states in US
-        self.us_data = self.us_data[['State Name', 'Submission Date', '7-day Avg Cases']]
+        self._ca_cases = self.ca_data[['Province', 'DailyTotals']]
+        self._us_cases = self.us_data[['State Name', '7-day Avg Cases']]
+        self._ca_by_date = {pd.Timestamp(date).date(): rows for date, rows
+                            in self._ca_cases.groupby(ca_dates, sort=False).indices.items()}
+        self._us_by_date = {pd.Timestamp(date).date(): rows for date, rows
+                            in self._us_cases.groupby(us_dates, sort=False).indices.items()}
 
-        # Replace any 7-day Avg Cases that is less than 0 with 0
-        indices = self.us_data[self.us_data['7-day Avg Cases'] < 0].index
-        self.us_data.loc[indices, '7-day Avg Cases'] = 0
+        self.ca_matrix = self._ca_cases.assign(date=ca_dates).pivot_table(
+            index='date', columns='Province', values='DailyTotals', aggfunc='sum')
+        self.us_matrix = self._us_cases.assign(date=us_dates).pivot_table(
+            index='date', columns='State Name', values='7-day Avg Cases', aggfunc='sum')
 
     def get_data(self, date: datetime.datetime) -> tuple[pd.DataFrame, pd.DataFrame, list[float]]:
 
@@ -68,24 +87,190 @@ class CovidData:
         Preconditions:
           - datetime.datetime(2020, 1, 22) <= date <= datetime.datetime(2021, 12, 11)
         """
-        # Convert input date into "year-month-day" format
-        date_str = date.strftime('%Y-%m-%d')
+        with tracing.span('covid.get_data'):
+            # Fetch for cases in Canada and in the US on the given date
+            # A date without data gives empty frames, as filtering on it used to
+            no_rows = np.array([], dtype=np.intp)
+            ca_rtn = self._ca_cases.take(self._ca_by_date.get(date.date(), no_rows))\
+                .reset_index(drop=True)
+            us_rtn = self._us_cases.take(self._us_by_date.get(date.date(), no_rows))\
+                .reset_index(drop=True)
+
+            # Calculate bin boundaries for the given date
+            max_cases = max(ca_rtn['DailyTotals'].max(), us_rtn['7-day Avg Cases'].max())
+
+            return ca_rtn, us_rtn, _bins(max_cases)
+
+    def get_range(self, start: datetime.datetime, end: datetime.datetime) \
+            -> tuple[pd.DataFrame, pd.DataFrame, list[float]]:
+        """Returns the daily cases of every province in Canada and of every state in the US for
+        every date from start to end inclusive, with a row per date and a column per region,
+        along with bin boundaries for the daily cases across Canada and the US over the period.
+
+        Preconditions:
+          - start <= end
+        """
+        ca_rtn = self.ca_matrix.loc[pd.Timestamp(start.date()):pd.Timestamp(end.date())]
+        us_rtn = self.us_matrix.loc[pd.Timestamp(start.date()):pd.Timestamp(end.date())]
+
+        max_cases = max(ca_rtn.max().max(), us_rtn.max().max())
+
+        return ca_rtn, us_rtn, _bins(max_cases)
+
+    def get_dates(self) -> list[datetime.date]:
+        """Returns every date that has covid data, in order"""
+        return sorted(self._ca_by_date.keys() | self._us_by_date.keys())
+
+
+def _bins(max_cases: float) -> list[float]:
+    """Returns the boundaries of 9 bins of equal width from 0 to max_cases
+
+    The last boundary is max_cases itself, so that rounding cannot leave the largest value
+    outside of every bin.
+
+    >>> _bins(9.0)
+    [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+    """
+    max_cases = float(max_cases)
+    step = max_cases / 9
+    return [x * step for x in range(9)] + [max_cases]
 
-        # Fetch for cases in Canada on the given date
-        ca_rtn = self.ca_data.loc[self.ca_data['SummaryDate']
-                                  == date_str.replace('-', '/') + ' 12:00:00+00']\
-            .drop('SummaryDate', axis=1).reset_index(drop=True)
 
-        # Fetch for cases in US on the given date
-        us_rtn = self.us_data.loc[self.us_data['Submission Date'] == date_str].\
-            drop('Submission Date', axis=1).reset_index(drop=True)
+def _clean_canada(ca_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the Canadian daily cases with province names reformatted, repatriated cases
+    removed, negative totals set to 0 and the dates parsed
+    """
+    # Reformat names in the 'Province' column
+    ca_data["Province"] = ca_data["Province"].replace({
+        'ALBERTA': 'Alberta', 'NWT': 'Northwest Territories',
+        'YUKON': 'Yukon', 'SASKATCHEWAN': 'Saskatchewan',
+        'PEI': 'Prince Edward Island', 'ONTARIO': 'Ontario',
+        'NEW BRUNSWICK': 'New Brunswick',
+        'NOVA SCOTIA': 'Nova Scotia',
+        'NL': 'Newfoundland and Labrador',
+        'MANITOBA': 'Manitoba', 'BC': 'British Columbia',
+        'NUNAVUT': 'Nunavut', 'QUEBEC': 'Quebec',
+        'PRINCE EDWARD ISLAND': 'Prince Edward Island',
+        'NEWFOUNDLAND AND LABRADOR': 'Newfoundland and Labrador',
+        'BRITISH COLUMBIA': 'British Columbia',
+        'NORTHWEST TERRITORIES': 'Northwest Territories'})
+
+    # Remove any rows with 'REPATRIATED' in the Province column
+    indices = ca_data[ca_data['Province'] == 'REPATRIATED'].index
+    ca_data.drop(indices, inplace=True)
+
+    # Replace any DailyTotals that is less than 0 with 0
+    indices = ca_data[ca_data['DailyTotals'] < 0].index
+    ca_data.loc[indices, 'DailyTotals'] = 0
+
+    # 'SummaryDate' looks like '2020/08/01 12:00:00+00'; only the date part matters
+    ca_data['SummaryDate'] = pd.to_datetime(ca_data['SummaryDate'].str[:10], format='%Y/%m/%d')
+    return ca_data
+
+
+def _clean_us(us_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns the American daily cases with negative averages set to 0 and the dates parsed
+    """
+    # Replace any 7-day Avg Cases that is less than 0 with 0
+    indices = us_data[us_data['7-day Avg Cases'] < 0].index
+    us_data.loc[indices, '7-day Avg Cases'] = 0
+
+    # 'Submission Date' looks like '2020-08-01'
+    us_data['Submission Date'] = pd.to_datetime(us_data['Submission Date'].str[:10],
+                                                format='%Y-%m-%d')
+    return us_data
+
+
+def _load_table(source: str, name: str, columns: list[str], value_dtype: type,
+                clean: Callable[[pd.DataFrame], pd.DataFrame], use_cache: bool) -> pd.DataFrame:
+    """Returns the cleaned (region, date, value) columns of a covid CSV file
+
+    If use_cache, the table is read from its cache under CACHE_DIR when that was built from
+    the current version of source, and the cache is rebuilt otherwise.
+    """
+    cache_dir = os.path.join(CACHE_DIR, name)
+    stat = os.stat(source)
+    signature = {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    if use_cache:
+        try:
+            table = _read_cache(cache_dir, columns, signature)
+        except (OSError, ValueError, KeyError):
+            # A truncated or corrupt cache is rebuilt like an out of date one
+            table = None
+        if table is not None:
+            return table
+
+    region_column, date_column, value_column = columns
+    table = clean(pd.read_csv(source, usecols=columns,
+                              dtype={region_column: str, date_column: str}))
+    table = table.reset_index(drop=True)
+    if np.issubdtype(value_dtype, np.integer) and table[value_column].isna().any():
+        # Missing counts cannot be stored as integers
+        value_dtype = np.float32
+    table[value_column] = table[value_column].astype(value_dtype)
+
+    if use_cache:
+        try:
+            _write_cache(cache_dir, table, columns, signature)
+        except OSError:
+            # Caching is only an optimization; carry on without it
+            pass
+    return table
+
+
+def _read_cache(cache_dir: str, columns: list[str], signature: dict) -> Optional[pd.DataFrame]:
+    """Returns the table cached in cache_dir, or None if there is no cache with the given
+    signature
+
+    Raises OSError, ValueError or KeyError if the cache is incomplete or corrupt.
+    """
+    signature_path = os.path.join(cache_dir, 'source.json')
+    if not os.path.exists(signature_path):
+        return None
+    with open(signature_path) as f:
+        if json.load(f) != signature:
+            return None
+    with open(os.path.join(cache_dir, 'regions.json')) as f:
+        regions = np.array(json.load(f), dtype=object)
+
+    # Every array is used whole right away, so they are read rather than memory-mapped
+    codes = np.load(os.path.join(cache_dir, 'region_codes.npy'))
+    dates = np.load(os.path.join(cache_dir, 'dates.npy'))
+    values = np.load(os.path.join(cache_dir, 'values.npy'))
+    if not len(codes) == len(dates) == len(values) or \
+            (len(codes) > 0 and not 0 <= codes.min() <= codes.max() < len(regions)):
+        raise ValueError('The covid cache in ' + cache_dir + ' is inconsistent.')
+
+    region_column, date_column, value_column = columns
+    return pd.DataFrame({region_column: regions[codes],
+                         date_column: dates.astype('datetime64[ns]'),
+                         value_column: values})
+
+
+def _write_cache(cache_dir: str, table: pd.DataFrame, columns: list[str],
+                 signature: dict) -> None:
+    """Caches a cleaned table in cache_dir as a region code, a date and a value array, tagged
+    with the signature of the file it was read from
+    """
+    region_column, date_column, value_column = columns
+    codes, regions = pd.factorize(table[region_column])
 
-        # Calculate bin boundaries for the given date
-        max_cases = max(ca_rtn['DailyTotals'].max(), us_rtn['7-day Avg Cases'].max())
-        step = max_cases / 9
-        bins = [x * step for x in range(10)]
+    os.makedirs(cache_dir, exist_ok=True)
+    signature_path = os.path.join(cache_dir, 'source.json')
+    if os.path.exists(signature_path):
+        # Invalidate the old cache before overwriting any of its arrays
+        os.remove(signature_path)
 
-        return ca_rtn, us_rtn, bins
+    np.save(os.path.join(cache_dir, 'region_codes.npy'), codes.astype(np.int16))
+    np.save(os.path.join(cache_dir, 'dates.npy'),
+            table[date_column].to_numpy().astype('datetime64[D]'))
+    np.save(os.path.join(cache_dir, 'values.npy'), table[value_column].to_numpy())
+    with open(os.path.join(cache_dir, 'regions.json'), 'w') as f:
+        json.dump(list(regions), f)
+    # Written last, so a cache is only used once all of its arrays are complete
+    with open(signature_path, 'w') as f:
+        json.dump(signature, f)
 
 
 if __name__ == '__main__':
@@ -101,8 +286,9 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['datetime', 'pandas'],
-        'allowed-io': ['run_example'],
+        'extra-imports': ['datetime', 'json', 'os', 'typing', 'numpy', 'pandas',
+                          'tracing'],
+        'allowed-io': ['_read_cache', '_write_cache'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200', 'R0201']
     })
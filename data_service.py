@@ -0,0 +1,281 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+The data and map geometry shared by every map, loaded lazily, concurrently and at most once.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import collections
+import concurrent.futures
+import datetime
+import json
+import threading
+from typing import Optional
+
+import pandas as pd
+
+import map_page
+import tracing
+from correlation import correlation_map_data
+from covid_data import CovidData
+from geometry import DEFAULT_TOLERANCE, prepared_topology, topology_features
+from sampling import DEFAULT_TIME_BUDGET, approximate_tweets
+from tweet import get_tweets, has_stored_totals, tweet_dates, tweet_path
+
+# Most (mode, date) results the service keeps, including prefetched ones
+RESULT_CACHE_SIZE = 12
+
+SENTIMENT_BINS = [-1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1]
+
+CORRELATION_BINS = [-1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1]
+
+
+class DataService:
+    """The covid data, tweet sentiment aggregates and map geometry used by one or more maps
+
+    Expensive resources are loaded on first use on background threads, and never twice.
+    Loaded results are kept in a small LRU cache, and a result requested again while it is
+    loading is waited for rather than loaded twice. Every method may be called from any thread.
+
+    Instance Attributes:
+        - sentiment_workers: The number of processes get_tweets uses for each date
+        - geometry_tolerance: How far, in degrees, the simplified boundaries may stray from
+          the original ones
+    """
+    sentiment_workers: int
+    geometry_tolerance: float
+    _lock: threading.Lock
+    _startup_executor: concurrent.futures.ThreadPoolExecutor
+    _fetch_executor: concurrent.futures.ThreadPoolExecutor
+    _covid_future: Optional[concurrent.futures.Future] = None
+    _geometry_future: Optional[concurrent.futures.Future] = None
+    _results: collections.OrderedDict
+    _pending: dict[tuple[str, datetime.datetime], concurrent.futures.Future]
+
+    def __init__(self, sentiment_workers: int = 1,
+                 geometry_tolerance: float = DEFAULT_TOLERANCE) -> None:
+        self.sentiment_workers = sentiment_workers
+        self.geometry_tolerance = geometry_tolerance
+        self._lock = threading.Lock()
+        # Startup loads never wait on anything, so fetches waiting on them cannot deadlock
+        self._startup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self._fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self._results = collections.OrderedDict()
+        self._pending = {}
+
+    def preload(self, modes: list[str]) -> None:
+        """Starts loading the resources the given map modes need, without waiting for them"""
+        self._geometry()
+        if 'covid' in modes or 'correlation' in modes:
+            self._covid()
+
+    def _covid(self) -> concurrent.futures.Future:
+        """Returns the future of the covid data, starting to load it if nobody has yet"""
+        with self._lock:
+            if self._covid_future is None:
+                self._covid_future = self._startup_executor.submit(CovidData)
+            return self._covid_future
+
+    def _geometry(self) -> concurrent.futures.Future:
+        """Returns the future of the map geometry, starting to load it if nobody has yet"""
+        with self._lock:
+            if self._geometry_future is None:
+                self._geometry_future = self._startup_executor.submit(
+                    load_topology, self.geometry_tolerance)
+            return self._geometry_future
+
+    def covid_data(self) -> CovidData:
+        """Returns the covid data, waiting for it to load if needed"""
+        return self._covid().result()
+
+    def geometry(self) -> tuple[dict, dict]:
+        """Returns the simplified Canadian and American boundaries, waiting for them if needed
+        """
+        return self._geometry().result()[1]
+
+    def topology(self) -> bytes:
+        """Returns the simplified boundaries as a serialized TopoJSON topology with objects
+        'ca' and 'us', waiting for them if needed"""
+        return self._geometry().result()[0]
+
+    def dates(self, modes: list[str]) -> list[datetime.datetime]:
+        """Returns every date that has data for all of the given map modes, in order, waiting
+        for the covid data if needed
+
+        Preconditions:
+          - modes != []
+          - all(mode in {'covid', 'sentiment', 'correlation'} for mode in modes)
+        """
+        available = None
+        for mode in modes:
+            if mode == 'covid':
+                mode_dates = self._covid_dates()
+            elif mode == 'sentiment':
+                mode_dates = set(tweet_dates())
+            else:
+                # A correlation needs both cases and tweets
+                mode_dates = self._covid_dates() & set(tweet_dates())
+            available = mode_dates if available is None else available & mode_dates
+        return sorted(available)
+
+    def _covid_dates(self) -> set[datetime.datetime]:
+        """Returns every date that has covid data"""
+        return {datetime.datetime(date.year, date.month, date.day)
+                for date in self.covid_data().get_dates()}
+
+    def cached(self, date: datetime.datetime, modes: list[str]) -> Optional[dict[str, tuple]]:
+        """Returns the cached results of every mode on a date, or None unless all are cached"""
+        with self._lock:
+            keys = [(mode, date) for mode in modes]
+            if not all(key in self._results for key in keys):
+                return None
+            for key in keys:
+                self._results.move_to_end(key)
+            return {mode: self._results[(mode, date)] for mode in modes}
+
+    def load(self, mode: str, date: datetime.datetime) \
+            -> tuple[pd.DataFrame, pd.DataFrame, list[float]]:
+        """Returns the Canadian data, the American data and the bins of a map mode on a date
+
+        Preconditions:
+          - mode in {'covid', 'sentiment', 'correlation'}
+        """
+        key = (mode, date)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+            elif key in self._pending:
+                pending = self._pending[key]
+            else:
+                pending = None
+                future = self._pending[key] = concurrent.futures.Future()
+        if pending is not None:
+            return pending.result()
+
+        try:
+            if mode == 'covid':
+                result = self.covid_data().get_data(date)
+            elif mode == 'correlation':
+                ca_data, us_data = correlation_map_data(self.covid_data(), date,
+                                                        workers=self.sentiment_workers)
+                result = (ca_data, us_data, CORRELATION_BINS)
+            else:
+                ca_data, us_data = get_tweets(date, workers=self.sentiment_workers)
+                result = (ca_data, us_data, SENTIMENT_BINS)
+        except BaseException as error:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+            future.set_exception(error)
+            raise
+
+        with self._lock:
+            # A load the date was invalidated during is not kept, since it may miss tweets
+            if self._pending.get(key) is future:
+                del self._pending[key]
+                self._results[key] = result
+                while len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def fetch_approximate(self, date: datetime.datetime, modes: list[str],
+                          time_budget: float = DEFAULT_TIME_BUDGET) -> Optional[dict[str, tuple]]:
+        """Returns the sentiment on a date approximated from a sample of the day's tweets,
+        along with the results of the other modes that are already cached, or None if there is
+        no sentiment that would take longer to load exactly
+
+        The approximation takes about time_budget seconds; see sampling.approximate_tweets.
+        Approximations are not cached, so a later load of the sentiment is exact. The other
+        modes that are not cached start loading alongside the sampling, without being waited
+        for, so a fetch of the date afterwards picks them up where they are.
+
+        Preconditions:
+          - all(mode in {'covid', 'sentiment', 'correlation'} for mode in modes)
+        """
+        if 'sentiment' not in modes or self.cached(date, ['sentiment']) is not None \
+                or has_stored_totals(tweet_path(date)):
+            return None
+
+        others = [mode for mode in modes if mode != 'sentiment']
+        results = {}
+        for mode in others:
+            cached = self.cached(date, [mode])
+            if cached is not None:
+                results.update(cached)
+            else:
+                self._fetch_executor.submit(self.load, mode, date)
+
+        with tracing.span('sampling.approximate'):
+            ca_data, us_data = approximate_tweets(tweet_path(date), time_budget=time_budget)
+        results['sentiment'] = (ca_data, us_data, SENTIMENT_BINS)
+        return results
+
+    def invalidate(self, date: datetime.datetime) -> None:
+        """Forgets the cached results of every mode on a date, so that the next load of the
+        date picks up tweets added to it since"""
+        with self._lock:
+            for key in [key for key in self._results if key[1] == date]:
+                del self._results[key]
+            for key in [key for key in self._pending if key[1] == date]:
+                del self._pending[key]
+
+    def fetch(self, date: datetime.datetime, modes: list[str]) -> dict[str, tuple]:
+        """Returns the results of every mode on a date, loading the modes concurrently
+
+        Preconditions:
+          - all(mode in {'covid', 'sentiment', 'correlation'} for mode in modes)
+        """
+        # The first mode loads on this thread and the others alongside it
+        futures = {mode: self._fetch_executor.submit(self.load, mode, date)
+                   for mode in modes[1:]}
+        results = {modes[0]: self.load(modes[0], date)}
+        for mode, future in futures.items():
+            results[mode] = future.result()
+        return results
+
+
+def load_geometry(tolerance: float = DEFAULT_TOLERANCE) -> tuple[dict, dict]:
+    """Returns the Canadian and American boundaries, simplified with the given tolerance in
+    degrees"""
+    return load_topology(tolerance)[1]
+
+
+def load_topology(tolerance: float = DEFAULT_TOLERANCE) -> tuple[bytes, tuple[dict, dict]]:
+    """Returns the Canadian and American boundaries simplified with the given tolerance in
+    degrees, both as a serialized TopoJSON topology with objects 'ca' and 'us' and as parsed
+    feature collections
+
+    The topology is prepared once and cached; see geometry.prepared_topology.
+    """
+    with tracing.span('geometry.prepare'):
+        data = prepared_topology({'ca': map_page.CANADA_GEOJSON, 'us': map_page.US_GEOJSON},
+                                 tolerance)
+    with tracing.span('geometry.decode'):
+        features = topology_features(json.loads(data))
+    tracing.count('geometry.topology_bytes', len(data))
+    return data, (features['ca'], features['us'])
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'concurrent.futures', 'datetime', 'json', 'threading',
+                          'typing', 'pandas', 'map_page', 'tracing', 'correlation',
+                          'covid_data', 'geometry', 'sampling', 'tweet'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -0,0 +1,167 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+The stored sentiment totals of a day, along with how much of the day's hydrated tweets file
+they cover, so that tweets appended to the file later can be added without a rescan.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import hashlib
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+from gazetteer import default_gazetteer
+from region_totals import RegionTotals
+
+# Name of the day state kept next to a day's hydrated tweets
+STATE_FILENAME = 'sentiment_state.npz'
+
+# Bumped whenever the stored totals change meaning, so old states are rebuilt
+STATE_VERSION = 4
+
+# How many bytes before the covered end of a file are hashed to tell an appended file from a
+# rewritten one
+_TAIL_BYTES = 4096
+
+_TOTALS_FIELDS = ('counts', 'sums', 'sum_squares', 'positives', 'negatives')
+
+
+class DayState:
+    """The region totals of the lines of a hydrated tweets file before a byte offset
+
+    The offset is always at the start of a line. A state only applies to a file that still
+    holds the same bytes before the offset, as checked by a hash of the bytes right before it,
+    and to the gazetteer the totals were resolved with.
+
+    Instance Attributes:
+        - source: The path of the hydrated tweets file
+        - offset: The number of bytes of the file covered by the totals
+        - totals: The region totals of the located tweets in those bytes
+
+    Representation Invariants:
+      - self.offset >= 0
+    """
+    source: str
+    offset: int
+    totals: RegionTotals
+
+    def __init__(self, source: str) -> None:
+        """Initializes the state of a file with nothing covered yet"""
+        self.source = source
+        self.offset = 0
+        self.totals = RegionTotals()
+
+    @staticmethod
+    def path_of(source: str) -> str:
+        """Returns the path the state of a hydrated tweets file is kept at"""
+        return os.path.join(os.path.dirname(source), STATE_FILENAME)
+
+    @classmethod
+    def load(cls, source: str) -> 'DayState':
+        """Returns the stored state of a hydrated tweets file, or an empty state if there is
+        none that still applies to the file"""
+        state = cls(source)
+        try:
+            with np.load(cls.path_of(source)) as stored:
+                version, offset, tail = (int(x) for x in stored['meta'])
+                fingerprint = str(stored['fingerprint'])
+                arrays = {field: stored[field] for field in _TOTALS_FIELDS}
+        except (OSError, KeyError, ValueError):
+            return state
+
+        if version != STATE_VERSION or fingerprint != default_gazetteer().fingerprint() \
+                or tail_hash(source, offset) != tail:
+            return state
+        if is_compressed(source) and offset != os.path.getsize(source):
+            # Compressed files cannot be resumed in the middle
+            return state
+
+        state.offset = offset
+        for field, array in arrays.items():
+            getattr(state.totals, field)[:] = array
+        return state
+
+    def advance(self, end: int, totals: RegionTotals) -> None:
+        """Adds the totals of the lines from the current offset up to end to the state"""
+        self.totals.merge(totals)
+        self.offset = end
+
+    def save(self) -> None:
+        """Stores the state next to its file, replacing any earlier one at once"""
+        path = self.path_of(self.source)
+        meta = np.array([STATE_VERSION, self.offset, tail_hash(self.source, self.offset)],
+                        dtype=np.int64)
+        arrays = {field: getattr(self.totals, field) for field in _TOTALS_FIELDS}
+        # Threads and worker processes may refresh the same day at once, so each writes its
+        # own temporary file
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, meta=meta, fingerprint=np.array(default_gazetteer().fingerprint()),
+                     **arrays)
+        os.replace(temporary_path, path)
+
+
+def is_compressed(filename: str) -> bool:
+    """Returns whether a tweet file is gzip or bz2 compressed, judging by its extension"""
+    return filename.endswith(('.gz', '.bz2'))
+
+
+def complete_size(filename: str) -> int:
+    """Returns the number of bytes of a file up to the end of its last complete line
+
+    A line still being written at the end of the file is not complete. Compressed files are
+    only ever read whole, so their complete size is their size.
+    """
+    size = os.path.getsize(filename)
+    if is_compressed(filename):
+        return size
+
+    with open(filename, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(end - 65536, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def tail_hash(filename: str, size: int) -> Optional[int]:
+    """Returns a hash of the bytes of a file right before size, as a signed 64 bit integer, or
+    None if the file is shorter than size"""
+    try:
+        if os.path.getsize(filename) < size:
+            return None
+        with open(filename, 'rb') as f:
+            f.seek(max(size - _TAIL_BYTES, 0))
+            data = f.read(min(size, _TAIL_BYTES))
+    except OSError:
+        return None
+    return int.from_bytes(hashlib.sha1(data).digest()[:8], 'big', signed=True)
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['hashlib', 'os', 'threading', 'typing', 'numpy', 'gazetteer',
+                          'region_totals'],
+        'allowed-io': ['DayState.load', 'DayState.save', 'complete_size', 'tail_hash'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
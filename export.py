@@ -0,0 +1,197 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Exporting the maps and per-region aggregates of many dates without a display. Nothing here
+imports Qt, so exports can run on servers.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import concurrent.futures
+import datetime
+import json
+import os
+import time
+from typing import Optional
+
+import pandas as pd
+
+import map_page
+import tracing
+from covid_data import CovidData
+from correlation import correlation_map_data
+from data_service import CORRELATION_BINS, SENTIMENT_BINS, load_geometry
+from geometry import DEFAULT_TOLERANCE
+from text_cache import default_text_cache, save_text_cache
+from tweet import get_tweets, init_worker, tweet_path
+
+# What each worker process loads once and reuses for every date it exports
+_worker_state = {}
+
+
+def parse_date_range(text: str) -> tuple[datetime.datetime, datetime.datetime]:
+    """Returns the first and last date of a "Year-Month-Date:Year-Month-Date" range, or of a
+    single "Year-Month-Date" date
+
+    >>> parse_date_range('2020-08-01:2020-08-03')
+    (datetime.datetime(2020, 8, 1, 0, 0), datetime.datetime(2020, 8, 3, 0, 0))
+    """
+    first, _, last = text.partition(':')
+    start = datetime.datetime.strptime(first, '%Y-%m-%d')
+    end = datetime.datetime.strptime(last, '%Y-%m-%d') if last else start
+    if end < start:
+        raise ValueError('The date range ' + text + ' ends before it starts.')
+    return start, end
+
+
+def export_maps(modes: list[str], start: datetime.datetime, end: datetime.datetime,
+                out_dir: str, workers: Optional[int] = None,
+                tolerance: float = DEFAULT_TOLERANCE) -> dict[str, float]:
+    """Writes the aggregates and the map page of every date from start to end inclusive that
+    has data, for each of the given modes, and returns the seconds spent on each stage
+
+    Dates are exported in parallel in the given number of worker processes, by default one per
+    CPU. The files of a mode go to out_dir/<mode>/<date>.csv and out_dir/<mode>/<date>.html,
+    and the timings to out_dir/timings.json. Stage times are summed over all worker processes;
+    'total' is the wall clock time of the whole export. Boundaries are simplified with the
+    given tolerance in degrees.
+
+    Preconditions:
+      - all(mode in {'covid', 'sentiment', 'correlation'} for mode in modes)
+      - start <= end
+    """
+    start_time = time.perf_counter()
+    dates = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+    for mode in modes:
+        os.makedirs(os.path.join(out_dir, mode), exist_ok=True)
+
+    # Prepared once here, so that workers do not all prepare and cache the boundaries at once.
+    # Forked workers inherit them, and others read them from the cache.
+    _worker_state['geometry'] = load_geometry(tolerance)
+
+    timings = {}
+    exported = {mode: 0 for mode in modes}
+    # Workers drop the trace records and text scores they were forked with, so none are
+    # merged twice
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=init_worker) as executor:
+        futures = [executor.submit(_export_date, mode, date, out_dir, tolerance)
+                   for date in dates for mode in modes]
+        for future in futures:
+            mode, has_data, date_timings, records, text_scores = future.result()
+            tracing.tracer.merge(records)
+            default_text_cache().merge(text_scores)
+            exported[mode] += has_data
+            for stage, seconds in date_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+
+    save_text_cache()
+
+    timings['total'] = time.perf_counter() - start_time
+    with open(os.path.join(out_dir, 'timings.json'), 'w') as f:
+        json.dump({'dates': exported, 'seconds': timings}, f, indent=2)
+    return timings
+
+
+def _export_date(mode: str, date: datetime.datetime, out_dir: str, tolerance: float) \
+        -> tuple[str, bool, dict[str, float], dict, dict]:
+    """Writes the aggregates and map page of a mode on a date, and returns the mode, whether
+    the date had any data to write, the seconds spent on each stage, the records of the
+    process's tracer and what its text score cache took
+
+    This runs in a worker process.
+    """
+    timings = {}
+
+    stage_start = time.perf_counter()
+    if 'geometry' not in _worker_state:
+        _worker_state['geometry'] = load_geometry(tolerance)
+    if mode in {'covid', 'correlation'} and 'covid' not in _worker_state:
+        _worker_state['covid'] = CovidData()
+    timings['setup'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    if mode == 'covid':
+        ca_data, us_data, bins = _worker_state['covid'].get_data(date)
+        has_data = len(ca_data) > 0 or len(us_data) > 0
+    elif mode == 'correlation':
+        ca_data, us_data = correlation_map_data(_worker_state['covid'], date, workers=1)
+        bins, has_data = CORRELATION_BINS, len(ca_data) > 0 or len(us_data) > 0
+    elif os.path.exists(tweet_path(date)):
+        ca_data, us_data = get_tweets(date)
+        bins, has_data = SENTIMENT_BINS, True
+    else:
+        has_data = False
+    timings[mode] = time.perf_counter() - stage_start
+    if not has_data:
+        return mode, False, timings, tracing.tracer.take(), default_text_cache().take()
+
+    path = os.path.join(out_dir, mode, date.strftime('%Y-%m-%d'))
+
+    stage_start = time.perf_counter()
+    aggregates_to_csv(mode, ca_data, us_data, path + '.csv')
+    timings['csv'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    html = map_page.standalone_html(mode, ca_data, us_data, bins, map_page.LEGEND_NAMES[mode],
+                                    _worker_state['geometry'])
+    timings['render'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    with open(path + '.html', 'w') as f:
+        f.write(html)
+    timings['html'] = time.perf_counter() - stage_start
+
+    return mode, True, timings, tracing.tracer.take(), default_text_cache().take()
+
+
+def aggregates_to_csv(mode: str, ca_data: pd.DataFrame, us_data: pd.DataFrame,
+                      path: str) -> None:
+    """Writes the Canadian and American data of a map mode to one csv file, with columns:
+    country, region, value, followed by any other columns of the data
+
+    Preconditions:
+      - mode in map_page.MAP_COLUMNS
+    """
+    c1, c2 = map_page.MAP_COLUMNS[mode]
+    tables = []
+    for country, data, (region, value) in (('Canada', ca_data, c1), ('US', us_data, c2)):
+        table = data.rename(columns={region: 'region', value: 'value'})
+        table.insert(0, 'country', country)
+        tables.append(table)
+    pd.concat(tables, ignore_index=True).to_csv(path, index=False)
+
+
+def format_timings(timings: dict[str, float]) -> str:
+    """Returns a table of the seconds spent on each export stage
+
+    >>> print(format_timings({'render': 1.5, 'total': 2.0}))
+    stage      seconds
+    render       1.500
+    total        2.000
+    """
+    lines = [f'{"stage":<10}{"seconds":>8}']
+    lines.extend(f'{stage:<10}{seconds:>8.3f}' for stage, seconds in timings.items())
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['concurrent.futures', 'datetime', 'json', 'os', 'time', 'typing',
+                          'pandas', 'map_page', 'correlation', 'covid_data', 'data_service',
+                          'geometry', 'text_cache', 'tweet', 'tracing'],
+        'allowed-io': ['export_maps', '_export_date'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -0,0 +1,573 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import collections
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Optional
+
+from country_provinces import country_provinces, regions, region_codes
+
+# Region code returned for a location that names no state or province
+NO_REGION = -1
+
+# Region code of an alias that is matched only so that it cannot match anything else,
+# such as the "washington" in "Washington, DC"
+BLOCKED = -2
+
+# The kinds of alias, from the most to the least specific: names and unambiguous
+# abbreviations of a state or province, cities in one, and two-letter postal codes. A sole
+# alias also names other places, so it only counts as the whole location.
+REGION_NAME = 0
+CITY = 1
+POSTAL_CODE = 2
+SOLE = 3
+
+# Region code of a place outside Canada and the United States. Matching one stops a city or
+# postal code from being read as a region, so "Berlin, DE" is not Delaware.
+FOREIGN = -3
+
+# Changes whenever resolve changes how aliases are matched, so that locations resolved the old
+# way are not reused
+_RESOLVE_VERSION = 3
+
+# Where the location cache is kept between runs
+LOCATION_CACHE_PATH = os.path.join('data', 'location_cache.json')
+
+# Most distinct locations the location cache remembers
+LOCATION_CACHE_SIZE = 200000
+
+# The words of a location: runs of letters, including accented ones
+_WORD_PATTERN = re.compile(r'[^\W\d_]+')
+
+# Postal and traditional abbreviations of every state and province. An alias containing an
+# uppercase letter only matches text with exactly that case, so "IN" is Indiana but "in" is
+# not. Abbreviations with periods ("N.Y.", "Calif.") match since punctuation is ignored.
+# Abbreviations that are also ordinary words or name parts, like "La", "Del" or "Man", are left
+# out, and two-letter postal codes are only read as a region where nothing else matches.
+ABBREVIATIONS = {
+    'alberta': ['AB'],
+    'british columbia': ['BC', 'B C'],
+    'manitoba': ['MB'],
+    'new brunswick': ['NB', 'N B'],
+    'newfoundland and labrador': ['NL', 'NFLD', 'nfld', 'newfoundland'],
+    'northwest territories': ['NT', 'NWT', 'N W T'],
+    'nova scotia': ['NS', 'N S'],
+    'nunavut': ['NU'],
+    'ontario': ['ON', 'ont'],
+    'prince edward island': ['PE', 'PEI', 'P E I'],
+    'quebec': ['QC', 'PQ', 'Que', 'québec'],
+    'saskatchewan': ['SK', 'sask'],
+    'yukon': ['YT'],
+    'alabama': ['AL', 'Ala'],
+    'alaska': ['AK'],
+    'arizona': ['AZ', 'ariz'],
+    'arkansas': ['AR'],
+    'california': ['CA', 'calif'],
+    'colorado': ['CO', 'colo'],
+    'connecticut': ['CT', 'conn'],
+    'delaware': ['DE'],
+    'florida': ['FL', 'fla'],
+    'georgia': ['GA'],
+    'hawaii': ['HI'],
+    'idaho': ['ID'],
+    'illinois': ['IL'],
+    'indiana': ['IN', 'Ind'],
+    'iowa': ['IA'],
+    'kansas': ['KS', 'Kan', 'Kans'],
+    'kentucky': ['KY'],
+    # "LA" is Los Angeles far more often than Louisiana
+    'louisiana': [],
+    'maine': ['ME'],
+    'maryland': ['MD'],
+    'massachusetts': ['MA', 'Mass'],
+    'michigan': ['MI', 'mich'],
+    'minnesota': ['MN', 'minn'],
+    'mississippi': ['MS'],
+    'missouri': ['MO'],
+    'montana': ['MT'],
+    'nebraska': ['NE', 'Neb', 'nebr'],
+    'nevada': ['NV', 'Nev'],
+    'new hampshire': ['NH', 'N H'],
+    'new jersey': ['NJ', 'N J'],
+    'new mexico': ['NM', 'N M'],
+    'new york': ['NY', 'N Y'],
+    'north carolina': ['NC', 'N C'],
+    'north dakota': ['ND', 'N D'],
+    'ohio': ['OH'],
+    'oklahoma': ['OK', 'okla'],
+    'oregon': ['OR'],
+    'pennsylvania': ['PA', 'Penn', 'penna'],
+    'rhode island': ['RI', 'R I'],
+    'south carolina': ['SC', 'S C'],
+    'south dakota': ['SD', 'S D'],
+    'tennessee': ['TN', 'tenn'],
+    'texas': ['TX', 'tex'],
+    'utah': ['UT'],
+    'vermont': ['VT'],
+    'virginia': ['VA'],
+    'washington': ['WA'],
+    'west virginia': ['WV', 'W Va'],
+    'wisconsin': ['WI', 'wis', 'wisc'],
+    'wyoming': ['WY', 'wyo'],
+}
+
+# Common cities and nicknames. They only decide the region of a location that names no state
+# or province, so "Portland, Maine" is still Maine.
+CITY_ALIASES = {
+    'alberta': ['calgary', 'edmonton', 'yyc', 'yeg'],
+    'british columbia': ['vancouver', 'burnaby', 'kelowna', 'yvr'],
+    'manitoba': ['winnipeg'],
+    'new brunswick': ['fredericton', 'moncton'],
+    'newfoundland and labrador': ["st john's", 'st johns'],
+    'northwest territories': ['yellowknife'],
+    'nova scotia': ['halifax'],
+    'nunavut': ['iqaluit'],
+    'ontario': ['toronto', 'ottawa', 'mississauga', 'brampton', 'gta', 'yyz'],
+    'prince edward island': ['charlottetown'],
+    'quebec': ['montreal', 'montréal', 'mtl', 'laval'],
+    'saskatchewan': ['saskatoon'],
+    'yukon': ['whitehorse'],
+    'alaska': ['anchorage'],
+    'arizona': ['phoenix', 'tucson', 'scottsdale'],
+    'california': ['los angeles', 'LA', 'san francisco', 'SF', 'san diego', 'san jose',
+                   'oakland', 'sacramento', 'bay area', 'silicon valley', 'hollywood'],
+    'colorado': ['denver'],
+    'connecticut': ['hartford'],
+    'florida': ['miami', 'orlando', 'tampa', 'jacksonville'],
+    'georgia': ['atlanta', 'ATL'],
+    'hawaii': ['honolulu'],
+    'idaho': ['boise'],
+    'illinois': ['chicago', 'chi town', 'chitown'],
+    'indiana': ['indianapolis'],
+    'iowa': ['des moines'],
+    'kentucky': ['louisville'],
+    'louisiana': ['new orleans', 'NOLA'],
+    'maryland': ['baltimore'],
+    'massachusetts': ['boston'],
+    'michigan': ['detroit'],
+    'minnesota': ['minneapolis'],
+    'missouri': ['kansas city', 'st louis', 'saint louis'],
+    'nebraska': ['omaha'],
+    'nevada': ['las vegas', 'vegas'],
+    'new jersey': ['newark', 'jersey city', 'hoboken'],
+    'new mexico': ['albuquerque'],
+    'new york': ['nyc', 'brooklyn', 'manhattan', 'bronx', 'buffalo'],
+    'north carolina': ['charlotte', 'raleigh'],
+    'ohio': ['cleveland', 'columbus', 'cincinnati'],
+    'oklahoma': ['tulsa'],
+    'oregon': ['portland'],
+    'pennsylvania': ['philadelphia', 'philly', 'pittsburgh'],
+    'tennessee': ['nashville', 'memphis'],
+    'texas': ['houston', 'dallas', 'austin', 'san antonio', 'fort worth', 'el paso', 'dfw'],
+    'utah': ['salt lake city'],
+    'washington': ['seattle'],
+    'wisconsin': ['milwaukee'],
+}
+
+# The two-letter code of each country, which a postal code may also be
+COUNTRY_CODES = {'Canada': 'CA', 'United States': 'US'}
+
+# Words naming a country that may follow a postal code, as in "Austin, TX, USA"
+_COUNTRY_WORDS = {'usa', 'us', 'u', 's', 'a', 'united', 'states', 'of', 'america', 'canada',
+                  'can'}
+
+# Names that are mostly of a region, but also of places elsewhere or of other things, like the
+# city of Cali in Colombia or the Labrador retriever. They only count as the whole location.
+SOLE_ALIASES = {
+    'california': ['cali'],
+    'newfoundland and labrador': ['labrador'],
+    'rhode island': ['providence'],
+    'saskatchewan': ['regina'],
+}
+
+# Phrases that contain a region name without being in that region
+BLOCKED_PHRASES = ['washington dc', 'washington d c', 'district of columbia']
+
+# Countries and cities outside Canada and the United States whose names no state, province or
+# city alias shares, which are often followed by a country code that is also a postal code
+FOREIGN_PLACES = ['india', 'mumbai', 'delhi', 'new delhi', 'bangalore', 'bengaluru', 'chennai',
+                  'kolkata', 'hyderabad', 'pakistan', 'karachi', 'lahore', 'germany',
+                  'deutschland', 'berlin', 'munich', 'hamburg', 'frankfurt', 'united kingdom',
+                  'england', 'scotland', 'wales', 'isle of man', 'ireland', 'nigeria', 'lagos',
+                  'kenya', 'nairobi', 'south africa', 'johannesburg', 'australia', 'philippines',
+                  'manila', 'indonesia', 'jakarta', 'malaysia', 'singapore', 'japan', 'tokyo',
+                  'china', 'hong kong', 'france', 'spain', 'madrid', 'barcelona', 'italy',
+                  'milan', 'netherlands', 'amsterdam', 'brazil', 'argentina', 'colombia',
+                  'bogota', 'chile', 'peru', 'lima', 'ecuador', 'venezuela', 'guyana',
+                  'mexico city']
+
+
+class _Entry:
+    """An alias stored at a node of the gazetteer's trie
+
+    Instance Attributes:
+        - code: The region code of the alias, BLOCKED or FOREIGN
+        - kind: REGION_NAME, CITY, POSTAL_CODE or SOLE
+        - words: The exact words of the alias if it is case-sensitive, otherwise None
+    """
+    code: int
+    kind: int
+    words: Optional[tuple[str, ...]]
+
+    def __init__(self, code: int, kind: int, words: Optional[tuple[str, ...]]) -> None:
+        self.code = code
+        self.kind = kind
+        self.words = words
+
+
+class Gazetteer:
+    """A matcher from free-text user locations to region codes, compiled into a trie of
+    lowercase words
+
+    A location is resolved in one left-to-right pass that takes the longest alias starting at
+    each word. The first state or province name or abbreviation wins, as does a sole alias
+    that is the whole location. Otherwise a two-letter postal code ending the location, where
+    just a country name may follow it, is taken over a city unless it is the code of the
+    city's own country. Neither a city nor a postal code counts if a foreign place is named.
+
+    Instance Attributes:
+        - size: The number of aliases in the gazetteer
+    """
+    size: int
+    _root: dict
+    _aliases: list[str]
+
+    def __init__(self) -> None:
+        self.size = 0
+        self._root = {}
+        self._aliases = []
+
+    def add(self, alias: str, code: int, kind: int = REGION_NAME) -> None:
+        """Adds an alias of the region with the given code, of the given kind
+
+        An alias with an uppercase letter only matches text written in exactly that case.
+
+        Preconditions:
+          - kind in {REGION_NAME, CITY, POSTAL_CODE, SOLE}
+        """
+        words = tuple(_WORD_PATTERN.findall(alias))
+        node = self._root
+        for word in words:
+            node = node.setdefault(word.lower(), {})
+        exact = words if any(c.isupper() for c in alias) else None
+        node.setdefault(None, []).append(_Entry(code, kind, exact))
+        self.size += 1
+        self._aliases.append(f'{alias}\0{code}\0{kind}')
+
+    def fingerprint(self) -> str:
+        """Returns a digest of every alias added, which changes whenever the aliases or the way
+        they are matched do"""
+        return hashlib.sha1('\n'.join([str(_RESOLVE_VERSION)] + self._aliases).encode()) \
+            .hexdigest()
+
+    def resolve(self, location: str) -> int:
+        """Returns the region code of the state or province named in location, or NO_REGION
+
+        >>> gazetteer = default_gazetteer()
+        >>> regions[gazetteer.resolve('Albany, New York')]
+        ('United States', 'new york')
+        >>> regions[gazetteer.resolve('Toronto, ON')]
+        ('Canada', 'ontario')
+        >>> regions[gazetteer.resolve('Portland, Maine')]
+        ('United States', 'maine')
+        >>> regions[gazetteer.resolve('Portland, ME')]
+        ('United States', 'maine')
+        >>> regions[gazetteer.resolve('Vancouver, WA')]
+        ('United States', 'washington')
+        >>> regions[gazetteer.resolve('Austin, TX, USA')]
+        ('United States', 'texas')
+        >>> gazetteer.resolve('living in the moment')
+        -1
+        >>> gazetteer.resolve('Washington, D.C.')
+        -1
+
+        Words that only look like abbreviations, and country codes, are not regions:
+
+        >>> [regions[gazetteer.resolve(location)][1] for location in
+        ...  ['La Jolla, California', 'Alta Loma, California', 'Del Mar, CA', 'Toronto, CA']]
+        ['california', 'california', 'california', 'ontario']
+        >>> [gazetteer.resolve(location) for location in
+        ...  ['La Crosse', 'Isle of Man', 'I am OK', 'Mumbai, IN', 'Berlin, DE']]
+        [-1, -1, -1, -1, -1]
+        >>> regions[gazetteer.resolve('La Crosse, WI')]
+        ('United States', 'wisconsin')
+
+        Names shared with places elsewhere only count on their own:
+
+        >>> [gazetteer.resolve(location) for location in
+        ...  ['Cali, Colombia', 'Cali Colombia', 'Providence, Guyana', 'Regina, Italy',
+        ...   'Halifax, England', 'Labrador retriever lover']]
+        [-1, -1, -1, -1, -1, -1]
+        >>> [regions[gazetteer.resolve(location)][1] for location in
+        ...  ['Cali', 'Regina', 'Regina, SK', 'Providence, RI']]
+        ['california', 'saskatchewan', 'saskatchewan', 'rhode island']
+        """
+        lowered = _WORD_PATTERN.findall(location.lower())
+        # The original case of the words is only needed for case-sensitive aliases
+        words = None
+        # Case-sensitive aliases like "IN" and "OR" only count at the end of an all caps text
+        shouting = location.isupper()
+        root = self._root
+        city, postal_code, foreign = NO_REGION, None, False
+
+        i = 0
+        while i < len(lowered):
+            node = root.get(lowered[i])
+            best, best_length = None, 0
+            end = i
+            while node is not None:
+                for entry in node.get(None, ()):
+                    if entry.kind == SOLE and (i != 0 or end != len(lowered) - 1):
+                        continue
+                    if entry.words is not None:
+                        if words is None:
+                            words = _original_words(location, lowered)
+                        if entry.words != tuple(words[i:end + 1]) or \
+                                (shouting and end != len(lowered) - 1):
+                            continue
+                    best, best_length = entry, end - i + 1
+                    break
+                end += 1
+                node = node.get(lowered[end]) if end < len(lowered) else None
+
+            if best is None:
+                i += 1
+                continue
+            if best.code == FOREIGN:
+                foreign = True
+            elif best.code == BLOCKED:
+                pass
+            elif best.kind in (REGION_NAME, SOLE):
+                return best.code
+            elif best.kind == CITY:
+                if city == NO_REGION:
+                    city = best.code
+            elif postal_code is None and \
+                    _ends_location(location, lowered, words, i, i + best_length):
+                postal_code = best
+            i += best_length
+
+        if foreign:
+            return NO_REGION
+        elif postal_code is None or (
+                city != NO_REGION
+                and ''.join(postal_code.words) == COUNTRY_CODES[regions[city][0]]):
+            # The code of the city's own country is not a region, as in "Toronto, CA"
+            return city
+        return postal_code.code
+
+
+def _ends_location(location: str, lowered: list[str], words: list[str], start: int,
+                   end: int) -> bool:
+    """Returns whether the words from start to end of a location may be a postal code ending
+    it: only the name of a country may follow them, and they must start the location, follow
+    punctuation or follow a capitalized word, as in "Austin, TX" or "Austin TX USA" but not
+    "I am OK"
+
+    words are the words of location in their original case.
+    """
+    if any(word not in _COUNTRY_WORDS for word in lowered[end:]):
+        return False
+    elif start == 0:
+        return True
+    spans = [match.span() for match in _WORD_PATTERN.finditer(location)]
+    if len(spans) != len(lowered):
+        return True
+    between = location[spans[start - 1][1]:spans[start][0]]
+    return between.strip() != '' or words[start - 1][:1].isupper()
+
+
+def _original_words(location: str, lowered: list[str]) -> list[str]:
+    """Returns the words of location in their original case, given its lowercase words"""
+    words = _WORD_PATTERN.findall(location)
+    # Lowercasing can change the length of a few characters and so split words differently
+    return words if len(words) == len(lowered) else lowered
+
+
+@functools.lru_cache(maxsize=None)
+def default_gazetteer() -> Gazetteer:
+    """Returns the gazetteer of every state and province name, abbreviation and city alias,
+    compiled on first use
+    """
+    gazetteer = Gazetteer()
+    for country in country_provinces:
+        for name in country_provinces[country]:
+            code = region_codes[(country, name)]
+            gazetteer.add(name, code)
+            for alias in ABBREVIATIONS.get(name, []):
+                letters = ''.join(_WORD_PATTERN.findall(alias))
+                gazetteer.add(alias, code, POSTAL_CODE if len(letters) == 2 and letters.isupper()
+                              else REGION_NAME)
+            for alias in CITY_ALIASES.get(name, []):
+                gazetteer.add(alias, code, CITY)
+            for alias in SOLE_ALIASES.get(name, []):
+                gazetteer.add(alias, code, SOLE)
+    for phrase in BLOCKED_PHRASES:
+        gazetteer.add(phrase, BLOCKED)
+    for place in FOREIGN_PLACES:
+        gazetteer.add(place, FOREIGN)
+    return gazetteer
+
+
+class LocationCache:
+    """A bounded least-recently-used cache from user locations to region codes
+
+    Locations are normalized by stripping them and collapsing runs of whitespace. Case is kept
+    since it decides whether abbreviations like "IN" match. Locations that name no region are
+    cached as NO_REGION like any other. The cache may be shared by several threads.
+
+    Instance Attributes:
+        - max_size: The most locations the cache remembers
+        - hits: The number of lookups answered by the cache
+        - misses: The number of lookups that had to be resolved
+    """
+    max_size: int
+    hits: int
+    misses: int
+    _codes: collections.OrderedDict
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int = LOCATION_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._codes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Returns the number of locations in the cache"""
+        return len(self._codes)
+
+    def resolve(self, location: str, gazetteer: Gazetteer) -> int:
+        """Returns the region code of location, resolving it with gazetteer if it is not cached
+
+        >>> cache = LocationCache(max_size=2)
+        >>> regions[cache.resolve('Austin,  TX', default_gazetteer())]
+        ('United States', 'texas')
+        >>> regions[cache.resolve(' Austin, TX', default_gazetteer())]
+        ('United States', 'texas')
+        >>> (cache.hits, cache.misses)
+        (1, 1)
+        """
+        key = ' '.join(location.split())
+        with self._lock:
+            code = self._codes.get(key)
+            if code is not None:
+                self.hits += 1
+                self._codes.move_to_end(key)
+                return code
+            self.misses += 1
+
+        code = gazetteer.resolve(key)
+        with self._lock:
+            self._codes[key] = code
+            if len(self._codes) > self.max_size:
+                self._codes.popitem(last=False)
+        return code
+
+    def hit_rate(self) -> float:
+        """Returns the share of lookups answered by the cache, or 0.0 if there were none"""
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def save(self, path: str, fingerprint: str) -> None:
+        """Writes the cached locations to a json file, tagged with the fingerprint of the
+        gazetteer that resolved them
+        """
+        with self._lock:
+            entries = list(self._codes.items())
+        # Threads and worker processes may save at the same time, so each writes its own
+        # temporary file
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'entries': entries}, f)
+        os.replace(temporary_path, path)
+
+    def load(self, path: str, fingerprint: str) -> bool:
+        """Adds the locations saved in a json file to the cache and returns whether that worked
+
+        Nothing is loaded if the file does not exist, cannot be read or was saved with a
+        different gazetteer, in which case the cache is filled again as locations are resolved.
+
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'location_cache.json')
+        >>> with open(path, 'w') as f:
+        ...     _ = f.write('{"fingerprint": "x", "entries": [["Ohio", 3')
+        >>> LocationCache().load(path, 'x')
+        False
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('fingerprint') != fingerprint:
+                return False
+            # Keep the most recently used entries if the file holds more than fit
+            entries = [(str(key), int(code)) for key, code in saved['entries'][-self.max_size:]]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return False
+        for key, code in entries:
+            self._codes[key] = code
+        while len(self._codes) > self.max_size:
+            self._codes.popitem(last=False)
+        return True
+
+
+@functools.lru_cache(maxsize=None)
+def default_location_cache() -> LocationCache:
+    """Returns the location cache used by resolve_region, warm-loaded from
+    LOCATION_CACHE_PATH on first use
+    """
+    cache = LocationCache()
+    cache.load(LOCATION_CACHE_PATH, default_gazetteer().fingerprint())
+    return cache
+
+
+def save_location_cache() -> None:
+    """Saves the location cache used by resolve_region to LOCATION_CACHE_PATH, if the data
+    directory exists
+    """
+    if os.path.isdir(os.path.dirname(LOCATION_CACHE_PATH)):
+        default_location_cache().save(LOCATION_CACHE_PATH, default_gazetteer().fingerprint())
+
+
+def resolve_region(location: str) -> int:
+    """Returns the region code of the state or province named in location, or NO_REGION
+
+    Locations are looked up in the default location cache before being resolved.
+
+    >>> regions[resolve_region('British Columbia, Canada')]
+    ('Canada', 'british columbia')
+    """
+    return default_location_cache().resolve(location, default_gazetteer())
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'functools', 'hashlib', 'json', 'os', 're', 'threading',
+                          'typing', 'country_provinces'],
+        'allowed-io': ['LocationCache.save', 'LocationCache.load'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -0,0 +1,340 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Preparing the map boundaries: simplifying them and storing them as compact TopoJSON.
+
+The boundaries are quantized to a grid and cut into arcs at the points where borders meet.
+A border shared by two regions becomes a single arc that both use, so simplifying every arc
+once keeps neighbouring regions fitting together without gaps or overlaps. The prepared
+topology is cached next to the boundary files and only rebuilt when one of them changes.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import json
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+# How far, in degrees, simplified boundaries may stray from the original ones
+DEFAULT_TOLERANCE = 0.01
+
+# The size, in degrees, of the grid boundaries are quantized to
+DEFAULT_STEP = 0.001
+
+# Where the prepared topology is cached
+TOPOLOGY_CACHE = os.path.join('data', 'boundaries.topojson')
+
+# Bumped whenever the preparation changes, so old caches are rebuilt
+TOPOLOGY_VERSION = 1
+
+# The feature properties kept in the topology; the map only shows names
+KEPT_PROPERTIES = ('name',)
+
+Point = tuple[int, int]
+
+
+def prepared_topology(sources: dict[str, str], tolerance: float = DEFAULT_TOLERANCE,
+                      step: float = DEFAULT_STEP, cache_path: Optional[str] = TOPOLOGY_CACHE) \
+        -> bytes:
+    """Returns the serialized topology of the GeoJSON files in sources, which maps the name of
+    each object of the topology to the path of its file
+
+    The topology is read from cache_path when it was prepared from the current files with the
+    same tolerance and step, and is prepared and written there otherwise, including when the
+    cached file cannot be read or decoded.
+
+    Preconditions:
+      - tolerance >= 0
+      - step > 0
+    """
+    signature = {'version': TOPOLOGY_VERSION, 'tolerance': tolerance, 'step': step,
+                 'sources': {name: [os.stat(path).st_size, os.stat(path).st_mtime_ns]
+                             for name, path in sources.items()}}
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+            cached = json.loads(data)
+        except (OSError, ValueError):
+            # A corrupt cache is prepared again like an out of date one
+            cached = None
+        if isinstance(cached, dict) and cached.get('signature') == signature:
+            return data
+
+    collections = {}
+    for name, path in sources.items():
+        with open(path) as f:
+            collections[name] = json.load(f)
+    topology = build_topology(collections, tolerance, step)
+    topology['signature'] = signature
+    data = serialize(topology)
+
+    if cache_path is not None:
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary_path, 'wb') as f:
+                f.write(data)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            # Caching is only an optimization; carry on without it
+            pass
+    return data
+
+
+def serialize(topology: dict) -> bytes:
+    """Returns a topology as compact json"""
+    return json.dumps(topology, separators=(',', ':')).encode()
+
+
+def build_topology(collections: dict[str, dict], tolerance: float = DEFAULT_TOLERANCE,
+                   step: float = DEFAULT_STEP) -> dict:
+    """Returns a TopoJSON topology of the given GeoJSON feature collections, with an object of
+    the same name for each, simplified so that no boundary strays more than about tolerance
+    degrees from where it was
+
+    Only polygon and multipolygon features are kept. Coordinates are quantized to a grid of
+    step degrees, and arcs are delta-encoded, as the TopoJSON format allows.
+
+    Preconditions:
+      - tolerance >= 0
+      - step > 0
+    """
+    bounds = np.array([(x, y) for collection in collections.values()
+                       for feature in collection['features']
+                       for ring in _rings(feature['geometry']) for x, y, *_ in ring])
+    origin = bounds.min(axis=0) if len(bounds) else np.zeros(2)
+
+    # Quantize every ring, dropping points that fall on the same grid point as the one before
+    shapes = {}
+    for name, collection in collections.items():
+        shapes[name] = []
+        for feature in collection['features']:
+            polygons = [[_quantize(ring, origin, step) for ring in polygon]
+                        for polygon in _polygons(feature['geometry'])]
+            polygons = [[ring for ring in polygon if len(ring) >= 4] for polygon in polygons]
+            shapes[name].append((feature, [polygon for polygon in polygons if polygon]))
+
+    rings = [ring for features in shapes.values() for _, polygons in features
+             for polygon in polygons for ring in polygon]
+    junctions = _junctions(rings)
+
+    arcs = []
+    arc_indices = {}
+    objects = {}
+    for name, features in shapes.items():
+        geometries = []
+        for feature, polygons in features:
+            if not polygons:
+                continue
+            arc_polygons = [[_ring_arcs(ring, junctions, arcs, arc_indices, tolerance / step)
+                             for ring in polygon] for polygon in polygons]
+            geometry = {'type': 'Polygon', 'arcs': arc_polygons[0]} if len(arc_polygons) == 1 \
+                else {'type': 'MultiPolygon', 'arcs': arc_polygons}
+            if 'id' in feature:
+                geometry['id'] = feature['id']
+            geometry['properties'] = {key: value for key, value
+                                      in feature.get('properties', {}).items()
+                                      if key in KEPT_PROPERTIES}
+            geometries.append(geometry)
+        objects[name] = {'type': 'GeometryCollection', 'geometries': geometries}
+
+    return {'type': 'Topology',
+            'transform': {'scale': [step, step], 'translate': origin.tolist()},
+            'objects': objects,
+            'arcs': [_delta_encode(arc) for arc in arcs]}
+
+
+def topology_features(topology: dict) -> dict[str, dict]:
+    """Returns the GeoJSON feature collection of every object of a topology
+
+    Coordinates are rounded to the precision of the topology's grid.
+
+    >>> square = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'id': 'A',
+    ...     'properties': {'name': 'A', 'area': 1}, 'geometry': {'type': 'Polygon',
+    ...     'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}}]}
+    >>> feature = topology_features(build_topology({'squares': square}))['squares']['features'][0]
+    >>> feature['id'], feature['properties'], feature['geometry']['coordinates']
+    ('A', {'name': 'A'}, [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]])
+    """
+    scale = np.array(topology['transform']['scale'])
+    translate = np.array(topology['transform']['translate'])
+    digits = max(0, math.ceil(-math.log10(min(scale))))
+    arcs = [np.round(np.cumsum(np.array(arc), axis=0) * scale + translate, digits).tolist()
+            for arc in topology['arcs']]
+
+    def ring_coordinates(indices: list[int]) -> list[list[float]]:
+        """Returns the coordinates of a ring made of the arcs with the given indices"""
+        coordinates = []
+        for index in indices:
+            arc = arcs[index] if index >= 0 else arcs[~index][::-1]
+            coordinates.extend(arc if not coordinates else arc[1:])
+        return coordinates
+
+    collections = {}
+    for name, collection in topology['objects'].items():
+        features = []
+        for geometry in collection['geometries']:
+            if geometry['type'] == 'Polygon':
+                coordinates = [ring_coordinates(ring) for ring in geometry['arcs']]
+            else:
+                coordinates = [[ring_coordinates(ring) for ring in polygon]
+                               for polygon in geometry['arcs']]
+            feature = {'type': 'Feature', 'properties': geometry.get('properties', {}),
+                       'geometry': {'type': geometry['type'], 'coordinates': coordinates}}
+            if 'id' in geometry:
+                feature['id'] = geometry['id']
+            features.append(feature)
+        collections[name] = {'type': 'FeatureCollection', 'features': features}
+    return collections
+
+
+def _polygons(geometry: dict) -> list[list[list]]:
+    """Returns the polygons of a polygon or multipolygon geometry, and none of any other"""
+    if geometry is None:
+        return []
+    elif geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    else:
+        return []
+
+
+def _rings(geometry: dict) -> list[list]:
+    """Returns every ring of a polygon or multipolygon geometry"""
+    return [ring for polygon in _polygons(geometry) for ring in polygon]
+
+
+def _quantize(ring: list, origin: np.ndarray, step: float) -> list[Point]:
+    """Returns the points of a ring on the grid of the given step, without repeats of the
+    previous point, and closed"""
+    points = []
+    for x, y, *_ in ring:
+        point = (round((x - origin[0]) / step), round((y - origin[1]) / step))
+        if not points or point != points[-1]:
+            points.append(point)
+    if points and points[0] != points[-1]:
+        points.append(points[0])
+    return points
+
+
+def _junctions(rings: list[list[Point]]) -> set[Point]:
+    """Returns the points where borders meet: the points with more than two neighbours over
+    every ring
+
+    A point inside a border shared by two regions has the same two neighbours in both of their
+    rings, so only the ends of the shared part are junctions.
+    """
+    neighbours = {}
+    for ring in rings:
+        # Rings are closed, so ring[-2] comes before ring[0]
+        for previous, point, following in zip(ring[-2:-1] + ring[:-2], ring[:-1], ring[1:]):
+            neighbours.setdefault(point, set()).update((previous, following))
+    return {point for point, around in neighbours.items() if len(around) > 2}
+
+
+def _ring_arcs(ring: list[Point], junctions: set[Point], arcs: list[list[Point]],
+               arc_indices: dict[tuple, int], tolerance: float) -> list[int]:
+    """Returns the indices of the arcs a ring is made of, adding any new arcs, simplified,
+    to arcs
+
+    arc_indices maps the points of every arc added so far to its index, so an arc shared with
+    another ring, in either direction, is only added and simplified once. Indices of arcs used
+    backwards are written ~index, as in TopoJSON.
+    """
+    points = ring[:-1]
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    if not cuts:
+        # A ring with no junction, like an island, starts at its smallest point, so that a
+        # region enclosing it has the same arc
+        start = points.index(min(points))
+        pieces = [points[start:] + points[:start + 1]]
+    else:
+        points = points[cuts[0]:] + points[:cuts[0]]
+        cuts = [cut - cuts[0] for cut in cuts] + [len(points)]
+        points = points + points[:1]
+        pieces = [points[start:end + 1] for start, end in zip(cuts, cuts[1:])]
+
+    indices = []
+    for piece in pieces:
+        key = tuple(piece)
+        backwards = key[::-1]
+        if key in arc_indices:
+            indices.append(arc_indices[key])
+        elif backwards in arc_indices:
+            indices.append(~arc_indices[backwards])
+        else:
+            arc_indices[key] = len(arcs)
+            indices.append(len(arcs))
+            arcs.append(_simplify_arc(piece, tolerance))
+    return indices
+
+
+def _simplify_arc(arc: list[Point], tolerance: float) -> list[Point]:
+    """Returns the points of an arc kept by Douglas-Peucker simplification with the given
+    tolerance, in grid steps
+
+    The point farthest from the ends of the arc is always kept, as are both points farthest
+    from each other on a closed arc, so that no ring collapses to a line.
+    """
+    points = np.array(arc, dtype=np.float64)
+    if len(points) <= 2:
+        return arc
+    if arc[0] == arc[-1]:
+        far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+        first = _simplify_arc(arc[:far + 1], tolerance)
+        return first + _simplify_arc(arc[far:], tolerance)[1:]
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1, True)]
+    while stack:
+        start, end, forced = stack.pop()
+        if end - start < 2:
+            continue
+        distances = _segment_distances(points[start + 1:end], points[start], points[end])
+        far = start + 1 + int(np.argmax(distances))
+        if forced or distances[far - start - 1] > tolerance:
+            keep[far] = True
+            stack.append((start, far, False))
+            stack.append((far, end, False))
+    return [arc[i] for i in np.flatnonzero(keep)]
+
+
+def _segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Returns the distance of every point to the segment from start to end"""
+    direction = end - start
+    length = direction @ direction
+    if length == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start) @ direction / length, 0.0, 1.0)
+    return np.hypot(*(points - start - t[:, None] * direction).T)
+
+
+def _delta_encode(arc: list[Point]) -> list[list[int]]:
+    """Returns the points of an arc as the first point followed by the offset of every point
+    from the one before"""
+    return [list(arc[0])] + [[x - px, y - py] for (px, py), (x, y) in zip(arc, arc[1:])]
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['json', 'math', 'os', 'typing', 'numpy'],
+        'allowed-io': ['prepared_topology'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -5,208 +5,528 @@ Copyright and Usage Information
 This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
 """
 import datetime
-import io
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Optional
 
-import folium
 import pandas as pd
-from PyQt5 import QtWidgets, QtWebEngineWidgets
+from PyQt5 import QtCore, QtWidgets, QtWebEngineCore, QtWebEngineWidgets
 
-from covid_data import CovidData
-from tweet import get_tweets
 from country_provinces import all_provinces
+from data_service import DataService
+from geometry import DEFAULT_TOLERANCE
+import map_page
+import tracing
+from timeline import build_timeline
+
+if TYPE_CHECKING:
+    import folium
+
+# Worker processes get_tweets uses for each date; 1 scores in the loading thread itself
+SENTIMENT_WORKERS = 1
+
+# Seconds the first, approximate sentiment map of a date whose totals are not stored yet may
+# take. The exact map replaces it once it has loaded.
+APPROXIMATE_SECONDS = 1.0
+
+# Map pages are loaded from this scheme, which also serves them the map boundaries
+URL_SCHEME = b'coveet'
+PAGE_URL = 'coveet://map/'
+BOUNDARIES_URL = PAGE_URL + 'boundaries.topojson'
+
+
+def register_url_scheme() -> None:
+    """Registers the scheme map pages and boundaries are served from
+
+    This must be called before the QApplication is created.
+    """
+    scheme = QtWebEngineCore.QWebEngineUrlScheme(URL_SCHEME)
+    scheme.setSyntax(QtWebEngineCore.QWebEngineUrlScheme.Syntax.Host)
+    scheme.setDefaultPort(QtWebEngineCore.QWebEngineUrlScheme.PortUnspecified)
+    scheme.setFlags(QtWebEngineCore.QWebEngineUrlScheme.SecureScheme
+                    | QtWebEngineCore.QWebEngineUrlScheme.CorsEnabled)
+    QtWebEngineCore.QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class _BoundaryHandler(QtWebEngineCore.QWebEngineUrlSchemeHandler):
+    """Serves the simplified map boundaries to the map pages, from a topology serialized once
+
+    Each map page fetches the boundaries once and then restyles them in place, so the
+    boundaries are never part of a page's html.
+    """
+    _topology: Callable[[], bytes]
+
+    def __init__(self, topology: Callable[[], bytes], parent: QtCore.QObject) -> None:
+        super().__init__(parent)
+        self._topology = topology
+
+    def requestStarted(self, job: QtWebEngineCore.QWebEngineUrlRequestJob) -> None:
+        """Replies to a request for the boundaries, and fails any other request"""
+        if job.requestUrl() != QtCore.QUrl(BOUNDARIES_URL):
+            job.fail(QtWebEngineCore.QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        data = self._topology()
+        tracing.count('gui.boundary_bytes', len(data))
+        buffer = QtCore.QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QtCore.QIODevice.ReadOnly)
+        job.reply(b'application/json', buffer)
+
+
+def _serve_boundaries(service: DataService, window: QtCore.QObject) -> _BoundaryHandler:
+    """Returns a handler that serves the boundaries of a service to the pages of a window,
+    installed on the default profile
+
+    A scheme has one handler per profile, so the newest window serves the boundaries.
+    """
+    profile = QtWebEngineWidgets.QWebEngineProfile.defaultProfile()
+    profile.removeUrlScheme(URL_SCHEME)
+    handler = _BoundaryHandler(service.topology, window)
+    profile.installUrlSchemeHandler(URL_SCHEME, handler)
+    return handler
+
+
+class _LoaderSignals(QtCore.QObject):
+    """The signals of a _DataLoader, delivered to the UI thread
+
+    approximated carries the date and approximate data shown until its data has loaded, loaded
+    carries the date and its data, and failed carries the date and an error message.
+    """
+    approximated = QtCore.pyqtSignal(str, object)
+    loaded = QtCore.pyqtSignal(str, object)
+    failed = QtCore.pyqtSignal(str, str)
+
+
+class _DataLoader(QtCore.QRunnable):
+    """A task that loads the data of one date, or of a range of dates, on a worker thread
+
+    Instance Attributes:
+        - date_str: The date to load, in "Year-Month-Date" format, the range to load, in
+          "Year-Month-Date:Year-Month-Date" format, or '' for the dates that have data
+        - approximate: Whether to report approximate data first, if there is any
+        - signals: The signals the result is reported through
+    """
+    date_str: str
+    approximate: bool
+    signals: _LoaderSignals
+    _load: Callable[[str, Optional[Callable[[dict], None]]], object]
+
+    def __init__(self, date_str: str,
+                 load: Callable[[str, Optional[Callable[[dict], None]]], object],
+                 approximate: bool) -> None:
+        super().__init__()
+        # Kept alive by its map so that a queued loader can be taken back from the pool
+        self.setAutoDelete(False)
+        self.date_str = date_str
+        self.approximate = approximate
+        self.signals = _LoaderSignals()
+        self._load = load
+
+    def run(self) -> None:
+        """Loads the data and reports it, or the error that stopped it"""
+        report = None
+        if self.approximate:
+            def report(result: dict) -> None:
+                self.signals.approximated.emit(self.date_str, result)
+        try:
+            result = self._load(self.date_str, report)
+        except Exception as error:  # reported to the UI rather than lost in the thread
+            self.signals.failed.emit(self.date_str, str(error))
+        else:
+            self.signals.loaded.emit(self.date_str, result)
+
+
+class _MapPane:
+    """The map and value display of one map mode in a ChoroplethMap window
+
+    Representation Invariants:
+      - self.mode in {'covid','sentiment','correlation'}
+
+    Instance Attributes:
+        - mode: The map mode shown by this pane
+        - view: The web view the map page is shown in
+        - value_display: The label showing the value of the selected region
+    """
+    mode: str
+    view: QtWebEngineWidgets.QWebEngineView
+    value_display: QtWidgets.QLabel
+    _legend_name: str
+    _ca_data: Optional[pd.DataFrame] = None
+    _us_data: Optional[pd.DataFrame] = None
+    _bins: list[float]
+    _map: Optional['folium.Map'] = None
+    _page_loaded: bool = False
+    _pending_payload: Optional[dict] = None
+
+    def __init__(self, mode: str) -> None:
+        self.mode = mode
+        self._legend_name = map_page.LEGEND_NAMES[mode]
+        self.view = QtWebEngineWidgets.QWebEngineView()
+        self.view.setContentsMargins(25, 25, 25, 25)
+        self.view.loadFinished.connect(self._on_load_finished)
+        self.value_display = QtWidgets.QLabel()
+
+    def show(self, result: tuple, geometry: tuple[dict, dict]) -> None:
+        """Displays the Canadian data, the American data and the bins of a date"""
+        self._ca_data, self._us_data, self._bins = result
+        self.render_map(geometry)
+
+    def render_map(self, geometry: tuple[dict, dict]) -> None:
+        """Renders a map with current data
+
+        The map page is only built the first time, from the given parsed boundaries, and
+        fetches their shapes from the url scheme. Later renders send the new region colours
+        and legend to the loaded page, which restyles its layers in place.
+        """
+        with tracing.span('map.restyle_payload'):
+            payload = map_page.restyle_payload(self.mode, self._ca_data, self._us_data,
+                                               self._bins, self._legend_name)
+
+        if self._map is None:
+            with tracing.span('map.build'):
+                self._map = map_page.build_map(self.mode, self._ca_data, self._us_data,
+                                               self._bins, self._legend_name, geometry,
+                                               BOUNDARIES_URL)
+            self._pending_payload = payload
+            html = map_page.map_html(self._map)
+            with tracing.span('gui.set_html'):
+                self.view.setHtml(html, QtCore.QUrl(PAGE_URL))
+        elif not self._page_loaded:
+            # The page applies the latest payload once it has loaded
+            self._pending_payload = payload
+        else:
+            self._run_restyle(payload)
+
+    def _on_load_finished(self, ok: bool) -> None:
+        """Callback that applies any restyle requested while the map page was loading
+        """
+        self._page_loaded = ok
+        if ok and self._pending_payload is not None:
+            self._run_restyle(self._pending_payload)
+            self._pending_payload = None
+
+    def _run_restyle(self, payload: dict) -> None:
+        """Sends a restyle payload to the loaded map page"""
+        script = map_page.restyle_script(payload)
+        with tracing.span('gui.run_javascript'):
+            self.view.page().runJavaScript(script)
+
+    def regions(self) -> set[str]:
+        """Returns the regions with data on the shown date"""
+        if self._ca_data is None:
+            return set()
+        ca_column, us_column = (columns[0] for columns in map_page.MAP_COLUMNS[self.mode])
+        return set(self._ca_data[ca_column]) | set(self._us_data[us_column])
+
+    def update_region(self, text: str) -> None:
+        """Updates the value display to show the value of a region
+        """
+        if self._ca_data is None:
+            # Nothing has loaded yet
+            return
+
+        if self.mode == 'covid':
+            cases = 'NAN'
+            if text in self._ca_data['Province'].values:
+                cases = self._ca_data.loc[self._ca_data['Province'] == text].values[0][1]
+            elif text in self._us_data['State Name'].values:
+                cases = self._us_data.loc[self._us_data['State Name'] == text].values[0][1]
+            self.value_display.setText("New COVID Cases: " + str(cases))
+
+        else:
+            rows = self._ca_data.loc[self._ca_data['location'] == text]
+            if rows.empty:
+                rows = self._us_data.loc[self._us_data['location'] == text]
+
+            if rows.empty and self.mode == 'correlation':
+                self.value_display.setText("Sentiment/Cases Correlation: NAN")
+            elif rows.empty:
+                self.value_display.setText("Avg. TWITTER Sentiment: NAN")
+            elif self.mode == 'correlation':
+                row = rows.iloc[0]
+                self.value_display.setText(
+                    " Sentiment/Cases Correlation: " + str(round(row['value'], 3))
+                    + f"\n over {row['days']} days to this date")
+            elif 'ci' in rows.columns:
+                # An approximation, shown until the exact data has loaded
+                row = rows.iloc[0]
+                self.value_display.setText(
+                    " Avg. TWITTER Sentiment: " + str(round(row['value'], 3))
+                    + f" \u00b1 {row['ci']:.3f} (95%)"
+                    + f"\n sample of {row['sample']} of ~{row['count']} tweets, refining..."
+                    + f"\n {row['positive']:.0%} positive, {row['negative']:.0%} negative")
+            else:
+                row = rows.iloc[0]
+                self.value_display.setText(
+                    " Avg. TWITTER Sentiment: " + str(round(row['value'], 5))
+                    + f"\n {row['count']} tweets, std. {row['std']:.3f}"
+                    + f"\n {row['positive']:.0%} positive, {row['negative']:.0%} negative")
 
 
 class ChoroplethMap(QtWidgets.QMainWindow):
-    """A class representing a choropleth map.
+    """A class representing a choropleth map, or several side by side for comparison.
+
+    One date selector, with a time slider, and one region selector drive the maps of every
+    mode, whose data is fetched together from a shared DataService. The dates and regions to
+    choose from are the ones the data has, and the dates are found on the thread pool, since
+    they may wait for the covid data to load.
 
     Representation Invariants:
-      - self.mode in {'covid','sentiment'}
+      - self._modes != []
+      - all(mode in {'covid','sentiment','correlation'} for mode in self._modes)
     """
-    _mode: str
-    _view: QtWebEngineWidgets.QWebEngineView
+    _modes: list[str]
+    _service: DataService
+    _panes: list[_MapPane]
     _selectable_dates: list[str]
     _selectable_regions: list[str]
-    _covid_data: CovidData
-    _ca_data: pd.DataFrame
-    _us_data: pd.DataFrame
-    _bins: list[int]  # double check
-    _legend_name: str
+    _current_date: str
+    _loaders: dict[str, _DataLoader]
+    _dates_loader: _DataLoader
+    _thread_pool: QtCore.QThreadPool
     _date_selector: QtWidgets.QComboBox
     _region_selector: QtWidgets.QComboBox
-    _value_display: QtWidgets.QLabel
-    _map: Optional[folium.folium.Map] = None
-    _america_choropleth: Optional[folium.Choropleth] = None
-    _canada_choropleth: Optional[folium.Choropleth] = None
+    _date_slider: QtWidgets.QSlider
+    _refresh_button: QtWidgets.QPushButton
+    _boundary_handler: _BoundaryHandler
 
-    def __init__(self, mode: str) -> None:
-        """Initializes a ChoroplethMap object.
+    def __init__(self, modes: list[str], service: Optional[DataService] = None) -> None:
+        """Initializes a ChoroplethMap object showing a map for each of the given modes.
 
         Preconditions:
-          - mode in {'covid','sentiment'}
+          - modes != []
+          - all(mode in {'covid','sentiment','correlation'} for mode in modes)
         """
         super().__init__()
-        self._mode = mode
+        self._modes = modes
+        if service is None:
+            service = DataService(sentiment_workers=SENTIMENT_WORKERS)
+            service.preload(modes)
+        self._service = service
+
+        self._boundary_handler = _serve_boundaries(service, self)
+        self._panes = [_MapPane(mode) for mode in modes]
 
         # Window initialization
         self.setWindowTitle(self.tr("COVEET TRACKER"))
-        self.setFixedSize(900, 900)
+        self.setFixedSize(900 * len(modes), 900)
 
         # GUI initialization
-        self._view = QtWebEngineWidgets.QWebEngineView()
-        self._view.setContentsMargins(25, 25, 25, 25)
         base_frame = QtWidgets.QWidget()
         self.setCentralWidget(base_frame)
-        h_layout = QtWidgets.QHBoxLayout(base_frame)
+        base_layout = QtWidgets.QVBoxLayout(base_frame)
+        h_layout = QtWidgets.QHBoxLayout()
+        base_layout.addLayout(h_layout, stretch=1)
 
-        # Initialize selectable regions and dates
-        self._selectable_dates = ['2020-08-01', '2020-10-01', '2020-12-01',
-                                  '2021-02-01', '2021-04-01', '2021-06-01',
-                                  '2021-08-01', '2021-10-01', '2021-12-01']
+        # Selectable dates are filled in once they have loaded, and regions are narrowed down
+        # to the ones with data once a date has loaded
+        self._selectable_dates = []
         self._selectable_regions = all_provinces
+        self._current_date = ''
 
-        # Initialize covid/sentiment data
-        if self._mode == "covid":
-            self._covid_data = CovidData()
-            self._ca_data, self._us_data, self._bins = \
-                self._covid_data.get_data(self.parse_date_str(self._selectable_dates[0]))
-            self._legend_name = 'daily cases'
-        else:
-            # mode == 'sentiment'
-            self._ca_data, self._us_data \
-                = get_tweets(self.parse_date_str(self._selectable_dates[0]))
-            self._bins = [-1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1]
-            self._legend_name = 'sentiment score'
+        # Data is loaded on worker threads and cached by the service
+        self._loaders = {}
+        self._thread_pool = QtCore.QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(2)
 
         # Define date selector and region selector
         self._date_selector = QtWidgets.QComboBox()
-        self._date_selector.addItems(self._selectable_dates)
         self._date_selector.activated[str].connect(self.update_date)
 
+        # The slider only changes the date once it is released, so dragging it across many
+        # dates does not start loading each of them
+        self._date_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self._date_slider.setRange(0, 0)
+        self._date_slider.setTracking(False)
+        self._date_slider.sliderMoved.connect(self._date_selector.setCurrentIndex)
+        self._date_slider.valueChanged.connect(
+            lambda i: self.update_date(self._selectable_dates[i]))
+        base_layout.addWidget(self._date_slider)
+
         self._region_selector = QtWidgets.QComboBox()
         self._region_selector.addItems(self._selectable_regions)
         self._region_selector.activated[str].connect(self.update_region)
 
-        # Define value display, with default values pre-calculated using default date and region
-        self._value_display = QtWidgets.QLabel()
-        if self._mode == 'covid':
-            self._value_display.setText('New COVID Cases: 0')
-        else:
-            self._value_display.setText('Avg. TWITTER Sentiment: -0.01649')
+        self._refresh_button = QtWidgets.QPushButton(self.tr("Refresh"))
+        self._refresh_button.clicked.connect(self.refresh)
 
         adjust_frame = QtWidgets.QWidget()
         v_layout = QtWidgets.QVBoxLayout(adjust_frame)
 
         v_layout.addWidget(self._date_selector)
         v_layout.addWidget(self._region_selector)
-        v_layout.addWidget(self._value_display)
+        v_layout.addWidget(self._refresh_button)
+        # Value displays are filled in once the first date has loaded
+        for pane in self._panes:
+            v_layout.addWidget(pane.value_display)
         h_layout.addWidget(adjust_frame)
-        h_layout.addWidget(self._view, stretch=1)
-
-        # Draw the map in the window
-        self.render_map()
-
-    def render_map(self) -> None:
-        """Renders a map with current data"""
-        self._map = folium.Map(location=[40, -95], zoom_start=3, tiles="Stamen Terrain")
-
-        # Choropleth configuration
-        if self._mode == 'covid':
-            c1 = ["Province", "DailyTotals"]
-            c2 = ["State Name", "7-day Avg Cases"]
+        for pane in self._panes:
+            h_layout.addWidget(pane.view, stretch=1)
+
+        # Draw the maps in the window once the dates and then the first date have loaded
+        for pane in self._panes:
+            pane.value_display.setText('Loading dates...')
+        self._refresh_button.setEnabled(False)
+        self._dates_loader = _DataLoader('', self._load_dates, approximate=False)
+        self._dates_loader.signals.loaded.connect(self._on_dates_loaded)
+        self._dates_loader.signals.failed.connect(self._on_dates_failed)
+        self._thread_pool.start(self._dates_loader, 2)
+
+    def _load_dates(self, _: str, __: Optional[Callable[[dict], None]]) -> list[str]:
+        """Returns the dates that have data for every mode, in "Year-Month-Date" format
+
+        This runs on a worker thread.
+        """
+        return [date.strftime('%Y-%m-%d') for date in self._service.dates(self._modes)]
+
+    def _on_dates_loaded(self, _: str, dates: list[str]) -> None:
+        """Callback that fills in the selectable dates and shows the first of them"""
+        self._selectable_dates = dates
+        self._date_selector.addItems(dates)
+        self._date_slider.setRange(0, max(len(dates) - 1, 0))
+        if dates:
+            self._refresh_button.setEnabled(True)
+            self.update_date(dates[0])
         else:
-            c1 = ["location", "value"]
-            c2 = ["location", "value"]
-
-        self._canada_choropleth = folium.Choropleth(
-            geo_data="data/canada_provinces.geojson",
-            name="Canada",
-            data=self._ca_data,
-            columns=c1,
-            key_on="feature.properties.name",
-            fill_color="YlOrRd",
-            fill_opacity=0.7,
-            line_opacity=.1,
-            _legend_name=self._legend_name,
-            highlight=True,
-            bins=self._bins
-        )
-        self._canada_choropleth.add_to(self._map)
-
-        self._america_choropleth = folium.Choropleth(
-            geo_data="data/us_states.json",
-            name="America",
-            data=self._us_data,
-            columns=c2,
-            key_on="feature.id",
-            fill_color="YlOrRd",
-            fill_opacity=0.7,
-            line_opacity=.1,
-            _legend_name="America",
-            highlight=True,
-            bins=self._bins
-        )
-        self._america_choropleth.add_to(self._map)
-
-        # An issue under foilum's GitHub page highlighted that
-        # this is the only way to hide a legend for now
-        for key in self._america_choropleth._children:
-            if key.startswith('color_map'):
-                del self._america_choropleth._children[key]
-
-        self._canada_choropleth.geojson.add_child(
-            folium.features.GeoJsonTooltip(['name'], labels=False)
-        )
-
-        self._america_choropleth.geojson.add_child(
-            folium.features.GeoJsonTooltip(['name'], labels=False)
-        )
-
-        folium.LayerControl().add_to(self._map)  # add layer control and toggling to the map
-
-        data = io.BytesIO()
-        self._map.save(data, close_file=False)
-        self._view.setHtml(data.getvalue().decode())
+            for pane in self._panes:
+                pane.value_display.setText('No dates have data')
+
+    def _on_dates_failed(self, _: str, message: str) -> None:
+        """Callback that reports dates that could not be loaded"""
+        for pane in self._panes:
+            pane.value_display.setText('Could not load the dates: ' + message)
 
     def update_date(self, text: str) -> None:
         """Callback that updates the loaded data when a new date is selected
+
+        Data that is not cached yet is loaded on a worker thread while the window shows a
+        loading state, or an approximate sentiment map if the date's tweets would take long to
+        score. Loads queued for dates the user has since moved away from are cancelled, and
+        the neighbouring dates are prefetched.
         """
-        if self._mode == 'covid':
-            self._ca_data, self._us_data, self._bins = \
-                self._covid_data.get_data(self.parse_date_str(text))
-        else:
-            self._ca_data, self._us_data = get_tweets(
-                self.parse_date_str(text))
+        with tracing.span('gui.update_date'):
+            self._current_date = text
+            index = self._selectable_dates.index(text)
+            self._date_selector.setCurrentIndex(index)
+            self._date_slider.blockSignals(True)
+            self._date_slider.setValue(index)
+            self._date_slider.blockSignals(False)
+            neighbours = self._neighbouring_dates(text)
+            self._cancel_loads(exclude={text} | set(neighbours))
+
+            results = self._service.cached(self.parse_date_str(text), self._modes)
+            if results is not None:
+                self._show(results)
+            else:
+                for pane in self._panes:
+                    pane.value_display.setText('Loading ' + text + '...')
+                self._start_load(text, priority=1)
 
-        # Update list of available regions to choose from
-        self._region_selector.clear()
-        self._region_selector.addItems(self._selectable_regions)
+            for date_str in neighbours:
+                if self._service.cached(self.parse_date_str(date_str), self._modes) is None:
+                    self._start_load(date_str, priority=0)
 
-        self.render_map()
+    def refresh(self) -> None:
+        """Callback that reloads the selected date, adding any tweets appended to its file
 
-    def update_region(self, text: str) -> None:
-        """Callback that updates the value display when a new region is selected
+        Only the new tweets are scored; the rest of the day comes from its stored state.
         """
-        if self._mode == 'covid':
-            cases = 'NAN'
-            if text in self._ca_data['Province'].values:
-                cases = self._ca_data.loc[self._ca_data['Province'] == text].values[0][1]
-            elif text in self._us_data['State Name'].values:
-                cases = self._us_data.loc[self._us_data['State Name'] == text].values[0][1]
-            self._value_display.setText("New COVID Cases: " + str(cases))
+        self._service.invalidate(self.parse_date_str(self._current_date))
+        self.update_date(self._current_date)
 
-        else:
-            sentiment = 'NAN'
-            if text in self._ca_data['location'].values:
-                sentiment = self._ca_data.loc[self._ca_data['location'] == text].values[0][1]
-            elif text in self._us_data['location'].values:
-                sentiment = self._us_data.loc[self._us_data['location'] == text].values[0][1]
-
-            if sentiment == 'NAN':
-                self._value_display.setText("Avg. TWITTER Sentiment: NAN")
-            else:
-                self._value_display.setText(" Avg. TWITTER Sentiment: " + str(round(sentiment, 5)))
+    def _neighbouring_dates(self, date_str: str) -> list[str]:
+        """Returns the selectable dates right before and after date_str"""
+        i = self._selectable_dates.index(date_str)
+        return self._selectable_dates[max(i - 1, 0):i] + self._selectable_dates[i + 1:i + 2]
+
+    def _load(self, date_str: str, report_approximation: Optional[Callable[[dict], None]]) \
+            -> dict[str, tuple]:
+        """Returns the Canadian data, the American data and the bins of every mode on a date
+
+        This runs on a worker thread. The map geometry is waited for and folium is imported
+        here as well, so that the first map can be built without blocking the UI thread. If a
+        profile was asked for, the first load is profiled.
+
+        If report_approximation is given and the date's sentiment is not stored yet, it is
+        first passed the results with the sentiment approximated within APPROXIMATE_SECONDS.
+        """
+        with tracing.profile(), tracing.span('gui.load'):
+            self._service.geometry()
+            map_page.load_folium()
+            date = self.parse_date_str(date_str)
+            if report_approximation is not None:
+                approximation = self._service.fetch_approximate(date, self._modes,
+                                                                APPROXIMATE_SECONDS)
+                if approximation is not None:
+                    report_approximation(approximation)
+            return self._service.fetch(date, self._modes)
+
+    def _start_load(self, date_str: str, priority: int) -> None:
+        """Starts loading a date on the thread pool, unless it is already being loaded
+
+        Only the selected date, which is loaded with a higher priority than prefetched ones,
+        is approximated first.
+        """
+        if date_str in self._loaders:
+            return
+        loader = _DataLoader(date_str, self._load, approximate=priority > 0)
+        loader.signals.approximated.connect(self._on_approximated)
+        loader.signals.loaded.connect(self._on_loaded)
+        loader.signals.failed.connect(self._on_failed)
+        self._loaders[date_str] = loader
+        self._thread_pool.start(loader, priority)
+
+    def _cancel_loads(self, exclude: set[str]) -> None:
+        """Cancels the loads of dates not in exclude that have not started running yet"""
+        for date_str, loader in list(self._loaders.items()):
+            if date_str not in exclude and self._thread_pool.tryTake(loader):
+                del self._loaders[date_str]
+
+    def _on_approximated(self, date_str: str, results: dict[str, tuple]) -> None:
+        """Callback that shows the approximate data of a date if it is selected and its exact
+        data has not been shown yet
+
+        The panes of modes that are still loading keep their loading state.
+        """
+        if date_str == self._current_date and date_str in self._loaders:
+            self._show(results)
+
+    def _on_loaded(self, date_str: str, results: dict[str, tuple]) -> None:
+        """Callback that shows the data of a loaded date if it is selected"""
+        self._loaders.pop(date_str, None)
+        if date_str == self._current_date:
+            self._show(results)
+
+    def _on_failed(self, date_str: str, message: str) -> None:
+        """Callback that reports a date that could not be loaded, if it is selected"""
+        self._loaders.pop(date_str, None)
+        if date_str == self._current_date:
+            for pane in self._panes:
+                pane.value_display.setText('Could not load ' + date_str + ': ' + message)
+
+    def _show(self, results: dict[str, tuple]) -> None:
+        """Displays the data of the modes of a date that are in results"""
+        with tracing.span('gui.show'):
+            geometry = self._service.geometry()
+            shown = [pane for pane in self._panes if pane.mode in results]
+            for pane in shown:
+                pane.show(results[pane.mode], geometry)
+
+            # Update list of available regions to choose from
+            present = set().union(*(pane.regions() for pane in shown))
+            self._selectable_regions = [region for region in all_provinces
+                                        if region in present] or all_provinces
+            region = self._region_selector.currentText()
+            self._region_selector.clear()
+            self._region_selector.addItems(self._selectable_regions)
+            self._region_selector.setCurrentText(region)
+            for pane in shown:
+                pane.update_region(self._region_selector.currentText())
+
+    def update_region(self, text: str) -> None:
+        """Callback that updates the value displays when a new region is selected
+        """
+        for pane in self._panes:
+            pane.update_region(text)
 
     def parse_date_str(self, date_str: str) -> datetime.datetime:
         """Returns a datetime.datetime object from a string in "Year-Month-Date" format"""
@@ -214,26 +534,146 @@ class ChoroplethMap(QtWidgets.QMainWindow):
         return datetime.datetime(int(year), int(month), int(day))
 
 
-def display_map(mode: str) -> None:
+class TimelineMap(QtWidgets.QMainWindow):
+    """A map that plays the covid cases, the sentiment or both of every day in a range
+
+    The value of every region on every day is loaded once, on a worker thread, into a single
+    page whose slider and play button recolour the map without going back to Python.
+
+    Representation Invariants:
+      - self._modes != []
+      - all(mode in {'covid','sentiment'} for mode in self._modes)
+      - self._start <= self._end
+    """
+    _modes: list[str]
+    _start: datetime.datetime
+    _end: datetime.datetime
+    _sentiment_window: int
+    _service: DataService
+    _view: QtWebEngineWidgets.QWebEngineView
+    _status: QtWidgets.QLabel
+    _loader: _DataLoader
+    _thread_pool: QtCore.QThreadPool
+    _boundary_handler: _BoundaryHandler
+
+    def __init__(self, modes: list[str], start: datetime.datetime, end: datetime.datetime,
+                 service: Optional[DataService] = None, sentiment_window: int = 1) -> None:
+        """Initializes a TimelineMap object playing the given modes from start to end inclusive,
+        with the sentiment of each day averaged over the sentiment_window days ending on it
+
+        Preconditions:
+          - modes != []
+          - all(mode in {'covid','sentiment'} for mode in modes)
+          - start <= end
+          - sentiment_window >= 1
+        """
+        super().__init__()
+        self._modes = modes
+        self._start, self._end = start, end
+        self._sentiment_window = sentiment_window
+        if service is None:
+            service = DataService(sentiment_workers=SENTIMENT_WORKERS)
+            service.preload(modes)
+        self._service = service
+        self._boundary_handler = _serve_boundaries(service, self)
+
+        self.setWindowTitle(self.tr("COVEET TIMELINE"))
+        self.setFixedSize(900, 900)
+        base_frame = QtWidgets.QWidget()
+        self.setCentralWidget(base_frame)
+        base_layout = QtWidgets.QVBoxLayout(base_frame)
+        self._view = QtWebEngineWidgets.QWebEngineView()
+        self._status = QtWidgets.QLabel()
+        base_layout.addWidget(self._view, stretch=1)
+        base_layout.addWidget(self._status)
+
+        date_range = start.strftime('%Y-%m-%d') + ':' + end.strftime('%Y-%m-%d')
+        self._status.setText('Loading ' + date_range + '...')
+        self._loader = _DataLoader(date_range, self._load, approximate=False)
+        self._loader.signals.loaded.connect(self._on_loaded)
+        self._loader.signals.failed.connect(self._on_failed)
+        self._thread_pool = QtCore.QThreadPool(self)
+        self._thread_pool.start(self._loader)
+
+    def _load(self, date_range: str, _: Optional[Callable[[dict], None]]) -> dict[str, object]:
+        """Returns the timeline of the range and the page that plays it
+
+        This runs on a worker thread, and is profiled if a profile was asked for.
+        """
+        with tracing.profile(), tracing.span('gui.load_timeline'):
+            self._service.geometry()
+            map_page.load_folium()
+            covid_data = self._service.covid_data() if 'covid' in self._modes else None
+            timeline = build_timeline(self._modes, self._start, self._end, covid_data,
+                                      SENTIMENT_WORKERS, self._sentiment_window)
+            html = timeline.to_html(self._service.geometry(), BOUNDARIES_URL) \
+                if timeline.dates else None
+            return {'timeline': timeline, 'html': html}
+
+    def _on_loaded(self, date_range: str, result: dict[str, object]) -> None:
+        """Callback that shows the page of a loaded timeline"""
+        timeline = result['timeline']
+        if result['html'] is None:
+            self._status.setText('No dates from ' + date_range.replace(':', ' to ')
+                                 + ' have data')
+            return
+        with tracing.span('gui.show'):
+            self._view.setHtml(result['html'], QtCore.QUrl(PAGE_URL))
+        self._status.setText(f'{len(timeline.dates)} days from '
+                             + timeline.dates[0].strftime('%Y-%m-%d') + ' to '
+                             + timeline.dates[-1].strftime('%Y-%m-%d'))
+
+    def _on_failed(self, date_range: str, message: str) -> None:
+        """Callback that reports a timeline that could not be loaded"""
+        self._status.setText('Could not load ' + date_range + ': ' + message)
+
+
+def display_map(mode: str, tolerance: float = DEFAULT_TOLERANCE) -> None:
     """Displays the interactive map
 
+    'comparison' compares the sentiment and covid maps side by side, in one window
+    whose maps share their data service and date selector.
+
+    The map boundaries are simplified with the given tolerance in degrees.
+
     Precondition:
-       - mode in {'covid', 'sentiment'}
+       - mode in {'covid', 'sentiment', 'correlation', 'comparison'}
     """
+    register_url_scheme()
+    app = QtWidgets.QApplication(sys.argv)
+
+    modes = [mode] if mode != 'comparison' else ['sentiment', 'covid']
+    # Start reading the covid tables and map geometry while the window is being set up
+    service = DataService(sentiment_workers=SENTIMENT_WORKERS, geometry_tolerance=tolerance)
+    service.preload(modes)
+
+    window = ChoroplethMap(modes, service)
+    window.show()
+
+    sys.exit(app.exec_())
 
+
+def display_timeline(modes: list[str], start: datetime.datetime, end: datetime.datetime,
+                     tolerance: float = DEFAULT_TOLERANCE, sentiment_window: int = 1) -> None:
+    """Displays the timeline map of the given modes from start to end inclusive
+
+    The map boundaries are simplified with the given tolerance in degrees, and the sentiment
+    of each day is averaged over the sentiment_window days ending on it.
+
+    Precondition:
+       - modes != []
+       - all(mode in {'covid', 'sentiment'} for mode in modes)
+       - start <= end
+       - sentiment_window >= 1
+    """
+    register_url_scheme()
     app = QtWidgets.QApplication(sys.argv)
 
-    if mode in {'covid', 'sentiment'}:
-        window = ChoroplethMap(mode)
-        window.show()
-    else:
-        window = QtWidgets.QMainWindow()
-        base_frame = QtWidgets.QWidget()
-        window.setCentralWidget(base_frame)
-        hlay = QtWidgets.QHBoxLayout(base_frame)
-        hlay.addWidget(ChoroplethMap('sentiment'))
-        hlay.addWidget(ChoroplethMap('covid'))
-        window.show()
+    service = DataService(sentiment_workers=SENTIMENT_WORKERS, geometry_tolerance=tolerance)
+    service.preload(modes)
+
+    window = TimelineMap(modes, start, end, service, sentiment_window)
+    window.show()
 
     sys.exit(app.exec_())
 
@@ -251,7 +691,9 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['os', 'sys', 'typing', 'datetime', 'io', 'json', 'folium', 'pandas'],
+        'extra-imports': ['os', 'sys', 'typing', 'datetime', 'json', 'folium', 'pandas',
+                          'map_page', 'data_service', 'country_provinces', 'geometry',
+                          'tracing', 'timeline'],
         'allowed-io': ['run_example'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200', 'R0201']
@@ -0,0 +1,212 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Ingesting hydrated tweets files into tweet shards. Each located tweet is decoded, resolved and
+scored once here, and later loads of the day read the shard's columns instead of the json.
+Every day is reported with how many of its tweets repeat a text and how many scores the score
+store and the text score cache supplied.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import concurrent.futures
+import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import tracing
+from day_state import complete_size, is_compressed
+from gazetteer import save_location_cache
+from score_store import ScoreStore
+from shard import ShardWriter, TweetShard
+from text_cache import default_text_cache, normalize_text, save_text_cache, text_hash
+from tweet import SCORING_BATCH_SIZE, init_worker, iter_lines, iter_located_records, \
+    score_located, tweet_dates, tweet_path
+
+# Format of the created_at field of a tweet
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+
+
+class DayReport:
+    """How much of a day's located tweets repeat a text, and where their scores came from
+
+    Instance Attributes:
+        - tweets: The number of located tweets in the day's shard
+        - unique_texts: The number of distinct normalized texts among them
+        - store_hits: The number of tweets whose score came from the day's score store while
+          ingesting
+        - cache_hits: The number of tweets whose score came from the text score cache while
+          ingesting, counting repeats within the day
+        - scored: The number of texts that had to be scored while ingesting
+
+    Representation Invariants:
+      - 0 <= self.unique_texts <= self.tweets
+    """
+    tweets: int
+    unique_texts: int
+    store_hits: int
+    cache_hits: int
+    scored: int
+
+    def __init__(self, tweets: int, unique_texts: int, store_hits: int, cache_hits: int,
+                 scored: int) -> None:
+        self.tweets = tweets
+        self.unique_texts = unique_texts
+        self.store_hits = store_hits
+        self.cache_hits = cache_hits
+        self.scored = scored
+
+    def duplicate_ratio(self) -> float:
+        """Returns the share of tweets whose text repeats an earlier one of the day, or 0.0 if
+        there are no tweets
+
+        >>> DayReport(4, 1, 0, 3, 1).duplicate_ratio()
+        0.75
+        """
+        if self.tweets == 0:
+            return 0.0
+        return 1 - self.unique_texts / self.tweets
+
+    def reuse_rate(self) -> float:
+        """Returns the share of the tweets ingested whose score came from the score store or
+        the text score cache, or 0.0 if none were ingested"""
+        looked_up = self.store_hits + self.cache_hits + self.scored
+        if looked_up == 0:
+            return 0.0
+        return (self.store_hits + self.cache_hits) / looked_up
+
+    def __str__(self) -> str:
+        """Returns a one line summary of the report
+
+        >>> str(DayReport(4, 1, 0, 3, 1))
+        '4 located tweets, 75.0% duplicate texts, 0 stored, 3 cached, 1 scored (75.0% reused)'
+        >>> str(DayReport(255, 200, 250, 5, 0))
+        '255 located tweets, 21.6% duplicate texts, 250 stored, 5 cached, 0 scored (100.0% reused)'
+        """
+        return f'{self.tweets} located tweets, {self.duplicate_ratio():.1%} duplicate texts, ' \
+            f'{self.store_hits} stored, {self.cache_hits} cached, {self.scored} scored ' \
+            f'({self.reuse_rate():.1%} reused)'
+
+
+def ingest_dates(start: datetime.datetime, end: datetime.datetime,
+                 workers: Optional[int] = None) -> dict[datetime.datetime, DayReport]:
+    """Ingests the hydrated tweets file of every date from start to end inclusive that has
+    one, and returns the report of each date
+
+    Days are ingested in parallel in the given number of worker processes, by default one per
+    CPU, which all add to and read from this process's text score cache. Days whose shard
+    already covers their whole file are left as they are.
+
+    Preconditions:
+      - start <= end
+      - workers is None or workers >= 1
+    """
+    dates = tweet_dates(start, end)
+    if len(dates) <= 1 or workers == 1:
+        return {date: ingest_day(tweet_path(date)) for date in dates}
+
+    reports = {}
+    # Workers drop the trace records and text scores they were forked with, so none are
+    # merged twice
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=init_worker) as executor:
+        futures = {date: executor.submit(_ingest_worker, tweet_path(date)) for date in dates}
+        for date, future in futures.items():
+            reports[date], records, text_scores = future.result()
+            tracing.tracer.merge(records)
+            default_text_cache().merge(text_scores)
+    save_text_cache()
+    return reports
+
+
+def _ingest_worker(path: str) -> tuple[DayReport, dict, dict]:
+    """Ingests a hydrated tweets file, and returns its report, the records of the process's
+    tracer and what its text score cache took
+
+    This runs in a worker process.
+    """
+    return ingest_day(path), tracing.tracer.take(), default_text_cache().take()
+
+
+def ingest_day(path: str) -> DayReport:
+    """Writes the tweet shard of every complete line of a hydrated tweets file, and returns the
+    report of the day
+
+    Tweets are decoded and scored SCORING_BATCH_SIZE at a time, so memory use does not grow
+    with the size of the file. Scores already in the file's score store or the text score
+    cache are reused, and new ones are added to both.
+    """
+    end = complete_size(path)
+    shard = TweetShard.load(path)
+    if shard is not None and shard.offset == end:
+        return DayReport(len(shard), shard.unique_texts(), 0, 0, 0)
+
+    cache = default_text_cache()
+    hits, misses = cache.hits, cache.misses
+    with tracing.span('ingest.day'):
+        lines = iter_lines(path) if is_compressed(path) else iter_lines(path, 0, end)
+        writer = ShardWriter(path)
+        store = ScoreStore(path)
+        try:
+            batch = []
+            for record in iter_located_records(lines):
+                batch.append(record)
+                if len(batch) == SCORING_BATCH_SIZE:
+                    _write_batch(writer, batch, store)
+                    batch = []
+            _write_batch(writer, batch, store)
+            writer.finish(end)
+        finally:
+            writer.close()
+            store.close()
+        save_location_cache()
+        save_text_cache()
+    tracing.count('ingest.rows', writer.rows)
+    return DayReport(writer.rows, TweetShard.load(path).unique_texts(), store.hits,
+                     cache.hits - hits, cache.misses - misses)
+
+
+def _write_batch(writer: ShardWriter, batch: list[tuple[dict, int]],
+                 store: ScoreStore) -> None:
+    """Scores a batch of parsed tweets and their region codes, and writes them to a shard"""
+    scores = score_located([(fields['id_str'], code, fields['text']) for fields, code in batch],
+                           store)
+    with tracing.span('ingest.columns'):
+        created = pd.to_datetime([fields['created_at'] for fields, _ in batch],
+                                 format=CREATED_AT_FORMAT, utc=True)
+        columns = {
+            'ids': np.array([int(fields['id_str']) for fields, _ in batch], dtype=np.int64),
+            'codes': np.array([code for _, code in batch], dtype=np.int16),
+            'scores': scores,
+            # Whole seconds whatever unit pandas parsed the times to
+            'timestamps': np.asarray((created - pd.Timestamp(0, tz=created.tz))
+                                     // pd.Timedelta('1s'), dtype=np.int64),
+            'user_ids': np.array([fields['user_id'] for fields, _ in batch], dtype=np.int64),
+            'text_hashes': np.array([text_hash(normalize_text(fields['text']))
+                                     for fields, _ in batch], dtype=np.int64)
+        }
+        writer.append(columns, [fields['text'] for fields, _ in batch])
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['concurrent.futures', 'datetime', 'typing', 'numpy', 'pandas',
+                          'tracing', 'day_state', 'gazetteer', 'score_store', 'shard', 'text_cache',
+                          'tweet'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
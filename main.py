@@ -5,7 +5,6 @@ Copyright and Usage Information
 This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
 """
 import argparse
-from gui import display_map
 
 
 # ————————————————————————————————— Argparse —————————————————————————————————
@@ -13,19 +12,91 @@ def parse_args() -> argparse.Namespace:
     """Parse the command line arguments.
     """
     parser = argparse.ArgumentParser(description="Argparse for Interactive Map")
+    parser.add_argument("command",
+                        help="show: display the interactive map (default); "
+                             "export: write the maps and aggregates of many dates to files; "
+                             "ingest: convert the hydrated tweets of many dates to tweet shards",
+                        nargs='?',
+                        choices=['show', 'export', 'ingest'],
+                        default='show')
     parser.add_argument("--mode",
                         dest="mode",
-                        help="The mode of the map: covid/sentiment/comparison",
+                        help="The mode of the map: covid/sentiment/correlation/comparison/"
+                             "timeline",
                         default='comparison',
                         type=str)
+    parser.add_argument("--dates",
+                        dest="dates",
+                        help="export/ingest/timeline: the dates to export, ingest or play, as "
+                             "Year-Month-Date:Year-Month-Date",
+                        default='2020-08-01:2021-12-01',
+                        type=str)
+    parser.add_argument("--series",
+                        dest="series",
+                        help="timeline: what the timeline plays: covid, sentiment or "
+                             "covid,sentiment",
+                        default='covid,sentiment',
+                        type=str)
+    parser.add_argument("--window",
+                        dest="window",
+                        help="timeline: the number of days ending on each day that its "
+                             "sentiment is averaged over",
+                        default=1,
+                        type=int)
+    parser.add_argument("--out",
+                        dest="out",
+                        help="export: the directory to write to",
+                        default='export',
+                        type=str)
+    parser.add_argument("--workers",
+                        dest="workers",
+                        help="export/ingest: the number of worker processes, by default one per "
+                             "CPU",
+                        default=None,
+                        type=int)
+    parser.add_argument("--tolerance",
+                        dest="tolerance",
+                        help="how far, in degrees, the simplified map boundaries may stray "
+                             "from the original ones",
+                        default=0.01,
+                        type=float)
+    parser.add_argument("--text-cache",
+                        dest="text_cache",
+                        help="the file sentiment scores of tweet texts are kept in between "
+                             "runs, or none to keep them in memory only",
+                        default='data/text_scores.npz',
+                        type=str)
+    parser.add_argument("--trace",
+                        dest="trace",
+                        help="print the time spent in each stage on exit, and write a Chrome "
+                             "trace to TRACE if it ends in .json",
+                        nargs='?',
+                        const='',
+                        default=None,
+                        type=str)
+    parser.add_argument("--profile",
+                        dest="profile",
+                        help="write a cProfile capture to PROFILE: of the first date load for "
+                             "show, and of the whole command for export and ingest",
+                        default=None,
+                        type=str)
     args = parser.parse_args()
 
-    if args.mode not in {'covid', 'sentiment', 'comparison'}:
+    if args.mode not in {'covid', 'sentiment', 'correlation', 'comparison', 'timeline'}:
         raise ValueError("Aborting: Invalid Mode.")
+    elif args.mode == 'timeline' and (args.series == '' or any(
+            series not in {'covid', 'sentiment'} for series in args.series.split(','))):
+        raise ValueError("Aborting: Invalid Timeline Series.")
+    elif args.window < 1:
+        raise ValueError("Aborting: Invalid Sentiment Window.")
     elif args.mode == 'covid':
         print("Mode: Covid Map.")
     elif args.mode == 'sentiment':
         print("Mode: Sentiment Map.")
+    elif args.mode == 'correlation':
+        print("Mode: Sentiment/Cases Correlation Map.")
+    elif args.mode == 'timeline':
+        print("Mode: Timeline Map.")
     else:
         print("Mode: Comparison Map.")
 
@@ -36,5 +107,55 @@ def parse_args() -> argparse.Namespace:
 if __name__ == '__main__':
     args = parse_args()
 
-    print("Displaying map...")
-    display_map(args.mode)
+    import tracing
+
+    if args.trace is not None:
+        tracing.enable(args.trace or None)
+    if args.profile is not None:
+        tracing.enable_profile(args.profile)
+
+    if args.text_cache != 'data/text_scores.npz':
+        from text_cache import set_text_cache_path
+
+        set_text_cache_path(None if args.text_cache == 'none' else args.text_cache)
+
+    if args.command != 'show':
+        # Exports never load Qt, so they also run without a display
+        with tracing.profile():
+            if args.command == 'export' and args.mode == 'timeline':
+                from export import parse_date_range
+                from timeline import export_timeline
+
+                start, end = parse_date_range(args.dates)
+                print("Exporting timeline to " + args.out + "...")
+                timeline = export_timeline(args.series.split(','), start, end, args.out,
+                                           args.workers, args.tolerance, args.window)
+                print(f"{len(timeline.dates)} days with data.")
+            elif args.command == 'export':
+                from export import export_maps, format_timings, parse_date_range
+
+                start, end = parse_date_range(args.dates)
+                modes = [args.mode] if args.mode != 'comparison' else ['sentiment', 'covid']
+                print("Exporting maps to " + args.out + "...")
+                print(format_timings(export_maps(modes, start, end, args.out, args.workers,
+                                                 args.tolerance)))
+            else:
+                from export import parse_date_range
+                from ingest import ingest_dates
+
+                start, end = parse_date_range(args.dates)
+                print("Ingesting tweets to shards...")
+                for date, report in ingest_dates(start, end, args.workers).items():
+                    print(date.strftime('%Y-%m-%d') + ": " + str(report))
+    elif args.mode == 'timeline':
+        from export import parse_date_range
+        from gui import display_timeline
+
+        start, end = parse_date_range(args.dates)
+        print("Displaying timeline...")
+        display_timeline(args.series.split(','), start, end, args.tolerance, args.window)
+    else:
+        from gui import display_map
+
+        print("Displaying map...")
+        display_map(args.mode, args.tolerance)
@@ -0,0 +1,482 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Building the choropleth map page, and the small payloads that restyle a loaded page in place.
+Nothing here depends on Qt, and folium is only imported once a page is built, since it takes
+longer to import than the rest of the map window.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import importlib
+import io
+import json
+from types import ModuleType
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+if TYPE_CHECKING:
+    import folium
+
+CANADA_GEOJSON = "data/canada_provinces.geojson"
+US_GEOJSON = "data/us_states.json"
+
+FILL_COLOR = "YlOrRd"
+FILL_OPACITY = 0.7
+LINE_OPACITY = .1
+NAN_FILL_COLOR = "black"
+
+# The [region, value] columns of the Canadian and American data of every map mode
+MAP_COLUMNS = {'covid': (["Province", "DailyTotals"], ["State Name", "7-day Avg Cases"]),
+               'sentiment': (["location", "value"], ["location", "value"]),
+               'correlation': (["location", "value"], ["location", "value"])}
+
+# The legend name of every map mode
+LEGEND_NAMES = {'covid': 'daily cases', 'sentiment': 'sentiment score',
+                'correlation': 'correlation of sentiment with daily cases'}
+
+# Defines window.coveetRestyle(payload), which recolours the regions of both layers and
+# redraws the legend without reloading the page. Choropleth highlighting resets a region to
+# the layer's style function on mouseout, so that function is replaced as well.
+_RESTYLE_SCRIPT = """
+var coveetLegend = L.control({position: 'topright'});
+coveetLegend.onAdd = function () {
+    this._div = L.DomUtil.create('div', 'coveet-legend');
+    this._div.style.background = 'white';
+    this._div.style.padding = '6px';
+    this._div.style.font = '12px sans-serif';
+    return this._div;
+};
+var coveetMap = %(map)s;
+coveetLegend.addTo(coveetMap);
+
+var coveetLayers = {
+    ca: {layer: %(canada)s, key: function (feature) { return feature.properties.name; }},
+    us: {layer: %(america)s, key: function (feature) { return feature.id; }}
+};
+
+window.coveetRestyle = function (payload) {
+    Object.keys(coveetLayers).forEach(function (country) {
+        var entry = coveetLayers[country];
+        var colors = payload.colors[country];
+        var styler = function (feature) {
+            var color = colors[entry.key(feature)];
+            return {
+                fillColor: color === undefined ? payload.nan_color : color,
+                fillOpacity: payload.fill_opacity,
+                weight: 1,
+                opacity: payload.line_opacity,
+                color: 'black'
+            };
+        };
+        entry.layer.options.style = styler;
+        entry.layer.setStyle(styler);
+    });
+
+    var html = '<b>' + payload.legend_name + '</b>';
+    for (var i = 0; i < payload.palette.length; i++) {
+        html += '<br><i style="display:inline-block;width:18px;height:12px;opacity:'
+            + payload.fill_opacity + ';background:' + payload.palette[i] + '"></i> '
+            + payload.labels[i] + ' &ndash; ' + payload.labels[i + 1];
+    }
+    coveetLegend._div.innerHTML = html;
+};
+"""
+
+# Defines window.coveetLoadBoundaries(url), which fetches a TopoJSON topology of the
+# boundaries and adds its objects to the layers of coveetLayers, which style them as the last
+# restyle asked for. Arcs are delta-encoded, and an arc used backwards is written ~index.
+_BOUNDARY_SCRIPT = """
+window.coveetLoadBoundaries = function (url) {
+    fetch(url).then(function (response) { return response.json(); }).then(function (topology) {
+        var scale = topology.transform.scale, translate = topology.transform.translate;
+        var arcs = topology.arcs.map(function (arc) {
+            var x = 0, y = 0;
+            return arc.map(function (delta) {
+                x += delta[0];
+                y += delta[1];
+                return [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+            });
+        });
+        var ring = function (indices) {
+            var coordinates = [];
+            indices.forEach(function (index) {
+                var arc = index >= 0 ? arcs[index] : arcs[~index].slice().reverse();
+                coordinates.push.apply(coordinates, coordinates.length ? arc.slice(1) : arc);
+            });
+            return coordinates;
+        };
+        Object.keys(coveetLayers).forEach(function (country) {
+            var features = topology.objects[country].geometries.map(function (geometry) {
+                var coordinates = geometry.type === 'Polygon' ? geometry.arcs.map(ring)
+                    : geometry.arcs.map(function (polygon) { return polygon.map(ring); });
+                var feature = {type: 'Feature', properties: geometry.properties,
+                               geometry: {type: geometry.type, coordinates: coordinates}};
+                if (geometry.id !== undefined) {
+                    feature.id = geometry.id;
+                }
+                return feature;
+            });
+            coveetLayers[country].layer.addData(features);
+        });
+    });
+};
+"""
+
+# Defines window.coveetTimeline(timeline), which adds a control that plays the frames of a
+# timeline payload through coveetRestyle. The bin of every region on every date is one byte of
+# a base64 array with a row per date, and 255 where there is no value.
+_TIMELINE_SCRIPT = """
+window.coveetTimeline = function (timeline) {
+    var series = timeline.series.map(function (entry) {
+        var raw = atob(entry.bins);
+        var bins = new Uint8Array(raw.length);
+        for (var i = 0; i < raw.length; i++) {
+            bins[i] = raw.charCodeAt(i);
+        }
+        return {entry: entry, bins: bins};
+    });
+    var regions = timeline.regions, shown = 0, day = 0, timer = null;
+    var control = L.control({position: 'bottomleft'});
+    var slider, label, button;
+
+    var draw = function () {
+        var current = series[shown], colors = {ca: {}, us: {}}, row = day * regions.length;
+        for (var j = 0; j < regions.length; j++) {
+            var bin = current.bins[row + j];
+            if (bin !== 255) {
+                colors[regions[j][0]][regions[j][1]] = current.entry.palette[bin];
+            }
+        }
+        window.coveetRestyle({colors: colors, palette: current.entry.palette,
+                              labels: current.entry.labels,
+                              legend_name: current.entry.legend_name,
+                              nan_color: timeline.nan_color, fill_opacity: timeline.fill_opacity,
+                              line_opacity: timeline.line_opacity});
+        slider.value = day;
+        label.textContent = timeline.dates[day];
+    };
+    var stop = function () {
+        clearInterval(timer);
+        timer = null;
+        button.textContent = 'Play';
+    };
+    var play = function () {
+        if (day === timeline.dates.length - 1) {
+            day = 0;
+        }
+        button.textContent = 'Pause';
+        timer = setInterval(function () {
+            if (day === timeline.dates.length - 1) {
+                stop();
+            } else {
+                day += 1;
+                draw();
+            }
+        }, timeline.frame_ms);
+        draw();
+    };
+
+    control.onAdd = function () {
+        var div = L.DomUtil.create('div', 'coveet-timeline');
+        div.style.background = 'white';
+        div.style.padding = '6px';
+        div.style.font = '12px sans-serif';
+        if (series.length > 1) {
+            var select = L.DomUtil.create('select', '', div);
+            series.forEach(function (current, i) {
+                var option = L.DomUtil.create('option', '', select);
+                option.value = i;
+                option.textContent = current.entry.legend_name;
+            });
+            select.onchange = function () {
+                shown = Number(select.value);
+                draw();
+            };
+        }
+        button = L.DomUtil.create('button', '', div);
+        button.textContent = 'Play';
+        button.onclick = function () {
+            if (timer === null) {
+                play();
+            } else {
+                stop();
+            }
+        };
+        slider = L.DomUtil.create('input', '', div);
+        slider.type = 'range';
+        slider.min = 0;
+        slider.max = timeline.dates.length - 1;
+        slider.style.width = '300px';
+        slider.oninput = function () {
+            day = Number(slider.value);
+            draw();
+        };
+        label = L.DomUtil.create('span', '', div);
+        // Dragging the slider must not pan the map
+        L.DomEvent.disableClickPropagation(div);
+        return div;
+    };
+    control.addTo(coveetMap);
+    draw();
+};
+"""
+
+
+def load_folium() -> ModuleType:
+    """Returns the folium module, importing it if nobody has yet
+
+    Calling this on a worker thread before the first map is built keeps the import off the UI
+    thread.
+    """
+    with tracing.span('map.import_folium'):
+        return importlib.import_module('folium')
+
+
+def build_map(mode: str, ca_data: pd.DataFrame, us_data: pd.DataFrame, bins: list[float],
+              legend_name: str, geometry: Optional[tuple[dict, dict]] = None,
+              geometry_url: Optional[str] = None) -> 'folium.Map':
+    """Returns a map of Canada and the US coloured by the data of the given mode
+
+    geometry holds the already parsed Canadian and American boundaries; by default they are
+    read from CANADA_GEOJSON and US_GEOJSON. The page of the map defines
+    window.coveetRestyle, to be called with restyle_script.
+
+    If geometry_url is given, the shapes of the boundaries are left out of the page, which
+    fetches them from that url as a TopoJSON topology with objects 'ca' and 'us' instead.
+
+    Preconditions:
+      - mode in MAP_COLUMNS
+      - geometry_url is None or geometry is not None
+    """
+    if geometry is None:
+        canada_geometry, us_geometry = CANADA_GEOJSON, US_GEOJSON
+    elif geometry_url is not None:
+        canada_geometry, us_geometry = (_without_shapes(geometry[0]),
+                                        _without_shapes(geometry[1]))
+    else:
+        canada_geometry, us_geometry = (_styling_copy(geometry[0]), _styling_copy(geometry[1]))
+
+    folium = load_folium()
+    folium_map = folium.Map(location=[40, -95], zoom_start=3, tiles="Stamen Terrain")
+
+    # Choropleth configuration
+    c1, c2 = MAP_COLUMNS[mode]
+
+    canada_choropleth = folium.Choropleth(
+        geo_data=canada_geometry,
+        name="Canada",
+        data=ca_data,
+        columns=c1,
+        key_on="feature.properties.name",
+        fill_color=FILL_COLOR,
+        fill_opacity=FILL_OPACITY,
+        line_opacity=LINE_OPACITY,
+        _legend_name=legend_name,
+        highlight=True,
+        bins=bins
+    )
+    canada_choropleth.add_to(folium_map)
+
+    america_choropleth = folium.Choropleth(
+        geo_data=us_geometry,
+        name="America",
+        data=us_data,
+        columns=c2,
+        key_on="feature.id",
+        fill_color=FILL_COLOR,
+        fill_opacity=FILL_OPACITY,
+        line_opacity=LINE_OPACITY,
+        _legend_name="America",
+        highlight=True,
+        bins=bins
+    )
+    america_choropleth.add_to(folium_map)
+
+    # An issue under foilum's GitHub page highlighted that
+    # this is the only way to hide a legend for now. The legend drawn by coveetRestyle
+    # replaces both, since it can follow bins that change with the date.
+    for choropleth in (canada_choropleth, america_choropleth):
+        for key in list(choropleth._children):
+            if key.startswith('color_map'):
+                del choropleth._children[key]
+
+    canada_choropleth.geojson.add_child(
+        folium.features.GeoJsonTooltip(['name'], labels=False)
+    )
+
+    america_choropleth.geojson.add_child(
+        folium.features.GeoJsonTooltip(['name'], labels=False)
+    )
+
+    folium.LayerControl().add_to(folium_map)  # add layer control and toggling to the map
+
+    folium_map.get_root().script.add_child(folium.Element(_RESTYLE_SCRIPT % {
+        'map': folium_map.get_name(),
+        'canada': canada_choropleth.geojson.get_name(),
+        'america': america_choropleth.geojson.get_name()
+    }))
+    if geometry_url is not None:
+        folium_map.get_root().script.add_child(folium.Element(
+            _BOUNDARY_SCRIPT + 'coveetLoadBoundaries(' + json.dumps(geometry_url) + ');'))
+
+    return folium_map
+
+
+def _styling_copy(geojson: dict) -> dict:
+    """Returns a copy of a feature collection that folium can add styles to without changing
+    the original
+
+    Only the features and their properties are copied; the geometry is shared.
+    """
+    return dict(geojson, features=[dict(feature, properties=dict(feature.get('properties', {})))
+                                   for feature in geojson['features']])
+
+
+def _without_shapes(geojson: dict) -> dict:
+    """Returns a copy of a feature collection without the shapes of its features
+
+    Leaflet skips features without a geometry, while folium still finds the ids and properties
+    it styles and labels the features by.
+    """
+    return dict(geojson, features=[dict(feature, properties=dict(feature.get('properties', {})),
+                                        geometry=None)
+                                   for feature in geojson['features']])
+
+
+def map_html(folium_map: 'folium.Map') -> str:
+    """Returns the full html page of a map"""
+    with tracing.span('map.html'):
+        data = io.BytesIO()
+        folium_map.save(data, close_file=False)
+    tracing.count('map.html_bytes', len(data.getvalue()))
+    return data.getvalue().decode()
+
+
+def standalone_html(mode: str, ca_data: pd.DataFrame, us_data: pd.DataFrame,
+                    bins: list[float], legend_name: str,
+                    geometry: Optional[tuple[dict, dict]] = None) -> str:
+    """Returns a map page that needs no application to show its legend, for saving to a file
+
+    Preconditions:
+      - mode in MAP_COLUMNS
+    """
+    folium_map = build_map(mode, ca_data, us_data, bins, legend_name, geometry)
+    payload = restyle_payload(mode, ca_data, us_data, bins, legend_name)
+    folium_map.get_root().script.add_child(load_folium().Element(restyle_script(payload)))
+    return map_html(folium_map)
+
+
+def timeline_html(mode: str, ca_data: pd.DataFrame, us_data: pd.DataFrame, bins: list[float],
+                  timeline: dict, geometry: Optional[tuple[dict, dict]] = None,
+                  geometry_url: Optional[str] = None) -> str:
+    """Returns a map page that plays the frames of a timeline payload, starting from a map of
+    the given data
+
+    The page has a slider over the timeline's dates, a play button and, if the timeline has
+    more than one series, a selector between them. Every frame is recoloured in the page from
+    the payload, without going back to Python. geometry and geometry_url are as in build_map.
+
+    Preconditions:
+      - mode in MAP_COLUMNS
+      - geometry_url is None or geometry is not None
+    """
+    folium_map = build_map(mode, ca_data, us_data, bins, LEGEND_NAMES[mode], geometry,
+                           geometry_url)
+    folium_map.get_root().script.add_child(load_folium().Element(
+        _TIMELINE_SCRIPT + 'coveetTimeline(' + json.dumps(timeline) + ');'))
+    return map_html(folium_map)
+
+
+def region_colors(data: pd.DataFrame, columns: list[str], bins: list[float]) -> dict[str, str]:
+    """Returns the fill colour of every region in data, binned the way folium.Choropleth does
+
+    Regions with a missing value are left out, as are all regions if the bins are undefined.
+
+    >>> frame = pd.DataFrame({'location': ['Ontario', 'Texas'], 'value': [0.1, -0.9]})
+    >>> region_colors(frame, ['location', 'value'], [-1, -0.5, 0, 0.5, 1])
+    {'Ontario': '#fd8d3c', 'Texas': '#ffffb2'}
+    """
+    palette = bin_palette(bins)
+    if not palette:
+        return {}
+    values = data[columns[1]].to_numpy(dtype=float)
+    indices = bin_indices(values, bins)
+    return {key: palette[i] for key, value, i in zip(data[columns[0]], values, indices)
+            if not np.isnan(value)}
+
+
+def bin_palette(bins: list[float]) -> list[str]:
+    """Returns the fill colour of every bin, or no colours if the bins are undefined"""
+    from branca.utilities import color_brewer
+
+    if np.isnan(np.array(bins, dtype=float)).any():
+        return []
+    return color_brewer(FILL_COLOR, n=len(bins) - 1)
+
+
+def bin_indices(values: np.ndarray, bins: list[float]) -> np.ndarray:
+    """Returns the index of the bin every value falls in, binned the way folium.Choropleth
+    does, with values outside of the bins put in the nearest one
+
+    >>> bin_indices(np.array([-1.0, 0.1, 1.0]), [-1, -0.5, 0, 0.5, 1])
+    array([0, 2, 3])
+
+    Preconditions:
+      - not np.isnan(np.array(bins, dtype=float)).any()
+    """
+    edges = np.array(bins, dtype=float)
+    # Like folium, make the last bin inclusive on the right
+    edges[-1] = np.nextafter(edges[-1], np.inf if edges[0] <= edges[-1] else -np.inf)
+    return np.clip(np.digitize(values, edges) - 1, 0, len(edges) - 2)
+
+
+def restyle_payload(mode: str, ca_data: pd.DataFrame, us_data: pd.DataFrame,
+                    bins: list[float], legend_name: str) -> dict:
+    """Returns the colours and legend that restyle a map page to show the given data
+
+    Preconditions:
+      - mode in MAP_COLUMNS
+    """
+    c1, c2 = MAP_COLUMNS[mode]
+    return {
+        'colors': {'ca': region_colors(ca_data, c1, bins), 'us': region_colors(us_data, c2, bins)},
+        'palette': bin_palette(bins),
+        'labels': [f'{edge:.4g}' for edge in bins],
+        'legend_name': legend_name,
+        'nan_color': NAN_FILL_COLOR,
+        'fill_opacity': FILL_OPACITY,
+        'line_opacity': LINE_OPACITY
+    }
+
+
+def restyle_script(payload: dict) -> str:
+    """Returns the JavaScript that applies a restyle payload to a loaded map page"""
+    script = 'window.coveetRestyle(' + json.dumps(payload) + ');'
+    tracing.count('map.restyle_bytes', len(script))
+    return script
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['importlib', 'io', 'json', 'types', 'typing', 'folium', 'numpy',
+                          'pandas', 'branca.utilities', 'tracing'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -0,0 +1,126 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Per-region sentiment totals, kept as arrays indexed by region code. Scores are added a batch at
+a time with np.bincount, and totals from different parts of a file can be merged by adding
+their arrays, so tweets never have to be kept around to aggregate them.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import numpy as np
+import pandas as pd
+
+from country_provinces import all_provinces, country_provinces, regions
+
+# VADER's usual cut-offs: a compound score at or above POSITIVE_THRESHOLD is positive, and one
+# at or below NEGATIVE_THRESHOLD is negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+# Canadian region codes come first, so a code below this is a Canadian province
+CANADA_REGIONS = len(country_provinces['Canada'])
+
+
+class RegionTotals:
+    """The number of tweets, sum of sentiment scores, sum of squared scores, and number of
+    positive and negative tweets of every region
+
+    Instance Attributes:
+        - counts: The number of scored tweets of each region, indexed by region code
+        - sums: The sum of the scores of each region
+        - sum_squares: The sum of the squared scores of each region
+        - positives: The number of positive tweets of each region
+        - negatives: The number of negative tweets of each region
+
+    Representation Invariants:
+      - all(len(array) == len(regions) for array in (self.counts, self.sums,
+            self.sum_squares, self.positives, self.negatives))
+    """
+    counts: np.ndarray
+    sums: np.ndarray
+    sum_squares: np.ndarray
+    positives: np.ndarray
+    negatives: np.ndarray
+
+    def __init__(self) -> None:
+        self.counts = np.zeros(len(regions), dtype=np.int64)
+        self.sums = np.zeros(len(regions))
+        self.sum_squares = np.zeros(len(regions))
+        self.positives = np.zeros(len(regions), dtype=np.int64)
+        self.negatives = np.zeros(len(regions), dtype=np.int64)
+
+    def add(self, codes: np.ndarray, scores: np.ndarray) -> None:
+        """Adds the tweets with the given region codes and sentiment scores
+
+        >>> totals = RegionTotals()
+        >>> totals.add(np.array([8, 8, 0], dtype=np.int16), np.array([0.5, -0.25, 0.0]))
+        >>> int(totals.counts[8]), float(totals.sums[8]), int(totals.negatives[8])
+        (2, 0.25, 1)
+
+        Preconditions:
+          - len(codes) == len(scores)
+          - all(0 <= code < len(regions) for code in codes)
+        """
+        if len(codes) == 0:
+            return
+        scores = np.asarray(scores, dtype=np.float64)
+        n = len(regions)
+        self.counts += np.bincount(codes, minlength=n)
+        self.sums += np.bincount(codes, scores, minlength=n)
+        self.sum_squares += np.bincount(codes, scores * scores, minlength=n)
+        self.positives += np.bincount(codes[scores >= POSITIVE_THRESHOLD], minlength=n)
+        self.negatives += np.bincount(codes[scores <= NEGATIVE_THRESHOLD], minlength=n)
+
+    def merge(self, other: 'RegionTotals') -> None:
+        """Adds the totals of other to these"""
+        self.counts += other.counts
+        self.sums += other.sums
+        self.sum_squares += other.sum_squares
+        self.positives += other.positives
+        self.negatives += other.negatives
+
+    def to_dataframes(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Returns the Canadian and American dataframes with columns: location, value (the mean
+        score), count, std (the population standard deviation of the scores), positive and
+        negative (the shares of positive and negative tweets)
+
+        Only regions with at least one tweet are included, in order of region code.
+        """
+        present = np.flatnonzero(self.counts)
+        counts = self.counts[present]
+        means = self.sums[present] / counts
+        # Rounding can make the variance of near-identical scores slightly negative
+        variances = np.maximum(self.sum_squares[present] / counts - means * means, 0.0)
+
+        dataframe = pd.DataFrame({
+            'location': np.array(all_provinces, dtype=object)[present],
+            'value': means,
+            'count': counts,
+            'std': np.sqrt(variances),
+            'positive': self.positives[present] / counts,
+            'negative': self.negatives[present] / counts
+        })
+        in_canada = present < CANADA_REGIONS
+        return (dataframe[in_canada].reset_index(drop=True),
+                dataframe[~in_canada].reset_index(drop=True))
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['numpy', 'pandas', 'country_provinces'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
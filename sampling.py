@@ -0,0 +1,226 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Approximate sentiment from a sample of a day's tweets, for when the exact totals of a large day
+are not stored yet. Blocks of the hydrated tweets file are read in random order until a time
+budget runs out, and each region keeps a reservoir sample of its located tweets among them, so
+every region is sampled on its own with at most a fixed number of tweets. Only the sampled
+tweets are scored.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import bz2
+import gzip
+import math
+import os
+import random
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import tracing
+from country_provinces import all_provinces, regions
+from day_state import complete_size, is_compressed
+from region_totals import CANADA_REGIONS, NEGATIVE_THRESHOLD, POSITIVE_THRESHOLD
+from tweet import iter_lines, iter_located_tweets, score_tweet_texts, scoring_stats, split_file
+
+# Most tweets of each region that are scored
+DEFAULT_SAMPLE_SIZE = 200
+
+# Seconds an approximation takes, reading and scoring together
+DEFAULT_TIME_BUDGET = 1.0
+
+# Tweets scored per second, assumed until this process has scored some
+_ASSUMED_SCORING_RATE = 5000.0
+
+# The normal quantile of the confidence intervals, which are 95% intervals
+CONFIDENCE_Z = 1.96
+
+# Size of the blocks the file is read in. Each block is read whole, so smaller blocks spread
+# the sample over more of the day.
+_BLOCK_BYTES = 1 << 18
+
+
+class RegionReservoirs:
+    """A uniform random sample of up to size of the tweets of every region offered so far
+
+    Instance Attributes:
+        - size: The most tweets kept for each region
+        - seen: The number of tweets offered for each region, indexed by region code
+        - samples: The kept texts of each region, indexed by region code
+        - kept: The number of texts kept over all regions
+
+    Representation Invariants:
+      - all(len(self.samples[code]) == min(self.seen[code], self.size)
+            for code in range(len(regions)))
+    """
+    size: int
+    seen: list[int]
+    samples: list[list[str]]
+    kept: int
+    _rng: random.Random
+
+    def __init__(self, size: int, rng: random.Random) -> None:
+        self.size = size
+        self.seen = [0] * len(regions)
+        self.samples = [[] for _ in regions]
+        self.kept = 0
+        self._rng = rng
+
+    def offer(self, code: int, text: str) -> None:
+        """Offers the text of a tweet of a region, keeping it with the probability that keeps
+        the region's sample uniform
+
+        >>> reservoirs = RegionReservoirs(2, random.Random(0))
+        >>> for text in ['a', 'b', 'c', 'd']:
+        ...     reservoirs.offer(5, text)
+        >>> reservoirs.seen[5], len(reservoirs.samples[5])
+        (4, 2)
+        """
+        self.seen[code] += 1
+        if len(self.samples[code]) < self.size:
+            self.samples[code].append(text)
+            self.kept += 1
+        else:
+            i = self._rng.randrange(self.seen[code])
+            if i < self.size:
+                self.samples[code][i] = text
+
+
+def approximate_tweets(path: str, sample_size: int = DEFAULT_SAMPLE_SIZE,
+                       time_budget: float = DEFAULT_TIME_BUDGET, seed: Optional[int] = None) \
+        -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the approximate Canadian and American sentiment data of a hydrated tweets file,
+    with columns: location, value (the mean sample score), count (the estimated number of
+    located tweets), std, positive, negative (as in get_tweets, but of the sample), sample
+    (the number of tweets scored) and ci (the half-width of the 95% confidence interval of the
+    mean)
+
+    Blocks of the file are read in random order for as long as the sample kept so far can still
+    be scored within about time_budget seconds of the call, and at least one is always read.
+    A compressed file cannot be read out of order, so it is read from the start instead, and
+    its tweets are only a fair sample of the day if they are not ordered.
+    If the whole file is read and no region has more than sample_size tweets, the result is
+    exact and every interval is 0. An interval is NaN where a region has a single sampled
+    tweet.
+
+    Preconditions:
+      - sample_size >= 1
+      - time_budget >= 0
+    """
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + time_budget
+    reservoirs = RegionReservoirs(sample_size, rng)
+
+    with tracing.span('sampling.read'):
+        if is_compressed(path):
+            read_share = _read_compressed(path, reservoirs, deadline)
+        else:
+            end = complete_size(path)
+            blocks = split_file(path, max(math.ceil(end / _BLOCK_BYTES), 1), 0, end)
+            rng.shuffle(blocks)
+            read_bytes = 0
+            for start, stop in blocks:
+                for _, code, text in iter_located_tweets(iter_lines(path, start, stop)):
+                    reservoirs.offer(code, text)
+                read_bytes += stop - start
+                if _out_of_time(reservoirs, deadline):
+                    break
+            read_share = read_bytes / end if end > 0 else 1.0
+
+    codes = np.array([code for code in range(len(regions))
+                      for _ in reservoirs.samples[code]], dtype=np.int64)
+    scores = score_tweet_texts([text for sample in reservoirs.samples for text in sample])
+    tracing.count('sampling.scored', len(scores))
+    return _estimate_frames(codes, scores.astype(np.float64), np.array(reservoirs.seen),
+                            read_share)
+
+
+def _read_compressed(path: str, reservoirs: RegionReservoirs, deadline: float) -> float:
+    """Offers the located tweets of a compressed file to the reservoirs from the start until
+    it runs out of time, and returns the share of the compressed bytes that were read
+
+    Preconditions:
+      - is_compressed(path)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as raw:
+        stream = gzip.GzipFile(fileobj=raw) if path.endswith('.gz') else bz2.BZ2File(raw)
+        with stream:
+            for i, (_, code, text) in enumerate(iter_located_tweets(stream)):
+                reservoirs.offer(code, text)
+                if i % 1000 == 999 and _out_of_time(reservoirs, deadline):
+                    return min(raw.tell() / size, 1.0)
+    return 1.0
+
+
+def _out_of_time(reservoirs: RegionReservoirs, deadline: float) -> bool:
+    """Returns whether scoring the texts kept in the reservoirs would end past the deadline"""
+    rate = scoring_stats.rate() or _ASSUMED_SCORING_RATE
+    return time.perf_counter() + reservoirs.kept / rate >= deadline
+
+
+def _estimate_frames(codes: np.ndarray, scores: np.ndarray, seen: np.ndarray,
+                     read_share: float) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the Canadian and American dataframes of the sampled scores of every region
+
+    seen is the number of located tweets read from each region, and read_share the share of
+    the file they were read from.
+    """
+    n = len(regions)
+    sample = np.bincount(codes, minlength=n)
+    present = np.flatnonzero(sample)
+    sums = np.bincount(codes, scores, minlength=n)[present]
+    sum_squares = np.bincount(codes, scores * scores, minlength=n)[present]
+    positives = np.bincount(codes[scores >= POSITIVE_THRESHOLD], minlength=n)[present]
+    negatives = np.bincount(codes[scores <= NEGATIVE_THRESHOLD], minlength=n)[present]
+
+    sample = sample[present]
+    means = sums / sample
+    # Rounding can make the variance of near-identical scores slightly negative
+    squares = np.maximum(sum_squares - sample * means * means, 0.0)
+    estimated = seen[present] / read_share
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standard_error = np.sqrt(squares / (sample - 1) / sample)
+        # The sample is a large part of a small region, which narrows the interval
+        correction = np.sqrt(np.maximum(estimated - sample, 0.0) / np.maximum(estimated - 1, 1))
+    ci = np.where(sample >= estimated, 0.0, CONFIDENCE_Z * standard_error * correction)
+
+    dataframe = pd.DataFrame({
+        'location': np.array(all_provinces, dtype=object)[present],
+        'value': means,
+        'count': np.rint(estimated).astype(np.int64),
+        'std': np.sqrt(squares / sample),
+        'positive': positives / sample,
+        'negative': negatives / sample,
+        'sample': sample,
+        'ci': ci
+    })
+    in_canada = present < CANADA_REGIONS
+    return (dataframe[in_canada].reset_index(drop=True),
+            dataframe[~in_canada].reset_index(drop=True))
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['bz2', 'gzip', 'math', 'os', 'random', 'time', 'typing', 'numpy',
+                          'pandas', 'tracing', 'country_provinces', 'day_state', 'region_totals',
+                          'tweet'],
+        'allowed-io': ['_read_compressed'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -0,0 +1,182 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import os
+import sqlite3
+from typing import Optional
+
+from day_state import tail_hash
+
+# Name of the score store kept next to a day's hydrated tweets
+STORE_FILENAME = 'sentiment_scores.sqlite'
+
+# Most tweet ids looked up in one query, below SQLite's limit on query parameters
+_QUERY_SIZE = 900
+
+# Bumped whenever tweets are scored or stored differently, so stores of older scores are
+# cleared
+SCORE_VERSION = 5
+
+
+class StoreStats:
+    """Running hit and miss counts of every score store used in this process
+
+    Instance Attributes:
+        - hits: The number of tweets whose score was found in a store
+        - misses: The number of tweets that had to be scored
+    """
+    hits: int
+    misses: int
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        """Returns the share of lookups that were hits, or 0.0 if there were none"""
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+
+store_stats = StoreStats()
+
+
+class ScoreStore:
+    """An on-disk store of the sentiment score of the located tweets of a hydrated tweets file,
+    keyed by tweet id
+
+    The store remembers the size and modification time of the file it was built from and a
+    hash of its last bytes. Scores are kept when lines are appended to the file, but if the
+    stored part of the file changes, the file is rewritten at the same size, or the scores
+    were made by another SCORE_VERSION, every stored score is discarded. A store that is not
+    a readable database is rebuilt from scratch.
+
+    Instance Attributes:
+        - source: The path of the hydrated tweets file whose scores are stored
+        - path: The path of the SQLite database holding the scores
+        - hits: The number of lookups that found a stored score
+        - misses: The number of lookups that did not
+    """
+    source: str
+    path: str
+    hits: int
+    misses: int
+    _connection: sqlite3.Connection
+
+    def __init__(self, source: str, path: Optional[str] = None) -> None:
+        """Opens the score store of source, stored at path or next to source by default"""
+        self.source = source
+        self.path = path if path is not None \
+            else os.path.join(os.path.dirname(source), STORE_FILENAME)
+        self.hits = 0
+        self.misses = 0
+
+        self._connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            self._validate()
+        except sqlite3.DatabaseError:
+            # A corrupt store is only lost work, so it is started over
+            self._connection.close()
+            os.remove(self.path)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._validate()
+
+    def _validate(self) -> None:
+        """Creates the tables of the store if needed, and clears the stored scores unless they
+        are of the current contents of the source file"""
+        self._connection.execute('CREATE TABLE IF NOT EXISTS meta '
+                                 '(key TEXT PRIMARY KEY, value INTEGER)')
+
+        stat = os.stat(self.source)
+        stored_size = self._get_meta('source_size')
+        if stored_size is None or self._get_meta('score_version') != SCORE_VERSION \
+                or self._get_meta('source_tail') != tail_hash(self.source, stored_size) \
+                or (stored_size == stat.st_size
+                    and self._get_meta('source_mtime') != stat.st_mtime_ns):
+            with self._connection:
+                # Recreated rather than emptied, since older versions stored other columns
+                self._connection.execute('DROP TABLE IF EXISTS scores')
+                self._connection.execute('CREATE TABLE scores (id_str TEXT PRIMARY KEY, '
+                                         'score REAL)')
+                self._set_source(stat)
+                self._set_meta('score_version', SCORE_VERSION)
+        elif stored_size != stat.st_size:
+            # Lines were appended, which leaves the stored scores as they were
+            with self._connection:
+                self._set_source(stat)
+
+    def _set_source(self, stat: os.stat_result) -> None:
+        """Records the size, modification time and last bytes of the source file"""
+        self._set_meta('source_size', stat.st_size)
+        self._set_meta('source_mtime', stat.st_mtime_ns)
+        self._set_meta('source_tail', tail_hash(self.source, stat.st_size))
+
+    def _get_meta(self, key: str) -> Optional[int]:
+        """Returns the stored value of a meta key, or None if it is not set"""
+        row = self._connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key: str, value: int) -> None:
+        """Sets the value of a meta key"""
+        self._connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    def lookup(self, id_str: str) -> Optional[float]:
+        """Returns the stored score of a tweet, or None if it has not been stored"""
+        return self.lookup_many([id_str])[0]
+
+    def lookup_many(self, ids: list[str]) -> list[Optional[float]]:
+        """Returns the stored score of every tweet in ids, or None for those not stored
+
+        Only the given ids are read from the store, a few hundred per query, so looking up
+        the new lines of a day costs nothing like reading all of its stored scores.
+        """
+        stored = {}
+        for i in range(0, len(ids), _QUERY_SIZE):
+            chunk = ids[i:i + _QUERY_SIZE]
+            stored.update(self._connection.execute(
+                'SELECT id_str, score FROM scores WHERE id_str IN ('
+                + ', '.join('?' * len(chunk)) + ')', chunk))
+        scores = [stored.get(id_str) for id_str in ids]
+        hits = len(ids) - scores.count(None)
+        self.record(hits, len(ids) - hits)
+        return scores
+
+    def record(self, hits: int, misses: int) -> None:
+        """Adds to the hit and miss counts of this store and of store_stats"""
+        self.hits += hits
+        self.misses += misses
+        store_stats.hits += hits
+        store_stats.misses += misses
+
+    def add(self, scores: list[tuple[str, float]]) -> None:
+        """Stores every (tweet id, score) in scores"""
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?)', scores)
+
+    def close(self) -> None:
+        """Closes the connection to the store"""
+        self._connection.close()
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['os', 'sqlite3', 'typing', 'day_state'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -0,0 +1,193 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Rolling sentiment over a range of dates. The region totals of every day come from its stored
+DayState or tweet shard, and days whose totals are missing or out of date are loaded in
+parallel worker processes. The rolling windows of every date and region are then computed at
+once from cumulative sums.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import concurrent.futures
+import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import tracing
+from country_provinces import all_provinces, regions
+from day_state import DayState, complete_size
+from shard import TweetShard
+from text_cache import default_text_cache, save_text_cache
+from tweet import init_worker, refresh_day_state, tweet_dates, tweet_path
+
+# Number of days a rolling window covers unless told otherwise
+DEFAULT_WINDOW = 7
+
+
+def get_sentiment_range(start: datetime.datetime, end: datetime.datetime,
+                        window: int = DEFAULT_WINDOW, workers: Optional[int] = None) \
+        -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the rolling mean sentiment score and the rolling number of scored tweets of
+    every region, on every date from start to end inclusive that has tweets
+
+    Both dataframes are indexed by date and have a column for each region with a tweet in any
+    of the windows. The window of a date is the window days ending on it, so tweets from the
+    days before start count toward the first windows. A region without tweets in a window
+    has a mean of NaN there.
+
+    Days whose totals are not stored yet are loaded in the given number of worker processes,
+    by default one per CPU.
+
+    Here the window of 2020-08-02 reaches back to the tweet of 2020-08-01, the day before
+    start, and the window of 2020-08-04 no longer has the tweets of 2020-08-02. 2020-08-03
+    has no tweets file, so it has no row:
+
+    >>> import json, os, tempfile
+    >>> previous = os.getcwd()
+    >>> os.chdir(tempfile.mkdtemp())
+    >>> for day, tweets in [(1, 1), (2, 2), (4, 4)]:
+    ...     os.makedirs(f'data/2020-08-0{day}')
+    ...     with open(f'data/2020-08-0{day}/hydrated_tweets.json', 'w') as f:
+    ...         for i in range(tweets):
+    ...             _ = f.write(json.dumps({'created_at': 'Sat Aug 01 12:00:00 +0000 2020',
+    ...                                     'id_str': f'{day}{i}', 'full_text': 'I love this',
+    ...                                     'user': {'id': i, 'location': 'Ohio'}}) + '\\n')
+    >>> means, counts = get_sentiment_range(datetime.datetime(2020, 8, 2),
+    ...                                     datetime.datetime(2020, 8, 4), 2, 1)
+    >>> [date.day for date in counts.index], counts['Ohio'].tolist()
+    ([2, 4], [3, 4])
+    >>> list(means.columns), bool(means['Ohio'].nunique() == 1)
+    (['Ohio'], True)
+    >>> os.chdir(previous)
+
+    Preconditions:
+      - start <= end
+      - window >= 1
+      - workers is None or workers >= 1
+    """
+    with tracing.span('sentiment_range'):
+        dates = tweet_dates(start - datetime.timedelta(days=window - 1), end)
+        counts, sums = load_daily_totals(dates, workers)
+
+        ordinals = np.array([date.toordinal() for date in dates], dtype=np.int64)
+        window_counts = rolling_sums(ordinals, counts, window)
+        window_sums = rolling_sums(ordinals, sums, window)
+
+        shown = ordinals >= start.toordinal()
+        window_counts, window_sums = window_counts[shown], window_sums[shown]
+        present = np.flatnonzero(window_counts.any(axis=0))
+        window_counts, window_sums = window_counts[:, present], window_sums[:, present]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+        index = pd.DatetimeIndex([date for date, keep in zip(dates, shown) if keep], name='date')
+        columns = [all_provinces[code] for code in present]
+        return (pd.DataFrame(means, index=index, columns=columns),
+                pd.DataFrame(window_counts, index=index, columns=columns))
+
+
+def load_daily_totals(dates: list[datetime.datetime], workers: Optional[int] = None) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """Returns the number of scored tweets and the sum of their scores of every region on
+    each of the given dates, as arrays with a row per date and a column per region code
+
+    Every date must have a hydrated tweets file. Stored day states that are up to date, and
+    tweet shards that cover a whole day, are read here, and the other days are brought up to
+    date in the given number of worker processes.
+
+    Preconditions:
+      - workers is None or workers >= 1
+    """
+    counts = np.zeros((len(dates), len(regions)), dtype=np.int64)
+    sums = np.zeros((len(dates), len(regions)))
+    stale = []
+    for i, date in enumerate(dates):
+        path = tweet_path(date)
+        state = DayState.load(path)
+        end = complete_size(path)
+        if state.offset != end:
+            shard = TweetShard.load(path)
+            if shard is not None and shard.offset == end:
+                # A whole-day shard is summed faster than a worker could be started
+                state = refresh_day_state(path)
+        if state.offset == end:
+            counts[i], sums[i] = state.totals.counts, state.totals.sums
+        else:
+            stale.append(i)
+
+    if len(stale) == 1 or workers == 1:
+        for i in stale:
+            totals = refresh_day_state(tweet_path(dates[i])).totals
+            counts[i], sums[i] = totals.counts, totals.sums
+    elif stale:
+        # Workers drop the trace records and text scores they were forked with, so none are
+        # merged twice
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                    initializer=init_worker) as executor:
+            futures = {i: executor.submit(_refresh_worker, tweet_path(dates[i])) for i in stale}
+            for i, future in futures.items():
+                counts[i], sums[i], records, text_scores = future.result()
+                tracing.tracer.merge(records)
+                default_text_cache().merge(text_scores)
+        save_text_cache()
+    return counts, sums
+
+
+def _refresh_worker(path: str) -> tuple[np.ndarray, np.ndarray, dict, dict]:
+    """Returns the tweet counts and score sums of every region in a hydrated tweets file, the
+    records of the process's tracer and what its text score cache took, bringing the file's
+    day state up to date
+
+    This runs in a worker process.
+    """
+    totals = refresh_day_state(path).totals
+    return totals.counts, totals.sums, tracing.tracer.take(), default_text_cache().take()
+
+
+def rolling_sums(ordinals: np.ndarray, values: np.ndarray, window: int) -> np.ndarray:
+    """Returns the sums of the rows of values over rolling windows of days
+
+    Row i of values belongs to the day with ordinal ordinals[i], and row i of the result is
+    the sum of the rows of every day in the window days ending on that day. Days without a
+    row count as zero.
+
+    >>> rolling_sums(np.array([1, 2, 3, 10]), np.array([[1], [2], [4], [8]]), 2)
+    array([[1],
+           [3],
+           [6],
+           [8]])
+
+    Preconditions:
+      - ordinals is sorted in increasing order without repeats
+      - len(ordinals) == len(values)
+      - window >= 1
+    """
+    cumulative = np.zeros((len(values) + 1,) + values.shape[1:], dtype=values.dtype)
+    np.cumsum(values, axis=0, out=cumulative[1:])
+    first = np.searchsorted(ordinals, ordinals - (window - 1))
+    return cumulative[1:] - cumulative[first]
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['concurrent.futures', 'datetime', 'typing', 'numpy', 'pandas',
+                          'tracing', 'country_provinces', 'day_state', 'shard', 'text_cache',
+                          'tweet'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
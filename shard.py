@@ -0,0 +1,270 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Tweet shards: the located tweets of a day's hydrated tweets file, already resolved and scored,
+kept as fixed-width binary columns next to the file. Every column is read with numpy.memmap,
+so aggregating a shard only touches the pages it needs and never decodes any json.
+
+A shard is a directory holding one raw little-endian file per column:
+
+    ids.bin           int64    tweet id
+    codes.bin         int16    region code
+    scores.bin        float32  sentiment score
+    timestamps.bin    int64    creation time, in seconds since the epoch
+    user_ids.bin      int64    id of the user who posted the tweet
+    text_hashes.bin   int64    hash of the normalized text, as text_cache.text_hash gives
+    text_offsets.bin  int64    start of each text in text.bin, and the end of the last one
+    text.bin          utf-8    the texts of the tweets, one after another
+
+along with source.json, which records the number of tweets and which part of which version of
+the hydrated tweets file they were read from. It is written last and removed first, so a shard
+is only used once all of its columns are complete.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import json
+import os
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from day_state import is_compressed, tail_hash
+from gazetteer import default_gazetteer
+from region_totals import RegionTotals
+
+# Name of the shard directory kept next to a day's hydrated tweets
+SHARD_DIRNAME = 'tweet_shard'
+
+# Bumped whenever the columns change meaning or layout, so old shards are ingested again
+SHARD_VERSION = 4
+
+# The file and dtype of every fixed-width column, by attribute name
+COLUMNS = {
+    'ids': ('ids.bin', np.dtype('<i8')),
+    'codes': ('codes.bin', np.dtype('<i2')),
+    'scores': ('scores.bin', np.dtype('<f4')),
+    'timestamps': ('timestamps.bin', np.dtype('<i8')),
+    'user_ids': ('user_ids.bin', np.dtype('<i8')),
+    'text_hashes': ('text_hashes.bin', np.dtype('<i8'))
+}
+
+_OFFSETS_FILENAME = 'text_offsets.bin'
+_TEXT_FILENAME = 'text.bin'
+_SIGNATURE_FILENAME = 'source.json'
+
+# Number of tweets added to region totals at a time, which bounds the temporary arrays
+# np.bincount allocates however large the shard is
+_AGGREGATE_ROWS = 1 << 20
+
+
+class TweetShard:
+    """The located tweets of the lines of a hydrated tweets file before a byte offset, as
+    memory-mapped columns
+
+    As with a DayState, the offset is at the start of a line, and a shard only applies to a
+    file that still holds the same bytes before it and to the gazetteer its regions were
+    resolved with.
+
+    Instance Attributes:
+        - source: The path of the hydrated tweets file
+        - offset: The number of bytes of the file the shard covers
+        - ids: The id of each tweet
+        - codes: The region code of each tweet
+        - scores: The sentiment score of each tweet
+        - timestamps: The creation time of each tweet, in seconds since the epoch
+        - user_ids: The id of the user who posted each tweet
+        - text_hashes: The hash of the normalized text of each tweet
+        - text_offsets: The byte range of the text of tweet i is
+          text_bytes[text_offsets[i]:text_offsets[i + 1]]
+        - text_bytes: The utf-8 texts of every tweet, one after another
+
+    Representation Invariants:
+      - self.offset >= 0
+      - all(len(getattr(self, name)) == len(self) for name in COLUMNS)
+      - len(self.text_offsets) == len(self) + 1
+    """
+    source: str
+    offset: int
+    ids: np.ndarray
+    codes: np.ndarray
+    scores: np.ndarray
+    timestamps: np.ndarray
+    user_ids: np.ndarray
+    text_hashes: np.ndarray
+    text_offsets: np.ndarray
+    text_bytes: np.ndarray
+
+    def __init__(self, source: str, offset: int, columns: dict[str, np.ndarray],
+                 text_offsets: np.ndarray, text_bytes: np.ndarray) -> None:
+        self.source = source
+        self.offset = offset
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self.text_offsets = text_offsets
+        self.text_bytes = text_bytes
+
+    @staticmethod
+    def path_of(source: str) -> str:
+        """Returns the directory the shard of a hydrated tweets file is kept in"""
+        return os.path.join(os.path.dirname(source), SHARD_DIRNAME)
+
+    @classmethod
+    def load(cls, source: str) -> Optional['TweetShard']:
+        """Returns the shard of a hydrated tweets file with its columns memory-mapped, or None
+        if there is no shard that still applies to the file"""
+        shard_dir = cls.path_of(source)
+        try:
+            with open(os.path.join(shard_dir, _SIGNATURE_FILENAME)) as f:
+                signature = json.load(f)
+            version, offset, tail, fingerprint, rows, text_size = (
+                signature[key] for key in ('version', 'offset', 'tail', 'fingerprint', 'rows',
+                                           'text_size'))
+        except (OSError, KeyError, ValueError):
+            return None
+
+        if version != SHARD_VERSION or fingerprint != default_gazetteer().fingerprint() \
+                or tail_hash(source, offset) != tail:
+            return None
+        if is_compressed(source) and offset != os.path.getsize(source):
+            # Compressed files cannot be resumed in the middle, so their shards must be whole
+            return None
+
+        try:
+            columns = {name: _map(os.path.join(shard_dir, filename), dtype, rows)
+                       for name, (filename, dtype) in COLUMNS.items()}
+            text_offsets = _map(os.path.join(shard_dir, _OFFSETS_FILENAME), np.dtype('<i8'),
+                                rows + 1)
+            text_bytes = _map(os.path.join(shard_dir, _TEXT_FILENAME), np.dtype(np.uint8),
+                              text_size)
+        except (OSError, ValueError):
+            return None
+        return cls(source, offset, columns, text_offsets, text_bytes)
+
+    def __len__(self) -> int:
+        """Returns the number of tweets in the shard"""
+        return len(self.ids)
+
+    def text(self, i: int) -> str:
+        """Returns the text of the tweet in row i
+
+        Preconditions:
+          - 0 <= i < len(self)
+        """
+        start, end = self.text_offsets[i], self.text_offsets[i + 1]
+        return self.text_bytes[start:end].tobytes().decode('utf-8')
+
+    def unique_texts(self) -> int:
+        """Returns the number of distinct normalized texts among the tweets in the shard"""
+        return len(np.unique(self.text_hashes))
+
+    def region_totals(self) -> RegionTotals:
+        """Returns the region totals of every tweet in the shard"""
+        totals = RegionTotals()
+        for start in range(0, len(self), _AGGREGATE_ROWS):
+            totals.add(self.codes[start:start + _AGGREGATE_ROWS],
+                       self.scores[start:start + _AGGREGATE_ROWS])
+        return totals
+
+
+class ShardWriter:
+    """Writes the shard of a hydrated tweets file a batch of tweets at a time
+
+    Any shard the file already has stops applying as soon as a writer is opened for it, and
+    the new one applies once finish is called.
+
+    Instance Attributes:
+        - source: The path of the hydrated tweets file
+        - rows: The number of tweets written so far
+        - text_size: The number of bytes of text written so far
+    """
+    source: str
+    rows: int
+    text_size: int
+    _files: dict[str, BinaryIO]
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.rows = 0
+        self.text_size = 0
+
+        shard_dir = TweetShard.path_of(source)
+        os.makedirs(shard_dir, exist_ok=True)
+        signature_path = os.path.join(shard_dir, _SIGNATURE_FILENAME)
+        if os.path.exists(signature_path):
+            # Invalidate the old shard before overwriting any of its columns
+            os.remove(signature_path)
+
+        filenames = {name: filename for name, (filename, _) in COLUMNS.items()}
+        filenames['text_offsets'] = _OFFSETS_FILENAME
+        filenames['text'] = _TEXT_FILENAME
+        self._files = {name: open(os.path.join(shard_dir, filename), 'wb')
+                       for name, filename in filenames.items()}
+        self._files['text_offsets'].write(np.zeros(1, dtype='<i8').tobytes())
+
+    def append(self, columns: dict[str, np.ndarray], texts: list[str]) -> None:
+        """Writes a batch of tweets, given the values of every column in COLUMNS and the texts
+
+        Preconditions:
+          - set(columns) == set(COLUMNS)
+          - all(len(column) == len(texts) for column in columns.values())
+        """
+        for name, (_, dtype) in COLUMNS.items():
+            self._files[name].write(np.asarray(columns[name], dtype=dtype).tobytes())
+
+        encoded = [text.encode('utf-8') for text in texts]
+        ends = self.text_size + np.cumsum([len(data) for data in encoded], dtype=np.int64)
+        self._files['text_offsets'].write(ends.astype('<i8').tobytes())
+        self._files['text'].write(b''.join(encoded))
+
+        self.rows += len(texts)
+        if len(ends) > 0:
+            self.text_size = int(ends[-1])
+
+    def finish(self, offset: int) -> None:
+        """Closes the columns and marks the shard as covering the first offset bytes of its
+        file"""
+        self.close()
+        signature = {'version': SHARD_VERSION, 'offset': offset,
+                     'tail': tail_hash(self.source, offset),
+                     'fingerprint': default_gazetteer().fingerprint(),
+                     'rows': self.rows, 'text_size': self.text_size}
+        # Written last, so a shard is only used once all of its columns are complete
+        with open(os.path.join(TweetShard.path_of(self.source), _SIGNATURE_FILENAME), 'w') as f:
+            json.dump(signature, f)
+
+    def close(self) -> None:
+        """Closes the columns, leaving the shard unused unless finish was called"""
+        for f in self._files.values():
+            f.close()
+
+
+def _map(path: str, dtype: np.dtype, count: int) -> np.ndarray:
+    """Returns the first count values of dtype in a file, memory-mapped read-only
+
+    numpy cannot map empty files, so an empty column is returned as an ordinary array.
+    """
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['json', 'os', 'typing', 'numpy', 'day_state', 'gazetteer',
+                          'region_totals'],
+        'allowed-io': ['TweetShard.load', 'ShardWriter.__init__', 'ShardWriter.finish'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
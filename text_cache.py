@@ -0,0 +1,231 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+A cache of sentiment scores keyed by a hash of the tweet text. Retweets and copy-pasted tweets
+make up much of the data, so every distinct text is tokenized and scored once, however many
+tweets, days or worker processes it turns up in.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import collections
+import functools
+import hashlib
+import os
+import re
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Where the text score cache is kept between runs, unless set_text_cache_path says otherwise
+TEXT_CACHE_PATH = os.path.join('data', 'text_scores.npz')
+
+# Most distinct texts the text score cache remembers
+TEXT_CACHE_SIZE = 200000
+
+# Bumped whenever the normalization, the hash or the scoring changes, so old caches are
+# dropped
+TEXT_CACHE_VERSION = 1
+
+# The "RT @user:" a retweet's text starts with
+_RETWEET_PREFIX = re.compile(r'^RT @\w+:\s*')
+
+# Where the default cache is saved to, or None to keep it in memory only
+_settings = {'path': TEXT_CACHE_PATH}
+
+
+def normalize_text(text: str) -> str:
+    """Returns text without a leading retweet prefix, stripped and with every run of whitespace
+    collapsed to one space
+
+    >>> normalize_text('RT @who_else:  Stay   home,\\nstay safe ')
+    'Stay home, stay safe'
+    """
+    return ' '.join(_RETWEET_PREFIX.sub('', text.strip()).split())
+
+
+def text_hash(normalized: str) -> int:
+    """Returns a hash of a normalized text, as a signed 64 bit integer
+
+    >>> text_hash(normalize_text('RT @a: Wash your hands')) == text_hash('Wash your hands')
+    True
+    """
+    digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class TextScoreCache:
+    """A bounded least-recently-used cache from text hashes to sentiment scores
+
+    Scores added since the last take are also remembered separately, so that a worker process
+    can hand what it scored back to its parent. The cache may be shared by several threads.
+
+    Instance Attributes:
+        - max_size: The most texts the cache remembers
+        - hits: The number of tweets whose score came from the cache
+        - misses: The number of tweets that had to be scored
+    """
+    max_size: int
+    hits: int
+    misses: int
+    _scores: collections.OrderedDict
+    _new: collections.OrderedDict
+    _taken: tuple[int, int]
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int = TEXT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._scores = collections.OrderedDict()
+        self._new = collections.OrderedDict()
+        self._taken = (0, 0)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Returns the number of texts in the cache"""
+        return len(self._scores)
+
+    def lookup(self, key: int) -> Optional[float]:
+        """Returns the cached score of the text with the given hash, or None if it is not
+        cached
+
+        Lookups are not counted as hits or misses; callers record those with record, since
+        only they know how many tweets share a text.
+        """
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def add(self, entries: list[tuple[int, float]]) -> None:
+        """Caches the score of every (text hash, score) in entries
+
+        >>> cache = TextScoreCache(max_size=2)
+        >>> cache.add([(1, 0.5), (2, -0.5), (3, 0.0)])
+        >>> cache.lookup(1) is None, cache.lookup(3)
+        (True, 0.0)
+        """
+        with self._lock:
+            for key, score in entries:
+                self._scores[key] = score
+                self._new[key] = score
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+            while len(self._new) > self.max_size:
+                self._new.popitem(last=False)
+
+    def record(self, hits: int, misses: int) -> None:
+        """Adds to the hit and miss counts of the cache"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def hit_rate(self) -> float:
+        """Returns the share of tweets whose score came from the cache, or 0.0 if there were
+        none"""
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def take(self) -> dict:
+        """Returns the (text hash, score) of every text added, and the hits and misses counted,
+        since the last call, and forgets them
+
+        A worker process hands this to its parent, which passes it to merge.
+        """
+        with self._lock:
+            taken = {'entries': list(self._new.items()), 'hits': self.hits - self._taken[0],
+                     'misses': self.misses - self._taken[1]}
+            self._new.clear()
+            self._taken = (self.hits, self.misses)
+        return taken
+
+    def merge(self, taken: dict) -> None:
+        """Adds what another process's cache returned from take to this cache"""
+        self.add(taken['entries'])
+        self.record(taken['hits'], taken['misses'])
+
+    def save(self, path: str) -> None:
+        """Writes the cached scores to a npz file, least recently used first"""
+        with self._lock:
+            keys = np.fromiter(self._scores.keys(), dtype=np.int64, count=len(self._scores))
+            scores = np.fromiter(self._scores.values(), dtype=np.float32,
+                                 count=len(self._scores))
+        # Worker processes may save at the same time, so each writes its own temporary file
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, version=np.array(TEXT_CACHE_VERSION), keys=keys, scores=scores)
+        os.replace(temporary_path, path)
+
+    def load(self, path: str) -> bool:
+        """Adds the scores saved in a npz file to the cache and returns whether that worked
+
+        Nothing is loaded if the file does not exist or was saved by another version.
+        """
+        try:
+            with np.load(path) as saved:
+                if int(saved['version']) != TEXT_CACHE_VERSION:
+                    return False
+                keys, scores = saved['keys'], saved['scores']
+        except (OSError, KeyError, ValueError):
+            return False
+        # Keep the most recently used entries if the file holds more than fit
+        with self._lock:
+            for key, score in zip(keys[-self.max_size:].tolist(),
+                                  scores[-self.max_size:].tolist()):
+                self._scores[key] = score
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+        return True
+
+
+@functools.lru_cache(maxsize=None)
+def default_text_cache() -> TextScoreCache:
+    """Returns the text score cache shared by this process, warm-loaded from the saved cache on
+    first use"""
+    cache = TextScoreCache()
+    if _settings['path'] is not None:
+        cache.load(_settings['path'])
+    return cache
+
+
+def set_text_cache_path(path: Optional[str]) -> None:
+    """Sets where the default text score cache is loaded from and saved to, or keeps it in
+    memory only if path is None
+
+    Preconditions:
+      - default_text_cache has not been called yet in this process
+    """
+    _settings['path'] = path
+
+
+def save_text_cache() -> None:
+    """Saves the default text score cache, if it is kept in a file and the directory of the
+    file exists"""
+    path = _settings['path']
+    if path is not None and os.path.isdir(os.path.dirname(path) or '.'):
+        default_text_cache().save(path)
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'functools', 'hashlib', 'os', 're', 'threading',
+                          'typing', 'numpy'],
+        'allowed-io': ['TextScoreCache.save', 'TextScoreCache.load'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
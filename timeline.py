@@ -0,0 +1,211 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Animated maps over a range of dates. The value of every region on every day is computed once,
+as a date x region matrix for each map mode, and the bin of each value is embedded in a single
+map page, which plays the days with a slider and a play button by recolouring the regions
+itself. Nothing here imports Qt, so timelines can be exported on servers.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import base64
+import datetime
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import map_page
+import tracing
+from correlation import case_matrix
+from country_provinces import all_provinces
+from covid_data import CovidData
+from data_service import SENTIMENT_BINS, load_geometry
+from geometry import DEFAULT_TOLERANCE
+from region_totals import CANADA_REGIONS
+from sentiment_range import get_sentiment_range
+
+# The map modes a timeline can play
+TIMELINE_MODES = ['covid', 'sentiment']
+
+# Milliseconds each day is shown for while a timeline plays
+FRAME_MILLISECONDS = 120
+
+# The bin given to a region without a value on a day
+_NO_VALUE = 255
+
+
+class Timeline:
+    """The value of every region on every day of a range, for each of some map modes
+
+    Instance Attributes:
+        - dates: The day of each row, one for every day of the range
+        - values: The values of each mode, with a row per day and a column per region code, or
+          NaN where a region has no value
+        - bins: The bin boundaries of each mode, shared by every day
+
+    Representation Invariants:
+      - self.values.keys() == self.bins.keys()
+      - all(values.shape == (len(self.dates), len(all_provinces))
+            for values in self.values.values())
+    """
+    dates: list[datetime.datetime]
+    values: dict[str, np.ndarray]
+    bins: dict[str, list[float]]
+
+    def __init__(self, dates: list[datetime.datetime], values: dict[str, np.ndarray],
+                 bins: dict[str, list[float]]) -> None:
+        self.dates = dates
+        self.values = values
+        self.bins = bins
+
+    def frame(self, mode: str, row: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Returns the Canadian and American data of a mode on the day of a row, with the
+        columns map_page.MAP_COLUMNS gives the mode
+
+        Preconditions:
+          - mode in self.values
+          - 0 <= row < len(self.dates)
+        """
+        values = self.values[mode][row]
+        present = np.flatnonzero(~np.isnan(values))
+        frames = []
+        for columns, in_country in zip(map_page.MAP_COLUMNS[mode],
+                                       (present < CANADA_REGIONS, present >= CANADA_REGIONS)):
+            codes = present[in_country]
+            frames.append(pd.DataFrame({columns[0]: [all_provinces[code] for code in codes],
+                                        columns[1]: values[codes]}))
+        return frames[0], frames[1]
+
+    def payload(self) -> dict:
+        """Returns what the timeline page plays: the dates, the region of every column, and for
+        each mode its legend and the bin of every value
+
+        The bins of a mode are one byte per value, in a base64 string with a row per day, which
+        keeps even years of days for every region a small part of the page.
+        """
+        series = []
+        for mode, values in self.values.items():
+            bins = self.bins[mode]
+            indices = np.full(values.shape, _NO_VALUE, dtype=np.uint8)
+            palette = map_page.bin_palette(bins)
+            if palette:
+                present = ~np.isnan(values)
+                indices[present] = map_page.bin_indices(values[present], bins)
+            series.append({'legend_name': map_page.LEGEND_NAMES[mode], 'palette': palette,
+                           'labels': [f'{edge:.4g}' for edge in bins],
+                           'bins': base64.b64encode(indices.tobytes()).decode('ascii')})
+        return {'dates': [date.strftime('%Y-%m-%d') for date in self.dates],
+                'regions': [['ca' if code < CANADA_REGIONS else 'us', name]
+                            for code, name in enumerate(all_provinces)],
+                'series': series, 'frame_ms': FRAME_MILLISECONDS,
+                'nan_color': map_page.NAN_FILL_COLOR, 'fill_opacity': map_page.FILL_OPACITY,
+                'line_opacity': map_page.LINE_OPACITY}
+
+    def to_html(self, geometry: Optional[tuple[dict, dict]] = None,
+                geometry_url: Optional[str] = None) -> str:
+        """Returns the map page that plays the timeline, as map_page.timeline_html builds it
+
+        Preconditions:
+          - self.dates != []
+          - geometry_url is None or geometry is not None
+        """
+        mode = next(iter(self.values))
+        ca_data, us_data = self.frame(mode, 0)
+        with tracing.span('timeline.html'):
+            return map_page.timeline_html(mode, ca_data, us_data, self.bins[mode],
+                                          self.payload(), geometry, geometry_url)
+
+
+def build_timeline(modes: list[str], start: datetime.datetime, end: datetime.datetime,
+                   covid_data: Optional[CovidData] = None,
+                   workers: Optional[int] = None, window: int = 1) -> Timeline:
+    """Returns the timeline of the given modes over every day from start to end inclusive,
+    leaving out the days before the first and after the last that have any value
+
+    Covid cases are binned over the whole range, so the colours of different days compare.
+    The sentiment of a day is the mean over the window days ending on it, as
+    get_sentiment_range computes it, and days whose sentiment is not stored yet are loaded in
+    the given number of worker processes, by default one per CPU. covid_data is read from its
+    files if it is not given.
+
+    Preconditions:
+      - modes != [] and all(mode in TIMELINE_MODES for mode in modes)
+      - start <= end
+      - workers is None or workers >= 1
+      - window >= 1
+    """
+    values, bins = {}, {}
+    with tracing.span('timeline.build'):
+        if 'covid' in modes:
+            if covid_data is None:
+                covid_data = CovidData()
+            values['covid'] = case_matrix(covid_data, start, end)
+            bins['covid'] = covid_data.get_range(start, end)[2]
+        if 'sentiment' in modes:
+            means = get_sentiment_range(start, end, window, workers)[0]
+            values['sentiment'] = means.reindex(index=pd.date_range(start, end),
+                                                columns=all_provinces).to_numpy(np.float64)
+            bins['sentiment'] = SENTIMENT_BINS
+
+    has_value = np.flatnonzero(np.any([~np.isnan(matrix).all(axis=1)
+                                       for matrix in values.values()], axis=0))
+    if len(has_value) == 0:
+        return Timeline([], {mode: matrix[:0] for mode, matrix in values.items()}, bins)
+    first, last = has_value[0], has_value[-1] + 1
+    dates = [start + datetime.timedelta(days=int(i)) for i in range(first, last)]
+    return Timeline(dates, {mode: matrix[first:last] for mode, matrix in values.items()}, bins)
+
+
+def export_timeline(modes: list[str], start: datetime.datetime, end: datetime.datetime,
+                    out_dir: str, workers: Optional[int] = None,
+                    tolerance: float = DEFAULT_TOLERANCE, window: int = 1) -> Timeline:
+    """Writes the timeline page of the given modes from start to end inclusive, along with the
+    date x region matrix of each mode, and returns the timeline
+
+    The page goes to out_dir/timeline.html, with the simplified boundaries inline, and the
+    matrices to out_dir/timeline_<mode>.csv. Nothing is written if no day has a value. The
+    sentiment of a day is the mean over the window days ending on it.
+
+    Preconditions:
+      - modes != [] and all(mode in TIMELINE_MODES for mode in modes)
+      - start <= end
+      - workers is None or workers >= 1
+      - window >= 1
+    """
+    timeline = build_timeline(modes, start, end, workers=workers, window=window)
+    if not timeline.dates:
+        return timeline
+
+    os.makedirs(out_dir, exist_ok=True)
+    index = pd.DatetimeIndex(timeline.dates, name='date')
+    for mode, values in timeline.values.items():
+        pd.DataFrame(values, index=index, columns=all_provinces).to_csv(
+            os.path.join(out_dir, 'timeline_' + mode + '.csv'))
+    with open(os.path.join(out_dir, 'timeline.html'), 'w') as f:
+        f.write(timeline.to_html(load_geometry(tolerance)))
+    return timeline
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['base64', 'datetime', 'os', 'typing', 'numpy', 'pandas', 'map_page',
+                          'tracing', 'correlation', 'country_provinces', 'covid_data',
+                          'data_service', 'geometry', 'region_totals', 'sentiment_range'],
+        'allowed-io': ['export_timeline'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
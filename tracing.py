@@ -0,0 +1,274 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Stage-level tracing of the pipeline: timed spans, counters, and an optional cProfile capture
+of one date load. Tracing is off unless the COVEET_TRACE environment variable is set or
+main.py is run with --trace, and costs next to nothing while off.
+
+    COVEET_TRACE=1 python main.py --mode covid            # summary table on exit
+    COVEET_TRACE=trace.json python main.py --mode covid   # also a Chrome trace
+    COVEET_PROFILE=load.prof python main.py --mode covid  # cProfile of the first date load
+
+Chrome traces open in chrome://tracing or https://ui.perfetto.dev.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, ContextManager, Optional
+
+TRACE_ENV = 'COVEET_TRACE'
+PROFILE_ENV = 'COVEET_PROFILE'
+
+# Returned by span while tracing is off; entering it does nothing
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """The spans and counters recorded by this process
+
+    Instance Attributes:
+        - enabled: Whether anything is recorded
+        - trace_path: Where the Chrome trace is written on exit, if anywhere
+        - profile_path: Where the next profile() capture is written, if anywhere
+    """
+    enabled: bool
+    trace_path: Optional[str]
+    profile_path: Optional[str]
+    _lock: threading.Lock
+    _events: list[tuple[str, float, float, int, int]]
+    _totals: dict[str, list]
+    _counters: dict[str, float]
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_path = None
+        self.profile_path = None
+        self._lock = threading.Lock()
+        self._events = []
+        self._totals = {}
+        self._counters = {}
+
+    def add_span(self, name: str, start: float, seconds: float) -> None:
+        """Records a span of the current thread that started at the perf_counter time start"""
+        with self._lock:
+            self._events.append((name, start, seconds, os.getpid(), threading.get_ident()))
+            self._add_total(name, seconds, 1)
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        """Adds time spent in calls too short to record as spans of their own"""
+        with self._lock:
+            self._add_total(name, seconds, calls)
+
+    def _add_total(self, name: str, seconds: float, calls: int) -> None:
+        """Adds to the totals of a name; the lock must be held"""
+        if name not in self._totals:
+            self._totals[name] = [0, 0.0]
+        self._totals[name][0] += calls
+        self._totals[name][1] += seconds
+
+    def count(self, name: str, n: float = 1) -> None:
+        """Adds n to a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def take_profile_path(self) -> Optional[str]:
+        """Returns the profile path and clears it, so that only one capture is written"""
+        with self._lock:
+            path, self.profile_path = self.profile_path, None
+        return path
+
+    def take(self) -> dict:
+        """Returns everything recorded so far and forgets it, so that a worker process can hand
+        its records to the process that merges them"""
+        with self._lock:
+            records = {'events': self._events, 'totals': self._totals,
+                       'counters': self._counters}
+            self._events, self._totals, self._counters = [], {}, {}
+        return records
+
+    def merge(self, records: dict) -> None:
+        """Adds the records returned by take in another process to this one"""
+        with self._lock:
+            self._events.extend(tuple(event) for event in records['events'])
+            for name, (calls, seconds) in records['totals'].items():
+                self._add_total(name, seconds, calls)
+            for name, n in records['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def summary(self) -> str:
+        """Returns a table of the time spent under every name and of every counter"""
+        with self._lock:
+            totals = sorted(self._totals.items(), key=lambda item: -item[1][1])
+            counters = sorted(self._counters.items())
+        lines = [f'{"stage":<34}{"calls":>10}{"total ms":>12}{"mean ms":>10}']
+        for name, (calls, seconds) in totals:
+            lines.append(f'{name:<34}{calls:>10}{seconds * 1000:>12.1f}'
+                         f'{seconds * 1000 / max(calls, 1):>10.3f}')
+        lines.append(f'{"counter":<34}{"value":>10}')
+        lines.extend(f'{name:<34}{n:>10g}' for name, n in counters)
+        return '\n'.join(lines)
+
+    def chrome_trace(self) -> dict:
+        """Returns the spans and counters in the Chrome trace event format
+
+        Times are perf_counter times in microseconds, which worker processes share with this
+        one on Linux and macOS.
+        """
+        with self._lock:
+            events = [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': seconds * 1e6,
+                       'pid': pid, 'tid': tid}
+                      for name, start, seconds, pid, tid in self._events]
+            end = max((event['ts'] + event['dur'] for event in events), default=0)
+            events.extend({'name': name, 'ph': 'C', 'ts': end, 'pid': os.getpid(),
+                           'args': {'value': n}} for name, n in self._counters.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def report(self) -> None:
+        """Prints the summary table and writes the Chrome trace, if one was asked for"""
+        print(self.summary(), file=sys.stderr)
+        if self.trace_path:
+            with open(self.trace_path, 'w') as f:
+                json.dump(self.chrome_trace(), f)
+            print('Chrome trace written to ' + self.trace_path, file=sys.stderr)
+
+
+class _Span:
+    """A context manager that records the time spent inside it as a span"""
+    _name: str
+    _start: float
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        tracer.add_span(self._name, self._start, time.perf_counter() - self._start)
+
+
+tracer = Tracer()
+
+
+def enabled() -> bool:
+    """Returns whether tracing is on"""
+    return tracer.enabled
+
+
+def span(name: str) -> ContextManager:
+    """Returns a context manager that records the time spent inside it under name"""
+    if not tracer.enabled:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def count(name: str, n: float = 1) -> None:
+    """Adds n to a counter, if tracing is on"""
+    if tracer.enabled:
+        tracer.count(name, n)
+
+
+def timed(name: str, function: Callable) -> Callable:
+    """Returns function, or if tracing is on a wrapper of it that adds the time of every call
+    under name
+
+    Meant for functions called once per tweet, which would make far too many spans.
+    """
+    if not tracer.enabled:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            tracer.add_time(name, time.perf_counter() - start)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def profile() -> ContextManager:
+    """Returns a context manager that profiles the code inside it with cProfile, the first
+    time it is entered with a profile path set; the profile is written to that path
+
+    Only the thread that enters it is profiled.
+    """
+    path = tracer.take_profile_path()
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print('Profile written to ' + path, file=sys.stderr)
+
+
+def enable(trace_path: Optional[str] = None) -> None:
+    """Turns tracing on, reporting on exit and writing a Chrome trace to trace_path if given
+
+    The setting is also put in the environment, so that worker processes trace as well.
+    """
+    os.environ[TRACE_ENV] = trace_path or '1'
+    _configure()
+
+
+def enable_profile(profile_path: str) -> None:
+    """Makes the next profile() capture write its profile to profile_path"""
+    tracer.profile_path = profile_path
+
+
+def _configure() -> None:
+    """Sets up tracing from the environment variables
+
+    Only the main process reports on exit; worker processes hand their records over with
+    Tracer.take.
+    """
+    setting = os.environ.get(TRACE_ENV, '')
+    was_enabled = tracer.enabled
+    tracer.enabled = setting not in {'', '0'}
+    tracer.trace_path = setting if setting.endswith('.json') else None
+    tracer.profile_path = tracer.profile_path or os.environ.get(PROFILE_ENV) or None
+    if tracer.enabled and not was_enabled and multiprocessing.parent_process() is None:
+        atexit.register(tracer.report)
+
+
+_configure()
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['atexit', 'contextlib', 'cProfile', 'functools', 'json',
+                          'multiprocessing', 'os', 'sys', 'threading', 'time', 'typing'],
+        'allowed-io': ['Tracer.report', 'profile'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })
@@ -4,15 +4,118 @@ Copyright and Usage Information
 ===============================
 This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
 """
-import json
+import bz2
+import concurrent.futures
+import gzip
 import datetime
-from statistics import mean
+import functools
+import io
+import os
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
+import numpy as np
 import pandas as pd
 
-from country_provinces import country_provinces
+from country_provinces import regions, region_codes
+from gazetteer import NO_REGION, resolve_region, save_location_cache
+from day_state import DayState, complete_size, is_compressed
+from region_totals import RegionTotals
+from score_store import ScoreStore
+from shard import TweetShard
+from text_cache import default_text_cache, normalize_text, save_text_cache, text_hash
+from tweet_json import parse_fields
+import tracing
+
+if TYPE_CHECKING:
+    from nltk.sentiment import SentimentIntensityAnalyzer
+
+
+# Number of tweets handed to score_texts at once, which is also the most tweets the
+# streaming pipeline keeps in memory
+SCORING_BATCH_SIZE = 5000
+
+
+class ScoringStats:
+    """Running totals for the sentiment scoring done in this process
+
+    Instance Attributes:
+        - tweets: The number of tweets scored so far
+        - seconds: The wall time spent scoring them
+    """
+    tweets: int
+    seconds: float
+
+    def __init__(self) -> None:
+        self.tweets = 0
+        self.seconds = 0.0
+
+    def rate(self) -> float:
+        """Returns the number of tweets scored per second, or 0.0 if nothing was scored yet"""
+        if self.seconds == 0.0:
+            return 0.0
+        return self.tweets / self.seconds
+
+    def reset(self) -> None:
+        """Clears the running totals"""
+        self.tweets = 0
+        self.seconds = 0.0
+
+
+scoring_stats = ScoringStats()
+
+
+@functools.lru_cache(maxsize=None)
+def get_analyzer() -> 'SentimentIntensityAnalyzer':
+    """Returns the sentiment analyzer shared by this process, building it on first use
+
+    Building an analyzer reloads the whole VADER lexicon, so every scoring call in a process
+    goes through this one instance. NLTK is imported here and in sent_tokenize rather than
+    with this module, so that modes which never score a tweet never load it.
+    """
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+
+def sent_tokenize(text: str) -> list[str]:
+    """Returns the sentences of a text, as nltk.sent_tokenize splits them"""
+    import nltk
+    return nltk.sent_tokenize(text)
+
+
+def score_texts(texts: list[list[str]]) -> np.ndarray:
+    """Returns the average compound sentiment score of every tokenized text in texts
+
+    Each element of texts is the list of sentences of one tweet, as returned by
+    sent_tokenize. A tweet without any sentence scores 0.0. The time taken is added
+    to scoring_stats, so scoring_stats.rate() reports the tweets scored per second.
+    """
+    sia = get_analyzer()
+    start = time.perf_counter()
+
+    scores = np.zeros(len(texts))
+    for i, sentences in enumerate(texts):
+        if sentences:
+            scores[i] = sum(sia.polarity_scores(s)["compound"] for s in sentences) \
+                / len(sentences)
+
+    scoring_stats.tweets += len(texts)
+    scoring_stats.seconds += time.perf_counter() - start
+    return scores
+
+
+def resolve_location(location: str) -> Optional[tuple[str, str]]:
+    """Returns the (country, state/province) named in a user location, or None if there is none
+
+    >>> resolve_location('Austin texas')
+    ('United States', 'texas')
+    >>> resolve_location('somewhere') is None
+    True
+    """
+    code = resolve_region(location)
+    if code == NO_REGION:
+        return None
+    return regions[code]
 
 
 class Tweet:
@@ -26,43 +129,52 @@ class Tweet:
         - score: The sentiment score of the tweet
     """
     _text: str
-    _tokenized_text: list
+    _tokenized_text: Optional[list]
     _location: str
     _country: str
     _score: float
 
     def __init__(self, text: str, location: str) -> None:
         self._text = text
-        self._tokenized_text = []
+        # Tokenized on first use, since tweets scored by load_tweets never need it
+        self._tokenized_text = None
         self._location = location
         self._country = ''
         self._score = 0.0
-        self.tokenize_text()
-        self.analyze_sentiment()
 
     def tokenize_text(self) -> None:
         """Tokenizes the text of the tweet"""
-        self._tokenized_text = nltk.sent_tokenize(self._text)
+        self._tokenized_text = sent_tokenize(self._text)
 
     def analyze_sentiment(self) -> None:
-        """Sets average sentiment of a tweet from its tokenized text"""
-        sia = SentimentIntensityAnalyzer()
-        scores = [sia.polarity_scores(s)["compound"] for s in self._tokenized_text]
-        self._score = mean(scores)
+        """Sets average sentiment of a tweet from its tokenized text
+
+        Scoring many tweets is much faster with score_tweet_texts, which load_tweets uses.
+        """
+        self._score = float(score_texts([self.get_tokenized_text()])[0])
+
+    def get_text(self) -> str:
+        """Returns the text of the tweet"""
+        return self._text
+
+    def get_tokenized_text(self) -> list:
+        """Returns the tokenized text of the tweet"""
+        if self._tokenized_text is None:
+            self.tokenize_text()
+        return self._tokenized_text
+
+    def set_score(self, score: float) -> None:
+        """Sets the sentiment score of the tweet"""
+        self._score = score
 
     def process_location(self) -> bool:
         """Set the user_location attribute to the state/province of the user
         Return whether this was successful"""
-
-        tokenized_location = self._location.split(' ')
-        for word in tokenized_location:
-            if word.lower() in country_provinces['Canada'] or \
-                    word.lower() in country_provinces['United States']:
-                self._location = word.lower()
-                self._country = 'Canada' if word.lower() in country_provinces['Canada'] \
-                    else 'United States'
-                return True
-        return False
+        region = resolve_location(self._location)
+        if region is None:
+            return False
+        self._country, self._location = region
+        return True
 
     def get_location(self) -> str:
         """Returns the location of the tweet"""
@@ -81,76 +193,449 @@ class Tweet:
         return self._text[:100] + '...'
 
 
-def get_tweets(date: datetime.datetime) -> tuple[pd.DataFrame, pd.DataFrame]:
+def get_tweets(date: datetime.datetime, workers: int = 1, use_store: bool = True) \
+        -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     Returns the average tweet sentiment for every region and the maximum for all the regions
     given a date. The resulting tuple holds the american data at index 0 and the canadian data
     at index 1.
 
+    With workers > 1 the day's file is split into byte ranges that are processed in that many
+    worker processes; the result is the same as the serial one up to floating point rounding.
+
+    With use_store, the day's totals are kept in its DayState and scores in its ScoreStore.
+    Later calls then only decode and score the lines appended to the file since, if any. A day
+    ingested into a tweet shard is summed from the shard's columns without decoding any json.
+
     Preconditions:
       - date in self.possible_dates
+      - workers >= 1
     """
-    path = "data\\" + date.strftime('%Y-%m-%d') + "\\hydrated_tweets.json"
+    with tracing.span('get_tweets'):
+        return create_dataframe_from_totals(get_region_totals(date, workers, use_store))
 
-    prefilter_tweets = load_tweets(path)
-    tweets = []
-    for tweet in prefilter_tweets:
-        if tweet.process_location():
-            tweets.append(tweet)
-    ca_data, us_data = create_dataframe(tweets)
 
-    return ca_data, us_data
+def get_region_totals(date: datetime.datetime, workers: int = 1, use_store: bool = True) \
+        -> RegionTotals:
+    """Returns the region totals of the tweets of a date, as get_tweets loads them
+
+    Preconditions:
+      - workers >= 1
+    """
+    path = tweet_path(date)
+    if use_store:
+        return refresh_day_state(path, workers).totals
+
+    totals = load_region_totals_parallel(path, workers, None)
+    save_location_cache()
+    save_text_cache()
+    return totals
+
+
+def refresh_day_state(path: str, workers: int = 1) -> DayState:
+    """Returns the day state of a hydrated tweets file after adding every complete line
+    appended to the file since it was stored, and stores it again if anything was added
+
+    A file that changed in any other way is processed again from the start. If the file has
+    a tweet shard covering more of it than the state does, the state starts from the shard's
+    totals instead, so only lines after the shard are decoded.
+
+    Preconditions:
+      - workers >= 1
+    """
+    state = DayState.load(path)
+    end = complete_size(path)
+    if state.offset == end:
+        return state
+
+    shard = TweetShard.load(path)
+    if shard is not None and state.offset < shard.offset <= end:
+        with tracing.span('tweets.shard_totals'):
+            state = DayState(path)
+            state.advance(shard.offset, shard.region_totals())
+        if state.offset == end:
+            state.save()
+            return state
+
+    with tracing.span('tweets.refresh'):
+        tracing.count('tweets.refreshed_bytes', end - state.offset)
+        store = ScoreStore(path)
+        try:
+            if is_compressed(path):
+                totals = load_region_totals_parallel(path, workers, store)
+            else:
+                totals = load_region_totals_parallel(path, workers, store, state.offset, end)
+        finally:
+            store.close()
+        state.advance(end, totals)
+        state.save()
+        save_location_cache()
+        save_text_cache()
+    return state
+
+
+def has_stored_totals(path: str) -> bool:
+    """Returns whether the totals of every complete line of a hydrated tweets file are stored
+    in its day state or tweet shard, so that loading them needs no tweet-level work"""
+    end = complete_size(path)
+    if DayState.load(path).offset == end:
+        return True
+    shard = TweetShard.load(path)
+    return shard is not None and shard.offset == end
+
+
+def tweet_path(date: datetime.datetime) -> str:
+    """Returns the path of the hydrated tweets file for the given date
+
+    A gzip or bz2 compressed hydrated_tweets.json.gz or hydrated_tweets.json.bz2 is used when
+    the uncompressed file does not exist.
+    """
+    path = os.path.join('data', date.strftime('%Y-%m-%d'), 'hydrated_tweets.json')
+    for candidate in (path, path + '.gz', path + '.bz2'):
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def tweet_dates(start: Optional[datetime.datetime] = None,
+                end: Optional[datetime.datetime] = None) -> list[datetime.datetime]:
+    """Returns every date from start to end inclusive, by default every date, that has a
+    hydrated tweets file in data/, in order
+    """
+    if not os.path.isdir('data'):
+        return []
+    dates = []
+    for name in os.listdir('data'):
+        try:
+            date = datetime.datetime.strptime(name, '%Y-%m-%d')
+        except ValueError:
+            continue
+        if (start is None or start <= date) and (end is None or date <= end) \
+                and os.path.exists(tweet_path(date)):
+            dates.append(date)
+    return sorted(dates)
+
+
+def open_tweet_file(filename: str) -> io.BufferedIOBase:
+    """Opens a tweet file for reading bytes, decompressing it if it is gzip or bz2 compressed
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    elif filename.endswith('.bz2'):
+        return bz2.open(filename, 'rb')
+    else:
+        return open(filename, 'rb')
+
+
+def iter_lines(filename: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yields the lines of a tweet file whose first byte is in the range [start, end)
+
+    An end of None reads to the end of the file.
+
+    Preconditions:
+      - not is_compressed(filename) or (start == 0 and end is None)
+    """
+    with open_tweet_file(filename) as f:
+        if start > 0:
+            # Skip the rest of the line that started before this range
+            f.seek(start - 1)
+            f.readline()
+        while end is None or f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
+
+
+def iter_located_tweets(lines: Iterable[bytes]) -> Iterator[tuple[str, int, str]]:
+    """Yields the (tweet id, region code, text) of every tweet in lines of json whose user
+    location names a state or province
+    """
+    for fields, code in iter_located_records(lines):
+        yield fields['id_str'], code, fields['text']
+
+
+def iter_located_records(lines: Iterable[bytes]) -> Iterator[tuple[dict, int]]:
+    """Yields the fields tweet_json.parse_fields reads and the region code of every tweet in
+    lines of json whose user location names a state or province
+
+    Lines whose user has no location are rejected without being decoded, and the location is
+    resolved before anything is done with the rest of the tweet.
+    """
+    # Per-tweet calls are only timed while tracing, and the counts are reported once at the end
+    parse = tracing.timed('tweets.parse', parse_fields)
+    resolve = tracing.timed('tweets.location', resolve_region)
+    read = decoded = located = 0
+    try:
+        for line in lines:
+            read += 1
+            fields = parse(line)
+            if fields is None:
+                continue
+            decoded += 1
+            code = resolve(fields['location'])
+            if code != NO_REGION:
+                located += 1
+                yield fields, code
+    finally:
+        tracing.count('tweets.read', read)
+        tracing.count('tweets.dropped_no_location', read - decoded)
+        tracing.count('tweets.dropped_by_location_filter', decoded - located)
+        tracing.count('tweets.located', located)
+
+
+def iter_scored_batches(located: Iterable[tuple[str, int, str]],
+                        batch_size: int = SCORING_BATCH_SIZE,
+                        store: Optional[ScoreStore] = None) \
+        -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Yields the region codes and sentiment scores of the located tweets, as int16 and float32
+    arrays of up to batch_size tweets each
+
+    Tweets are tokenized and scored batch_size at a time, so no more than one batch of texts is
+    held in memory. If a store is given, the stored scores of each batch are looked up at once,
+    tweets with a stored score are not scored again and new scores are added to the store.
+    """
+    batch = []
+    for tweet in located:
+        batch.append(tweet)
+        if len(batch) == batch_size:
+            yield np.array([code for _, code, _ in batch], np.int16), score_located(batch, store)
+            batch = []
+    yield np.array([code for _, code, _ in batch], np.int16), score_located(batch, store)
+
+
+def _score_batch(batch: list[tuple[str, int, str]],
+                 store: Optional[ScoreStore]) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the region codes and sentiment scores of the located tweets in batch, adding
+    them to the store if one is given
+    """
+    scores = score_tweet_texts([text for _, _, text in batch])
+    codes = np.array([code for _, code, _ in batch], dtype=np.int16)
+    if store is not None and batch:
+        with tracing.span('tweets.store_add'):
+            store.add([(id_str, float(score)) for (id_str, _, _), score in zip(batch, scores)])
+    return codes, scores
+
+
+def score_tweet_texts(texts: list[str]) -> np.ndarray:
+    """Returns the sentiment score of every tweet text, as a float32 array
+
+    Texts are normalized first, so a retweet or a copy of a text with different spacing gets
+    the same score, and each distinct normalized text is tokenized and scored once. Scores are
+    looked up in and added to the default text score cache, which counts a tweet as a hit if
+    it did not have to be scored.
+    """
+    cache = default_text_cache()
+    scores = np.zeros(len(texts), dtype=np.float32)
+    # The normalized text and the rows of every text that is not cached, by hash
+    unscored = {}
+    with tracing.span('tweets.text_cache'):
+        for i, text in enumerate(texts):
+            normalized = normalize_text(text)
+            key = text_hash(normalized)
+            if key in unscored:
+                unscored[key][1].append(i)
+                continue
+            score = cache.lookup(key)
+            if score is None:
+                unscored[key] = (normalized, [i])
+            else:
+                scores[i] = score
+
+    with tracing.span('tweets.tokenize'):
+        tokenized = [sent_tokenize(normalized) for normalized, _ in unscored.values()]
+    with tracing.span('tweets.vader'):
+        new_scores = score_texts(tokenized).astype(np.float32)
+    for (_, rows), score in zip(unscored.values(), new_scores):
+        scores[rows] = score
+
+    cache.add(list(zip(unscored.keys(), new_scores.tolist())))
+    cache.record(len(texts) - len(unscored), len(unscored))
+    tracing.count('tweets.scored', len(unscored))
+    tracing.count('tweets.text_cache_hits', len(texts) - len(unscored))
+    return scores
+
+
+def score_located(batch: list[tuple[str, int, str]],
+                  store: Optional[ScoreStore] = None) -> np.ndarray:
+    """Returns the sentiment scores of the located tweets in batch, in order, as a float32
+    array
+
+    If a store is given, tweets with a stored score are not scored again and new scores are
+    added to the store.
+    """
+    scores = np.zeros(len(batch), dtype=np.float32)
+    unscored = []
+    stored = [None] * len(batch) if store is None \
+        else store.lookup_many([id_str for id_str, _, _ in batch])
+    for i, score in enumerate(stored):
+        if score is None:
+            unscored.append(i)
+        else:
+            scores[i] = score
+    tracing.count('tweets.stored_scores', len(batch) - len(unscored))
+    scores[unscored] = _score_batch([batch[i] for i in unscored], store)[1]
+    return scores
+
+
+def split_file(filename: str, chunks: int, start: int = 0, end: Optional[int] = None) \
+        -> list[tuple[int, int]]:
+    """Splits the byte range [start, end) of a file, by default all of it, into at most the
+    given number of (start, end) byte ranges of similar size
+
+    The ranges cover the whole range. A line belongs to the range its first byte falls in, so
+    each line is read by exactly one range even though the boundaries are not line-aligned.
+
+    Preconditions:
+      - chunks >= 1
+    """
+    end = os.path.getsize(filename) if end is None else end
+    step = max((end - start) // chunks, 1)
+    boundaries = list(range(start, end, step))[:chunks] + [end]
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)]
+
+
+def load_region_totals(filename: str, start: int = 0, end: Optional[int] = None,
+                       store: Optional[ScoreStore] = None) -> RegionTotals:
+    """Returns the region totals of the located tweets whose line starts in the byte range
+    [start, end) of a json file
+
+    The file is streamed, so memory use does not grow with its size. If a store is given,
+    stored scores are reused and new ones are added to it.
+
+    Preconditions:
+      - not is_compressed(filename) or (start == 0 and end is None)
+    """
+    totals = RegionTotals()
+    for codes, scores in iter_scored_batches(iter_located_tweets(
+            iter_lines(filename, start, end)), store=store):
+        totals.add(codes, scores)
+    return totals
+
+
+def init_worker() -> None:
+    """Prepares a worker process that scores tweets: builds its analyzer, and drops any trace
+    records and new text scores it was forked with so they are not merged back twice"""
+    get_analyzer()
+    tracing.tracer.take()
+    default_text_cache().take()
+
+
+def _load_region_totals_worker(filename: str, start: int, end: int, use_store: bool) \
+        -> tuple[RegionTotals, int, int, dict, dict]:
+    """Returns the region totals of a byte range of a json file along with the number of hits
+    and misses in the file's score store, the records of the process's tracer and what its
+    text score cache took, for use in a worker process
+    """
+    if not use_store:
+        totals = load_region_totals(filename, start, end)
+        return totals, 0, 0, tracing.tracer.take(), default_text_cache().take()
+
+    store = ScoreStore(filename)
+    try:
+        totals = load_region_totals(filename, start, end, store)
+    finally:
+        store.close()
+    return totals, store.hits, store.misses, tracing.tracer.take(), default_text_cache().take()
+
+
+def load_region_totals_parallel(filename: str, workers: int,
+                                store: Optional[ScoreStore] = None, start: int = 0,
+                                end: Optional[int] = None) -> RegionTotals:
+    """Returns the region totals of the lines starting in the byte range [start, end) of a json
+    file, by default all of it, processing parts of the range in a pool of worker processes
+
+    With a single worker, or a compressed file that cannot be split into byte ranges, the file
+    is processed in this process. If a store is given, every worker reuses and adds to it.
+    Scores the workers add to their text score caches are added to this process's.
+
+    The totals are those of processing the file in this process, whichever bytes the ranges
+    of the workers split it at:
+
+    >>> import json, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'hydrated_tweets.json')
+    >>> texts = ['I love this', 'This is awful and sad', 'ok', 'Great news today!']
+    >>> with open(path, 'w') as f:
+    ...     for i in range(40):
+    ...         _ = f.write(json.dumps({'created_at': 'Sat Aug 01 12:00:00 +0000 2020',
+    ...                                 'id_str': str(i), 'full_text': texts[i % 4] * (i % 7 + 1),
+    ...                                 'user': {'id': i, 'location': ['Ohio', 'Toronto, ON',
+    ...                                                                'Utah', ''][i % 4]}})
+    ...                     + '\\n')
+    >>> serial = load_region_totals_parallel(path, 1)
+    >>> middle = split_file(path, 3)[1][0]
+    >>> open(path, 'rb').read()[middle - 1:middle] != b'\\n'  # it starts mid-line
+    True
+    >>> parallel = load_region_totals_parallel(path, 3)
+    >>> int(serial.counts.sum()), all(np.array_equal(getattr(serial, field),
+    ...                                              getattr(parallel, field))
+    ...                               for field in ['counts', 'positives', 'negatives'])
+    (30, True)
+    >>> np.allclose(serial.sums, parallel.sums) and np.allclose(serial.sum_squares,
+    ...                                                          parallel.sum_squares)
+    True
+
+    Preconditions:
+      - workers >= 1
+      - not is_compressed(filename) or (start == 0 and end is None)
+    """
+    if workers == 1 or is_compressed(filename):
+        return load_region_totals(filename, start, end, store)
+
+    ranges = split_file(filename, workers, start, end)
+    totals = RegionTotals()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=init_worker) as executor:
+        futures = [executor.submit(_load_region_totals_worker, filename, start, end,
+                                   store is not None)
+                   for start, end in ranges]
+        for future in futures:
+            chunk_totals, hits, misses, records, text_scores = future.result()
+            totals.merge(chunk_totals)
+            tracing.tracer.merge(records)
+            default_text_cache().merge(text_scores)
+            if store is not None:
+                store.record(hits, misses)
+    return totals
 
 
 def load_tweets(filename: str) -> list:
     """Loads a list of tweets with valid user location from a json file
     """
-    json_tweets = []
     tweets = []
 
-    with open(filename) as f:
-        for json_tweet in f:
-            json_tweet = json.loads(json_tweet)
-            if json_tweet['user']['location'] != "":
-                json_tweets.append(json_tweet)
+    for line in iter_lines(filename):
+        fields = parse_fields(line)
+        if fields is not None:
+            tweets.append(Tweet(fields['text'], fields['location']))
 
-    for json_tweet in json_tweets:
-        tweets.append(Tweet(json_tweet['text'], json_tweet['user']['location']))
+    # Score the tweets in batches, each distinct text once
+    for i in range(0, len(tweets), SCORING_BATCH_SIZE):
+        batch = tweets[i:i + SCORING_BATCH_SIZE]
+        scores = score_tweet_texts([tweet.get_text() for tweet in batch])
+        for tweet, score in zip(batch, scores):
+            tweet.set_score(float(score))
 
     return tweets
 
 
 def create_dataframe(tweets: list) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Creates a pandas dataframe from a list of tweets with columns: location, sentiment score
-    """
-    canada_scores = {}
-    us_scores = {}
-    for tweet in tweets:
-        location = tweet.get_location()
-        if tweet.get_country() == 'Canada':
-            if location not in canada_scores:
-                canada_scores[location] = []
-            canada_scores[location].append(tweet.get_score())
-        else:
-            if location not in us_scores:
-                us_scores[location] = []
-            us_scores[location].append(tweet.get_score())
-
-    for location in canada_scores:
-        canada_scores[location] = sum(canada_scores[location]) / len(canada_scores[location])
-    for location in us_scores:
-        us_scores[location] = sum(us_scores[location]) / len(us_scores[location])
+    """Creates the canadian and american dataframes from a list of located tweets, with
+    columns: location, value (the average sentiment score), count, std, positive, negative
+    """
+    totals = RegionTotals()
+    totals.add(np.array([region_codes[(tweet.get_country(), tweet.get_location())]
+                         for tweet in tweets], dtype=np.int16),
+               np.array([tweet.get_score() for tweet in tweets], dtype=np.float32))
+    return create_dataframe_from_totals(totals)
 
-    canada_dataframe = {'location': [], 'value': []}
-    us_dataframe = {'location': [], 'value': []}
-    for location in canada_scores:
-        canada_dataframe['location'].append(location.title())
-        canada_dataframe['value'].append(canada_scores[location])
-    for location in us_scores:
-        us_dataframe['location'].append(location.title())
-        us_dataframe['value'].append(us_scores[location])
 
-    return pd.DataFrame.from_dict(canada_dataframe), pd.DataFrame.from_dict(us_dataframe)
+def create_dataframe_from_totals(totals: RegionTotals) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Creates the canadian and american dataframes of the given region totals, with columns:
+    location, value (the average sentiment score), count, std, positive, negative
+    """
+    with tracing.span('tweets.dataframe'):
+        return totals.to_dataframes()
 
 
 if __name__ == '__main__':
@@ -166,7 +651,11 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['nltk', 'nltk.sentiment', 'country_provinces', 'statistics'],
+        'extra-imports': ['nltk', 'nltk.sentiment', 'country_provinces', 'gazetteer',
+                          'score_store', 'numpy', 'time', 'functools', 'os',
+                          'concurrent.futures', 'bz2', 'gzip', 'io',
+                          'typing', 'tracing', 'region_totals',
+                          'day_state', 'shard', 'text_cache', 'tweet_json'],
         'allowed-io': ['open'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200', 'R0201']
@@ -0,0 +1,196 @@
+"""Coveet: Twitter COVID Sentiment Analyser
+
+Reading the few fields the pipeline uses out of a line of hydrated tweet json. Lines whose user
+has no location are rejected from the raw bytes, before any decoding. The rest are decoded with
+orjson if it is installed. Otherwise, since a hydrated tweet is mostly entities, the user's
+profile and the retweeted or quoted tweet, none of which the pipeline reads, the fields are
+searched for in the raw line and only their values are decoded, which is about twice as fast
+as decoding the whole line with the json module.
+
+Copyright and Usage Information
+===============================
+This file is Copyright (c) 2021 Eric Xue and Jeremy Xie.
+"""
+import json
+import re
+from json.decoder import scanstring
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The json backend that decodes whole lines
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# The first "location" key of a line and the start of its value, which in the key order of
+# Twitter's API is the location of the tweet's own user
+_LOCATION_KEY = re.compile(rb'"location":\s*')
+
+# The rest of a key up to its value
+_VALUE_START = re.compile(r'\s*:\s*')
+
+# An integer value
+_INTEGER = re.compile(r'-?\d+')
+
+
+def loads(line: bytes) -> dict:
+    """Returns the decoded json of a line, decoded with the fastest installed backend
+
+    >>> loads(b'{"id_str": "1", "user": {"location": "Ohio"}}')['user']
+    {'location': 'Ohio'}
+    """
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def may_have_location(line: bytes) -> bool:
+    """Returns whether the user of the tweet on a line of json may have a non-empty location
+
+    This only looks at the raw line, so a line it rejects is never decoded. It assumes the key
+    order of Twitter's API, in which the tweet's own user comes before any retweeted or quoted
+    tweet and its user.
+
+    >>> may_have_location(b'{"user": {"location": ""}, "retweeted_status": '
+    ...                   b'{"user": {"location": "Ohio"}}}')
+    False
+    >>> may_have_location(b'{"user": {"location": "Ohio"}}')
+    True
+    """
+    match = _LOCATION_KEY.search(line)
+    # A backslash before the key means it is inside a string, where anything may follow
+    return match is not None and (line[match.end():match.end() + 2] not in (b'""', b'nu')
+                                  or line[match.start() - 1:match.start()] == b'\\')
+
+
+def parse_fields(line: bytes) -> Optional[dict]:
+    """Returns the id_str, text, created_at, user_id and location of the tweet on a line of
+    json, or None if its user has no location
+
+    The text is the full_text of tweets hydrated in extended mode. Without orjson, each field
+    is the first occurrence of its key, which in the key order of Twitter's API belongs to the
+    tweet itself rather than to its entities, user or a retweeted or quoted tweet. A full_text
+    only counts before the first nested object. A line where that may not hold is decoded
+    whole instead.
+
+    >>> fields = parse_fields(b'{"created_at": "Sat Aug 01 12:00:00 +0000 2020", '
+    ...                       b'"id_str": "7", "full_text": "Stay \\\\"safe\\\\" \\\\u2764", '
+    ...                       b'"entities": {"hashtags": [{"text": "x"}]}, '
+    ...                       b'"user": {"id": 3, "location": "Toronto"}}')
+    >>> fields['text'], fields['user_id'], fields['location']
+    ('Stay "safe" ❤', 3, 'Toronto')
+    >>> parse_fields(b'{"id_str": "8", "text": "hi", "user": {"id": 4, "location": null}}')
+    """
+    if not may_have_location(line):
+        return None
+    elif orjson is not None:
+        return fields_of(orjson.loads(line))
+    return search_fields(line)
+
+
+def search_fields(line: bytes) -> Optional[dict]:
+    """Returns what parse_fields does, decoding only the values of the fields it reads unless
+    the line cannot be searched safely
+
+    >>> search_fields(b'{"created_at": "now", "id_str": "8", "text": "hi", '
+    ...               b'"user": {"id": 4, "location": "Maine"}}')
+    {'id_str': '8', 'text': 'hi', 'created_at': 'now', 'user_id': 4, 'location': 'Maine'}
+
+    Only a full_text of the tweet itself is read, not one of an extended or retweeted tweet:
+
+    >>> line = (b'{"created_at": "now", "id_str": "9", "text": "short truncated", '
+    ...         b'"user": {"id": 5, "location": "Utah"}, '
+    ...         b'"extended_tweet": {"full_text": "the much longer full text"}}')
+    >>> search_fields(line)['text']
+    'short truncated'
+    >>> search_fields(line) == fields_of(loads(line))
+    True
+    """
+    text = line.decode('utf-8')
+    # The tweet's own full_text comes before its first nested object, its entities or user
+    full_text = text.find('"full_text"')
+    nested = text.find('{', 1)
+    try:
+        user = _value_start(text, 'user')
+        fields = {
+            'id_str': _string_value(text, 'id_str'),
+            'text': _string_value(text, 'full_text')
+            if full_text != -1 and (nested == -1 or full_text < nested)
+            else _string_value(text, 'text'),
+            'created_at': _string_value(text, 'created_at'),
+            'user_id': _integer_value(text, 'id', user),
+            'location': _string_value(text, 'location', user)
+        }
+    except ValueError:
+        return fields_of(loads(line))
+    return fields if fields['location'] else None
+
+
+def fields_of(json_tweet: dict) -> Optional[dict]:
+    """Returns the fields parse_fields reads of a decoded tweet, or None if its user has no
+    location"""
+    user = json_tweet['user']
+    if not user.get('location'):
+        return None
+    return {'id_str': json_tweet['id_str'],
+            'text': json_tweet['full_text'] if 'full_text' in json_tweet else json_tweet['text'],
+            'created_at': json_tweet['created_at'], 'user_id': user['id'],
+            'location': user['location']}
+
+
+def _value_start(text: str, key: str, start: int = 0) -> int:
+    """Returns the index of the value of the first occurrence of a key at or after start
+
+    Raises ValueError if there is no such key, or if its first occurrence may be inside a
+    string or is not followed by a value.
+    """
+    quoted = '"' + key + '"'
+    i = text.find(quoted, start)
+    if i == -1 or text[i - 1] == '\\':
+        raise ValueError(f'no {key} key')
+    match = _VALUE_START.match(text, i + len(quoted))
+    if match is None:
+        raise ValueError(f'no value of {key}')
+    return match.end()
+
+
+def _string_value(text: str, key: str, start: int = 0) -> Optional[str]:
+    """Returns the string or null value of the first occurrence of a key at or after start, or
+    raises ValueError if it has neither"""
+    i = _value_start(text, key, start)
+    if text.startswith('null', i):
+        return None
+    elif text[i:i + 1] != '"':
+        raise ValueError(f'{key} is not a string')
+    return scanstring(text, i + 1)[0]
+
+
+def _integer_value(text: str, key: str, start: int = 0) -> int:
+    """Returns the integer value of the first occurrence of a key at or after start, or raises
+    ValueError if it has none"""
+    match = _INTEGER.match(text, _value_start(text, key, start))
+    if match is None:
+        raise ValueError(f'{key} is not an integer')
+    return int(match.group())
+
+
+if __name__ == '__main__':
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['json', 're', 'json.decoder', 'typing', 'orjson'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'R0201']
+    })